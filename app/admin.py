@@ -0,0 +1,58 @@
+# app/admin.py
+
+from typing import List
+
+from fastapi import APIRouter, Depends, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud_async, database, profiling, schemas
+from usage_buffer import usage_buffer
+from auth import require_role
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_role(schemas.UserRole.portal_admin))],
+)
+
+# Состояние пулов соединений текущего процесса: помогает подобрать
+# pool_size/max_overflow и max_connections в Postgres
+@router.get("/db/pool")
+async def db_pool_status():
+    pools = {"async": database.pool_status(database.async_engine)}
+    if database.sync_engine_created():
+        pools["sync"] = database.pool_status(database.engine)
+    return pools
+
+# Профиль SQL по маршрутам текущего процесса: число запросов, время в БД,
+# последние медленные запросы и подозрения на N+1 (profiling.py)
+@router.get("/db/profile")
+async def db_profile():
+    return profiling.stats.as_dict()
+
+@router.delete("/db/profile", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_db_profile():
+    profiling.stats.reset()
+
+# Буфер отложенной записи usage: глубина, задержка сброса, потери
+@router.get("/usage-buffer")
+async def usage_buffer_status():
+    return usage_buffer.stats()
+
+# Полный пересчёт суточных итогов usage из сырой таблицы
+@router.post("/usage-rollups/rebuild", status_code=status.HTTP_204_NO_CONTENT)
+async def rebuild_usage_rollups(db: AsyncSession = Depends(database.get_async_db)):
+    await crud_async.rebuild_usage_rollups(db)
+
+# Полный пересчёт индекса прав доступа из user_services
+@router.post("/entitlements/rebuild", status_code=status.HTTP_204_NO_CONTENT)
+async def rebuild_entitlements(db: AsyncSession = Depends(database.get_async_db)):
+    await crud_async.rebuild_entitlements(db)
+
+# Последние прогоны расчёта счетов (billing.py)
+@router.get("/billing/runs", response_model=List[schemas.BillingRunRead])
+async def billing_runs(
+    limit: int = Query(20, ge=1, le=200),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    return await crud_async.get_billing_runs(db, limit)
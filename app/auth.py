@@ -3,12 +3,16 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from dotenv import load_dotenv
+import hashlib
 import os
+import time
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
-import crud, schemas, utils, models, database
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+import crud_async, schemas, models, database, hashing, metrics, sessions, config
+from cache import token_cache
 
 
 load_dotenv()
@@ -16,7 +20,7 @@ load_dotenv()
 # Конфигурация JWT
 SECRET_KEY = os.getenv('SECRET_KEY')  # Замените на надёжный ключ
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = config.ACCESS_TOKEN_EXPIRE_MINUTES
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
@@ -26,55 +30,193 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": sessions.new_jti()})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def _session_unavailable() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Session store unavailable")
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def _issue_tokens(user: models.User, sid: str, refresh_jti: str) -> dict:
+    # Access-токен несёт всё, что нужно для проверки прав, — запрос к БД
+    # не требуется; после изменения пользователя его сессии отзываются
+    access_token = create_access_token({
+        "sub": user.username,
+        "uid": user.id,
+        "role": user.role.value,
+        "cid": user.client_id,
+        "email": user.email,
+        "sid": sid,
+        "type": "access",
+    })
+    refresh_token = jwt.encode({
+        "sub": user.username,
+        "uid": user.id,
+        "sid": sid,
+        "jti": refresh_jti,
+        "type": "refresh",
+        "exp": datetime.utcnow() + timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS),
+    }, SECRET_KEY, algorithm=ALGORITHM)
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+
 @router.post("/register", response_model=schemas.UserRead, status_code=status.HTTP_201_CREATED)
-def register(user_in: schemas.UserCreate, db: Session = Depends(database.get_db)):
+async def register(user_in: schemas.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
     # Проверяем, что username уникален
-    if crud.get_user_by_username(db, user_in.username):
+    if await crud_async.get_user_by_username(db, user_in.username):
         raise HTTPException(status_code=400, detail="Username already registered")
-    # Хэшируем пароль и создаём пользователя
-    return crud.create_user(db, user_in)
+    # Хэшируем пароль в пуле процессов и создаём пользователя
+    hashed_password = await hashing.hash_password(user_in.password)
+    return await crud_async.create_user(db, user_in, hashed_password)
 
 
 @router.post("/login", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = crud.get_user_by_username(db, form_data.username)
-    if not user or not utils.verify_password(form_data.password, user.password_hash):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_async_db)):
+    start = time.perf_counter()
+    user = await crud_async.get_user_by_username(db, form_data.username)
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await hashing.verify_password(form_data.password, user.password_hash)
+    if not valid:
+        metrics.LOGIN_DURATION.labels("failure").observe(time.perf_counter() - start)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token({"sub": user.username, "role": user.role.value})
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Хэш с устаревшей стоимостью bcrypt перехэширован при проверке — сохраняем
+    if new_hash:
+        await crud_async.update_password_hash(db, user, new_hash)
+    try:
+        sid, refresh_jti = await sessions.create(user.id, user.client_id)
+    except RedisError:
+        raise _session_unavailable()
+    metrics.LOGIN_DURATION.labels("success").observe(time.perf_counter() - start)
+    return _issue_tokens(user, sid, refresh_jti)
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)) -> models.User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh(body: schemas.RefreshRequest, db: AsyncSession = Depends(database.get_async_db)):
+    # Роль и клиент перечитываются из БД: новая пара токенов отражает
+    # изменения, сделанные в обход API
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
+        payload = jwt.decode(body.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
-        raise credentials_exception
-    user = crud.get_user_by_username(db, username)
+        raise _credentials_exception()
+    if payload.get("type") != "refresh" or not payload.get("sid") or not payload.get("jti"):
+        raise _credentials_exception()
+    try:
+        refresh_jti = await sessions.rotate(payload["sid"], payload["jti"])
+    except RedisError:
+        raise _session_unavailable()
+    if refresh_jti is None:
+        raise _credentials_exception()
+    user = await crud_async.get_user(db, payload.get("uid"))
     if user is None:
-        raise credentials_exception
-    return user
+        await sessions.revoke([payload["sid"]])
+        raise _credentials_exception()
+    return _issue_tokens(user, payload["sid"], refresh_jti)
+
+
+def _token_principal(token: str) -> Optional[tuple]:
+    # Проверенные токены кэшируются по дайджесту до истечения exp
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    cached = token_cache.get(digest)
+    if cached is not None:
+        return cached
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != "access" or payload.get("sub") is None or not payload.get("sid"):
+        return None
+    try:
+        role = schemas.UserRole(payload.get("role"))
+    except ValueError:
+        return None
+    # Отсоединённая копия без сессии: безопасно переиспользуется между запросами
+    user = models.User(
+        id=payload.get("uid"),
+        username=payload["sub"],
+        email=payload.get("email"),
+        role=role,
+        client_id=payload.get("cid"),
+    )
+    cached = (payload, user)
+    exp = payload.get("exp")
+    if exp is not None:
+        token_cache.set(digest, cached, ttl=exp - time.time())
+    return cached
+
+
+async def _authenticate(token: str = Depends(oauth2_scheme)) -> tuple:
+    principal = _token_principal(token)
+    if principal is None:
+        raise _credentials_exception()
+    try:
+        revoked = await sessions.is_revoked(principal[0]["sid"])
+    except RedisError:
+        raise _session_unavailable()
+    if revoked:
+        raise _credentials_exception()
+    return principal
+
+
+async def get_token_claims(principal: tuple = Depends(_authenticate)) -> dict:
+    return principal[0]
+
+
+async def get_current_user(principal: tuple = Depends(_authenticate)) -> models.User:
+    # Без обращения к БД: пользователь восстанавливается из проверенного токена
+    return principal[1]
 
 
 def require_role(role: schemas.UserRole):
-    def role_checker(current_user: models.User = Depends(get_current_user)):
+    async def role_checker(current_user: models.User = Depends(get_current_user)):
         # сравниваем как строки!
         if str(current_user.role) != str(role):
             raise HTTPException(status_code=403, detail="Insufficient permissions")
         return current_user
     return role_checker
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(claims: dict = Depends(get_token_claims)):
+    try:
+        await sessions.revoke([claims["sid"]])
+    except RedisError:
+        raise _session_unavailable()
+
+
+# Принудительный выход из всех сессий пользователя: portal_admin
+@router.delete("/sessions/user/{user_id}", response_model=schemas.SessionsRevoked)
+async def revoke_user_sessions(
+    user_id: int,
+    current_user: models.User = Depends(require_role(schemas.UserRole.portal_admin)),
+):
+    try:
+        return {"revoked": await sessions.revoke_user(user_id)}
+    except RedisError:
+        raise _session_unavailable()
+
+
+# Выход всех пользователей клиента: portal_admin — любого, client_admin — своего
+@router.delete("/sessions/client/{client_id}", response_model=schemas.SessionsRevoked)
+async def revoke_client_sessions(client_id: int, current_user: models.User = Depends(get_current_user)):
+    if current_user.role != schemas.UserRole.portal_admin and not (
+        current_user.role == schemas.UserRole.client_admin and current_user.client_id == client_id
+    ):
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    try:
+        return {"revoked": await sessions.revoke_client(client_id)}
+    except RedisError:
+        raise _session_unavailable()
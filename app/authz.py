@@ -0,0 +1,22 @@
+# app/authz.py
+
+from fastapi import APIRouter, Depends
+
+import entitlements, schemas
+from auth import require_role
+
+router = APIRouter(
+    prefix="/authz",
+    tags=["authz"],
+)
+
+@router.get(
+    "/check",
+    response_model=schemas.AuthzDecision,
+    dependencies=[Depends(require_role(schemas.UserRole.portal_admin))]
+)
+async def check_access(user_id: int, service_id: int):
+    # Вызывается шлюзом на каждый проксируемый запрос: ответ из индекса
+    # в памяти, к БД обращаемся только при первом запросе пользователя
+    allowed, reason = await entitlements.check(user_id, service_id)
+    return schemas.AuthzDecision(allowed=allowed, reason=reason)
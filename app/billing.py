@@ -0,0 +1,357 @@
+# app/billing.py
+#
+# Расчёт счетов клиентов (invoices) по usage и тарифам. Счёт — календарный
+# месяц; в нём абонентская плата тарифа, пропорциональная длине месяца
+# (price * дней в месяце / period_days), и строки по подключениям сервисов:
+# количество единиц usage_amount за период, умноженное на цену единицы
+# tariffs.limits["unit_price"] (нет — потребление не тарифицируется).
+#
+# Прогон инкрементальный. Каждый прогон обрабатывает usage.id в диапазоне
+# (to_usage_id прошлого успешного прогона, max(usage.id) на старте] и
+# прибавляет его к строкам счетов. Для каждого клиента в billing_checkpoints
+# хранится последний учтённый usage.id; он обновляется в одной транзакции со
+# строками, поэтому повтор после сбоя ничего не считает дважды. Клиенты
+# делятся на пачки по BILLING_CHUNK_SIZE, пачки считаются в пуле из
+# BILLING_JOBS процессов. Суммы черновиков пересчитываются в конце прогона
+# (тариф клиента мог измениться).
+#
+# Событие за месяц, счёт которого уже закрыт (finalize), попадает в счёт
+# текущего месяца.
+#
+#   python billing.py run [--jobs 8] [--chunk 200]
+#   python billing.py finalize --period 2025-06
+#   python billing.py status
+
+import argparse
+import datetime
+import logging
+import time
+from contextlib import contextmanager
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+import config, database, partitions
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_lock: прогоны и закрытие периода не пересекаются
+_LOCK_ID = 7_346_002
+
+# Короткая SHARE-блокировка дожидается незавершённых вставок в usage, так что
+# все строки с id не больше max(id) уже видны и новых таких не появится
+_LOCK_USAGE_SQL = text("LOCK TABLE usage IN SHARE MODE")
+_WATERMARK_SQL = text("SELECT coalesce(max(id), 0) FROM usage")
+
+_LAST_DONE_SQL = text("SELECT coalesce(max(to_usage_id), 0) FROM billing_runs WHERE status = 'done'")
+
+_START_RUN_SQL = text("""
+INSERT INTO billing_runs (started_at, status, from_usage_id, to_usage_id, clients, usage_rows)
+VALUES (:now, 'running', :from_id, :to_id, 0, 0)
+RETURNING id
+""")
+
+_FINISH_RUN_SQL = text("""
+UPDATE billing_runs
+SET finished_at = :now, status = :status, clients = :clients, usage_rows = :usage_rows, error = :error
+WHERE id = :id
+""")
+
+_ALL_CLIENTS_SQL = text(
+    "SELECT DISTINCT client_id FROM client_services WHERE client_id IS NOT NULL ORDER BY client_id"
+)
+
+_DELTA_CLIENTS_SQL = text("""
+SELECT DISTINCT cs.client_id
+FROM usage u JOIN client_services cs ON cs.id = u.client_service_id
+WHERE u.id > :from_id AND u.id <= :to_id
+ORDER BY cs.client_id
+""")
+
+_INVOICE_COLUMNS = (
+    "client_id, period_start, period_end, status, unit_price, subscription_amount, "
+    "usage_units, usage_amount, total_amount, created_at, updated_at"
+)
+
+# Черновик текущего месяца есть у каждого клиента с тарифом, даже без потребления
+_OPEN_PERIOD_SQL = text(f"""
+INSERT INTO invoices ({_INVOICE_COLUMNS})
+SELECT id, :start, :end, 'draft', 0, 0, 0, 0, 0, :now, :now FROM clients WHERE tariff IS NOT NULL
+ON CONFLICT (client_id, period_start) DO NOTHING
+""")
+
+_INIT_CHECKPOINTS_SQL = text("""
+INSERT INTO billing_checkpoints (client_id, last_usage_id, updated_at)
+SELECT id, 0, :now FROM clients WHERE id = ANY(:clients)
+ON CONFLICT (client_id) DO NOTHING
+""")
+
+_LOCK_CHECKPOINTS_SQL = text(
+    "SELECT client_id FROM billing_checkpoints WHERE client_id = ANY(:clients) ORDER BY client_id FOR UPDATE"
+)
+
+_CLIENT_SERVICES_SQL = text("SELECT id FROM client_services WHERE client_id = ANY(:clients)")
+
+# Потребление пачки клиентов, ещё не учтённое в их счетах. Фильтр по
+# usage.client_service_id (а не по cs.client_id) даёт планировщику индекс
+# ix_usage_client_service_date_id: пачка читает только свои строки, а не
+# всю таблицу
+_DELTA_SQL = text("""
+SELECT cs.client_id, u.client_service_id, cs.service_id,
+       CAST(date_trunc('month', u.usage_date) AS date) AS period,
+       sum(coalesce(u.usage_amount, 0)) AS quantity, sum(u.events) AS events, count(*) AS row_count
+FROM usage u
+JOIN client_services cs ON cs.id = u.client_service_id
+JOIN billing_checkpoints cp ON cp.client_id = cs.client_id
+WHERE u.client_service_id = ANY(:client_services)
+  AND u.id > :from_id AND u.id <= :to_id AND u.id > cp.last_usage_id
+GROUP BY cs.client_id, u.client_service_id, cs.service_id, period
+""")
+
+_FINAL_PERIODS_SQL = text(
+    "SELECT client_id, period_start FROM invoices "
+    "WHERE client_id = ANY(:clients) AND period_start = ANY(:periods) AND status = 'final'"
+)
+
+_ENSURE_INVOICES_SQL = text(f"""
+INSERT INTO invoices ({_INVOICE_COLUMNS})
+SELECT t.client_id, t.period_start, CAST(t.period_start + interval '1 month' AS date),
+       'draft', 0, 0, 0, 0, 0, :now, :now
+FROM unnest(CAST(:clients AS integer[]), CAST(:periods AS date[])) AS t(client_id, period_start)
+ON CONFLICT (client_id, period_start) DO NOTHING
+""")
+
+_INVOICE_IDS_SQL = text("""
+SELECT i.id, i.client_id, i.period_start
+FROM invoices i
+JOIN unnest(CAST(:clients AS integer[]), CAST(:periods AS date[])) AS t(client_id, period_start)
+  ON t.client_id = i.client_id AND t.period_start = i.period_start
+""")
+
+_ADD_LINES_SQL = text("""
+INSERT INTO invoice_lines (invoice_id, client_service_id, service_id, quantity, events, amount)
+SELECT t.*, 0
+FROM unnest(CAST(:invoices AS integer[]), CAST(:client_services AS integer[]), CAST(:services AS integer[]),
+            CAST(:quantities AS bigint[]), CAST(:events AS integer[]))
+     AS t(invoice_id, client_service_id, service_id, quantity, events)
+ON CONFLICT (invoice_id, client_service_id) DO UPDATE
+SET quantity = invoice_lines.quantity + excluded.quantity, events = invoice_lines.events + excluded.events
+""")
+
+_ADVANCE_CHECKPOINTS_SQL = text("""
+UPDATE billing_checkpoints SET last_usage_id = :to_id, updated_at = :now
+WHERE client_id = ANY(:clients) AND last_usage_id < :to_id
+""")
+
+# Пересчёт черновиков: тариф клиента, суммы строк, итоги счёта
+_REPRICE_STATEMENTS = (
+    text("""
+    UPDATE invoices i
+    SET tariff_id = t.id, tariff_name = t.name,
+        unit_price = coalesce(CAST(t.limits ->> 'unit_price' AS numeric), 0),
+        subscription_amount = coalesce(
+            round(t.price * (i.period_end - i.period_start) / nullif(t.period_days, 0), 2), 0)
+    FROM clients c LEFT JOIN tariffs t ON t.name = c.tariff
+    WHERE c.id = i.client_id AND i.status = 'draft'
+    """),
+    text("""
+    UPDATE invoice_lines l SET amount = round(l.quantity * i.unit_price, 2)
+    FROM invoices i
+    WHERE i.id = l.invoice_id AND i.status = 'draft' AND l.amount <> round(l.quantity * i.unit_price, 2)
+    """),
+    text("""
+    UPDATE invoices i
+    SET usage_units = coalesce(s.units, 0), usage_amount = coalesce(s.amount, 0),
+        total_amount = i.subscription_amount + coalesce(s.amount, 0), updated_at = :now
+    FROM invoices d
+    LEFT JOIN (SELECT invoice_id, sum(quantity) AS units, sum(amount) AS amount
+               FROM invoice_lines GROUP BY invoice_id) s ON s.invoice_id = d.id
+    WHERE d.id = i.id AND i.status = 'draft'
+    """),
+)
+
+_FINALIZE_SQL = text("""
+UPDATE invoices SET status = 'final', finalized_at = :now, updated_at = :now
+WHERE period_start = :period AND status = 'draft'
+""")
+
+
+def current_period() -> datetime.date:
+    return partitions.month_start(datetime.datetime.utcnow().date())
+
+
+@contextmanager
+def _locked(engine):
+    with engine.connect() as conn:
+        if not conn.scalar(text("SELECT pg_try_advisory_lock(:id)"), {"id": _LOCK_ID}):
+            raise RuntimeError("billing run is already in progress")
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _LOCK_ID})
+            conn.commit()
+
+
+def _init_worker() -> None:
+    database.engine.dispose(close=False)  # соединения родителя после fork не используются
+
+
+def _bill_clients(task: Tuple[int, int, List[int], datetime.date]) -> Tuple[int, int]:
+    """Учитывает в счетах новое потребление пачки клиентов; возвращает (клиентов, строк usage)."""
+    from_id, to_id, client_ids, current = task
+    now = datetime.datetime.utcnow()
+    with database.engine.begin() as conn:
+        conn.execute(_INIT_CHECKPOINTS_SQL, {"clients": client_ids, "now": now})
+        conn.execute(_LOCK_CHECKPOINTS_SQL, {"clients": client_ids})
+        client_services = list(conn.scalars(_CLIENT_SERVICES_SQL, {"clients": client_ids}))
+        rows = []
+        if client_services:
+            rows = conn.execute(_DELTA_SQL, {"client_services": client_services, "from_id": from_id,
+                                             "to_id": to_id}).all()
+
+        periods = sorted({row.period for row in rows})
+        final = set()
+        if periods:
+            final = {tuple(row) for row in conn.execute(_FINAL_PERIODS_SQL, {"clients": client_ids, "periods": periods})}
+        lines: Dict[Tuple[int, datetime.date, int], List[int]] = {}
+        usage_rows = 0
+        for row in rows:
+            period = current if (row.client_id, row.period) in final else row.period
+            line = lines.setdefault((row.client_id, period, row.client_service_id), [row.service_id, 0, 0])
+            line[1] += int(row.quantity)
+            line[2] += row.events
+            usage_rows += row.row_count
+
+        if lines:
+            invoice_keys = sorted({(client_id, period) for client_id, period, _ in lines})
+            params = {"clients": [k[0] for k in invoice_keys], "periods": [k[1] for k in invoice_keys], "now": now}
+            conn.execute(_ENSURE_INVOICES_SQL, params)
+            invoice_ids = {
+                (row.client_id, row.period_start): row.id for row in conn.execute(_INVOICE_IDS_SQL, params)
+            }
+            items = sorted(lines.items())
+            conn.execute(_ADD_LINES_SQL, {
+                "invoices": [invoice_ids[(client_id, period)] for (client_id, period, _), _ in items],
+                "client_services": [client_service_id for (_, _, client_service_id), _ in items],
+                "services": [line[0] for _, line in items],
+                "quantities": [line[1] for _, line in items],
+                "events": [line[2] for _, line in items],
+            })
+        conn.execute(_ADVANCE_CHECKPOINTS_SQL, {"clients": client_ids, "to_id": to_id, "now": now})
+    return len(client_ids), usage_rows
+
+
+def reprice(conn) -> None:
+    now = datetime.datetime.utcnow()
+    for statement in _REPRICE_STATEMENTS:
+        conn.execute(statement, {"now": now})
+
+
+def _run(engine, jobs: int, chunk: int) -> dict:
+    with engine.begin() as conn:
+        from_id = conn.scalar(_LAST_DONE_SQL)
+    with engine.begin() as conn:
+        conn.execute(_LOCK_USAGE_SQL)
+        to_id = conn.scalar(_WATERMARK_SQL)
+    now = datetime.datetime.utcnow()
+    with engine.begin() as conn:
+        run_id = conn.scalar(_START_RUN_SQL, {"now": now, "from_id": from_id, "to_id": to_id})
+
+    clients = usage_rows = 0
+    try:
+        current = current_period()
+        with engine.begin() as conn:
+            conn.execute(_OPEN_PERIOD_SQL, {"start": current, "end": partitions.next_month(current), "now": now})
+            if to_id <= from_id:
+                client_ids = []
+            else:
+                # Первый прогон берёт всех клиентов с подключениями, дальше —
+                # только тех, у кого есть новые строки usage
+                client_ids = list(conn.scalars(
+                    _ALL_CLIENTS_SQL if from_id == 0 else _DELTA_CLIENTS_SQL, {"from_id": from_id, "to_id": to_id}
+                ))
+        tasks = [
+            (from_id, to_id, client_ids[i:i + chunk], current) for i in range(0, len(client_ids), chunk)
+        ]
+        if jobs > 1 and len(tasks) > 1:
+            with Pool(min(jobs, len(tasks)), initializer=_init_worker) as pool:
+                results = list(pool.imap_unordered(_bill_clients, tasks))
+        else:
+            results = list(map(_bill_clients, tasks))
+        clients = sum(r[0] for r in results)
+        usage_rows = sum(r[1] for r in results)
+        with engine.begin() as conn:
+            reprice(conn)
+    except Exception as e:
+        with engine.begin() as conn:
+            conn.execute(_FINISH_RUN_SQL, {"now": datetime.datetime.utcnow(), "status": "failed", "id": run_id,
+                                           "clients": clients, "usage_rows": usage_rows, "error": repr(e)})
+        raise
+    with engine.begin() as conn:
+        conn.execute(_FINISH_RUN_SQL, {"now": datetime.datetime.utcnow(), "status": "done", "id": run_id,
+                                       "clients": clients, "usage_rows": usage_rows, "error": None})
+    logger.info("billing run %s: usage ids (%s, %s], %s clients, %s usage rows",
+                run_id, from_id, to_id, clients, usage_rows)
+    return {"run_id": run_id, "from_usage_id": from_id, "to_usage_id": to_id,
+            "clients": clients, "usage_rows": usage_rows}
+
+
+def run(engine, jobs: Optional[int] = None, chunk: Optional[int] = None) -> dict:
+    """Инкрементальный прогон: учитывает usage, пришедшие после прошлого прогона."""
+    with _locked(engine):
+        return _run(engine, jobs or config.BILLING_JOBS, chunk or config.BILLING_CHUNK_SIZE)
+
+
+def finalize(engine, period: datetime.date, jobs: Optional[int] = None) -> int:
+    """Закрывает счета завершившегося месяца; возвращает число закрытых счетов."""
+    period = partitions.month_start(period)
+    if partitions.next_month(period) > datetime.datetime.utcnow().date():
+        raise ValueError(f"period {period:%Y-%m} has not ended yet")
+    with _locked(engine):
+        # Сначала досчитать всё, что пришло к этому моменту (с пересчётом сумм)
+        _run(engine, jobs or config.BILLING_JOBS, config.BILLING_CHUNK_SIZE)
+        with engine.begin() as conn:
+            return conn.execute(_FINALIZE_SQL, {"now": datetime.datetime.utcnow(), "period": period}).rowcount
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Расчёт счетов")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--jobs", type=int, default=config.BILLING_JOBS)
+    run_parser.add_argument("--chunk", type=int, default=config.BILLING_CHUNK_SIZE, help="клиентов в пачке")
+    finalize_parser = commands.add_parser("finalize")
+    finalize_parser.add_argument("--period", required=True, help="месяц, YYYY-MM")
+    finalize_parser.add_argument("--jobs", type=int, default=config.BILLING_JOBS)
+    commands.add_parser("status")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        started = time.perf_counter()
+        result = run(database.engine, args.jobs, args.chunk)
+        print(f"run {result['run_id']}: usage ids ({result['from_usage_id']}, {result['to_usage_id']}], "
+              f"{result['clients']} clients, {result['usage_rows']} usage rows "
+              f"in {time.perf_counter() - started:.1f}s")
+    elif args.command == "finalize":
+        try:
+            period = datetime.datetime.strptime(args.period, "%Y-%m").date()
+            closed = finalize(database.engine, period, args.jobs)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print(f"finalized {closed} invoice(s) for {period:%Y-%m}")
+    elif args.command == "status":
+        with database.engine.connect() as conn:
+            runs = conn.execute(text(
+                "SELECT id, started_at, finished_at, status, from_usage_id, to_usage_id, clients, usage_rows "
+                "FROM billing_runs ORDER BY id DESC LIMIT 10"
+            )).all()
+        for r in runs:
+            print(f"{r.id}: {r.status} {r.started_at:%Y-%m-%d %H:%M:%S} usage ids ({r.from_usage_id}, "
+                  f"{r.to_usage_id}], {r.clients} clients, {r.usage_rows} usage rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# app/catalog_cache.py
+#
+# Кэш каталога (сервисы, тарифы) для чтения «сквозь кэш»: память процесса
+# -> Redis -> Postgres. Ключи в Redis содержат номер версии раздела
+# (catalog:<kind>:ver); любое изменение раздела увеличивает версию, так что
+# старые ключи перестают читаться и просто истекают по TTL. Значение,
+# прочитанное из БД до изменения, записывается под старой версией и никому
+# не отдаётся. Об изменении сообщается в канал pub/sub, и каждый процесс
+# uvicorn сбрасывает свой локальный уровень сразу.
+#
+# Если Redis недоступен, чтение идёт напрямую в БД.
+
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+from redis.exceptions import RedisError
+
+import config, redis_client
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SERVICES = "service"
+TARIFFS = "tariff"
+KINDS = (SERVICES, TARIFFS)
+# Разделы без собственного кэша: изменения только рассылаются подписчикам
+# (например, настройкам квот, quota.py)
+CLIENTS = "client"
+CLIENT_SERVICES = "client_service"
+# Индекс прав доступа (entitlements.py); ключ — user_id
+ENTITLEMENTS = "entitlement"
+# Отозванные сессии (sessions.py); ключ — sid
+SESSIONS = "session"
+
+CHANNEL = "catalog:invalidate"
+
+_MISSING = object()
+
+# Локальный уровень: отдельный кэш на каждый раздел каталога
+_local: Dict[str, TTLCache] = {
+    kind: TTLCache(config.CATALOG_LOCAL_SIZE, config.CATALOG_LOCAL_TTL) for kind in KINDS
+}
+
+# Дополнительные обработчики инвалидации по разделам; получают ключ
+# изменённой записи или None, если изменился весь раздел
+_callbacks: Dict[str, List[Callable[[Optional[str]], None]]] = {}
+
+_listener: Optional[asyncio.Task] = None
+
+
+def version_key(scope: str) -> str:
+    # Счётчик версии раздела; etags.py использует те же ключи и для разделов
+    # без кэша ("client:<id>" и т.п.)
+    return f"catalog:{scope}:ver"
+
+
+def _dump(schema: Type[BaseModel], value: Any) -> Any:
+    if value is None:
+        return None
+    return schema.model_validate(value).model_dump(mode="json")
+
+
+async def _read_through(kind: str, key: tuple, schema: Type[BaseModel],
+                        load: Callable[[], Awaitable[Any]], dump: Callable[[Any], Any],
+                        version: Optional[int] = None) -> Any:
+    local = _local[kind]
+    # Версия уже прочитана (etags.validator): локальная запись прошлой
+    # версии не отдаётся, даже если сообщение об инвалидации ещё в пути
+    local_key = key if version is None else (version,) + key
+    value = local.get(local_key, _MISSING)
+    if value is not _MISSING:
+        return value
+    generation = local.generation
+
+    redis = redis_client.get_redis()
+    try:
+        if version is None:
+            version = int(await redis.get(version_key(kind)) or 0)
+        redis_key = f"catalog:{kind}:v{version}:{':'.join(map(str, key))}"
+        cached = await redis.get(redis_key)
+    except RedisError:
+        logger.warning("catalog cache: redis unavailable, reading %s from db", kind, exc_info=True)
+        return dump(await load())
+
+    if cached is not None:
+        value = json.loads(cached)
+    else:
+        value = dump(await load())
+        try:
+            await redis.set(redis_key, json.dumps(value), ex=config.CATALOG_CACHE_TTL)
+        except RedisError:
+            logger.warning("catalog cache: failed to store %s", redis_key, exc_info=True)
+    local.set(local_key, value, generation=generation)
+    return value
+
+
+async def get_item(kind: str, item_id: int, schema: Type[BaseModel],
+                   load: Callable[[], Awaitable[Any]], version: Optional[int] = None) -> Optional[dict]:
+    """Объект каталога по id (None, если не найден)."""
+    return await _read_through(kind, ("item", item_id), schema, load, lambda obj: _dump(schema, obj), version)
+
+
+async def get_page(kind: str, cursor: Optional[str], limit: int, schema: Type[BaseModel],
+                   load: Callable[[], Awaitable[dict]], version: Optional[int] = None) -> dict:
+    """Страница списка каталога в формате pagination.page_of."""
+    def dump(page: dict) -> dict:
+        return {
+            "items": [_dump(schema, item) for item in page["items"]],
+            "next_cursor": page["next_cursor"],
+        }
+    return await _read_through(kind, ("page", cursor or "", limit), schema, load, dump, version)
+
+
+def on_invalidate(kind: str, callback: Callable[[Optional[str]], None]) -> None:
+    """Регистрирует сброс стороннего локального кэша при изменении раздела."""
+    _callbacks.setdefault(kind, []).append(callback)
+
+
+def _drop_local(kind: str, key: Optional[str] = None) -> None:
+    cache = _local.get(kind)
+    if cache is not None:
+        cache.clear()
+    for callback in _callbacks.get(kind, ()):
+        callback(key)
+
+
+async def invalidate(kind: str, key: Optional[Any] = None) -> None:
+    """Вызывается после коммита изменения раздела каталога."""
+    key = None if key is None else str(key)
+    _drop_local(kind, key)
+    redis = redis_client.get_redis()
+    try:
+        if kind in _local:
+            await redis.incr(version_key(kind))
+        # Формат сообщения: "<kind>" или "<kind>:<key>"
+        await redis.publish(CHANNEL, kind if key is None else f"{kind}:{key}")
+    except RedisError:
+        # Остальные процессы увидят изменение не позже CATALOG_LOCAL_TTL
+        logger.warning("catalog cache: failed to publish invalidation of %s", kind, exc_info=True)
+
+
+async def _listen() -> None:
+    delay = 1.0
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(CHANNEL)
+            # Пока подписки не было, сообщения могли быть пропущены
+            for kind in set(KINDS) | set(_callbacks):
+                _drop_local(kind)
+            delay = 1.0
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    kind, _, key = message["data"].decode().partition(":")
+                    _drop_local(kind, key or None)
+        except asyncio.CancelledError:
+            raise
+        except (RedisError, OSError):
+            logger.warning("catalog cache: invalidation listener disconnected, retry in %.0fs", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+        finally:
+            await pubsub.aclose()
+
+
+def start() -> None:
+    global _listener
+    if _listener is None:
+        _listener = asyncio.create_task(_listen())
+
+
+async def stop() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
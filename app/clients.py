@@ -1,12 +1,12 @@
 # app/routers/clients.py
 
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-
-import crud, schemas, database
+import crud_async, etags, schemas, database, models, serialization
 from auth import get_current_user, require_role
+from loader import Loader, get_loader
+from pagination import PageParams
 from models import UserRole, User
 
 router = APIRouter(
@@ -14,72 +14,82 @@ router = APIRouter(
     tags=["clients"],
 )
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post(
     "/",
     response_model=schemas.ClientRead,
     status_code=status.HTTP_201_CREATED,
     dependencies=[Depends(require_role(schemas.UserRole.portal_admin))]
 )
-def create_client(
+async def create_client(
     client_in: schemas.ClientCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     # Проверка на уникальность по имени через crud
-    if crud.get_client_by_name(db, client_in.name):
+    if await crud_async.get_client_by_name(db, client_in.name):
         raise HTTPException(status_code=400, detail="Client with this name already exists")
-    return crud.create_client(db, client_in)
+    return await crud_async.create_client(db, client_in)
 
 @router.get(
     "/",
-    response_model=List[schemas.ClientRead]
+    response_model=schemas.Page[schemas.ClientRead]
 )
-def list_clients(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+async def list_clients(
+    request: Request,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: User = Depends(require_role(schemas.UserRole.portal_admin)),
 ):
-    return crud.get_clients(db, skip=skip, limit=limit)
+    validator = await etags.validator(request, etags.CLIENTS)
+    if validator.fresh:
+        return validator.not_modified()
+    result = await crud_async.get_clients(db, page)
+    return validator.apply(serialization.page_response(schemas.ClientRead, result))
 
 @router.get(
     "/me",
     response_model=schemas.ClientRead
 )
-def read_own_client(
-    db: Session = Depends(get_db),
+async def read_own_client(
+    request: Request,
+    response: Response,
+    loader: Loader = Depends(get_loader),
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.client_id:
         raise HTTPException(status_code=400, detail="User is not bound to any client")
-    client = crud.get_client(db, current_user.client_id)
+    validator = await etags.validator(request, etags.client(current_user.client_id))
+    if validator.fresh:
+        return validator.not_modified()
+    client = await loader.load(models.Client, current_user.client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
+    validator.apply(response)
     return client
 
 @router.get(
     "/{client_id}",
     response_model=schemas.ClientRead
 )
-def read_client(
+async def read_client(
     client_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    loader: Loader = Depends(get_loader),
     current_user: User = Depends(get_current_user)
 ):
-    client = crud.get_client(db, client_id)
-    if not client:
-        raise HTTPException(status_code=404, detail="Client not found")
-
-    # Проверка прав: portal_admin видит всех, client_admin/user — только своего
+    # Проверка прав: portal_admin видит всех, client_admin/user — только своего.
+    # Выполняется до проверки ETag, чтобы 304 не отдавался чужим
     if current_user.role != UserRole.portal_admin:
         if current_user.client_id != client_id:
             raise HTTPException(status_code=403, detail="Insufficient permissions")
+
+    validator = await etags.validator(request, etags.client(client_id))
+    if validator.fresh:
+        return validator.not_modified()
+    client = await loader.load(models.Client, client_id)
+    if not client:
+        raise HTTPException(status_code=404, detail="Client not found")
+    validator.apply(response)
     return client
 
 
@@ -88,31 +98,29 @@ def read_client(
     response_model=schemas.ClientRead,
     dependencies=[Depends(require_role(schemas.UserRole.portal_admin))]
 )
-def update_client(
+async def update_client(
     client_id: int,
     client_in: schemas.ClientCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader)
 ):
-    client = crud.get_client(db, client_id)
+    client = await loader.load(models.Client, client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
-    client.name = client_in.name
-    client.tariff = client_in.tariff
-    db.commit()
-    db.refresh(client)
-    return client
+    return await crud_async.update_client(db, client, client_in)
 
 @router.delete(
     "/{client_id}",
     response_model=schemas.ClientRead,
     dependencies=[Depends(require_role(schemas.UserRole.portal_admin))]
 )
-def delete_client(
+async def delete_client(
     client_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader)
 ):
-    client = crud.get_client(db, client_id)
+    client = await loader.load(models.Client, client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
-    crud.delete_client(db, client_id)
+    await crud_async.delete_client(db, client_id)
     return client
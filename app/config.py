@@ -3,3 +3,110 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Кэш проверенных JWT: запись живёт не дольше exp токена
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# Сессии (sessions.py): срок жизни access-токена (мин) и сессии с её
+# refresh-токеном (дни)
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# Локальный Bloom-фильтр отозванных сессий: ёмкость, доля ложных
+# срабатываний и период полной сверки с Redis (с)
+SESSION_BLOOM_CAPACITY = int(os.getenv("SESSION_BLOOM_CAPACITY", "100000"))
+SESSION_BLOOM_ERROR_RATE = float(os.getenv("SESSION_BLOOM_ERROR_RATE", "0.001"))
+SESSION_REVOCATION_SYNC = float(os.getenv("SESSION_REVOCATION_SYNC", "60"))
+
+# Хэширование паролей (bcrypt) в отдельном пуле процессов
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+# Сколько операций может ждать пул одновременно, прежде чем отвечать 503
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", str(HASH_WORKERS * 4)))
+# Массовое хэширование (импорт): сколько процессов пула занимать и размер пачки
+HASH_BULK_WORKERS = int(os.getenv("HASH_BULK_WORKERS", str(max(1, HASH_WORKERS // 2))))
+HASH_BULK_CHUNK = int(os.getenv("HASH_BULK_CHUNK", "16"))
+
+# Пул соединений с Postgres (на один процесс uvicorn)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# 0 — без ограничения
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+# Пакетная запись usage: начиная с этого размера пакета используется COPY
+USAGE_COPY_THRESHOLD = int(os.getenv("USAGE_COPY_THRESHOLD", "500"))
+# Допустимое время события: не старше USAGE_MAX_AGE_DAYS дней и не дальше
+# USAGE_MAX_FUTURE_SECONDS секунд в будущем (расхождение часов шлюза)
+USAGE_MAX_AGE_DAYS = int(os.getenv("USAGE_MAX_AGE_DAYS", "31"))
+USAGE_MAX_FUTURE_SECONDS = int(os.getenv("USAGE_MAX_FUTURE_SECONDS", "300"))
+
+# Буфер отложенной записи usage (usage_buffer.py)
+USAGE_BUFFER_MAX_BUCKETS = int(os.getenv("USAGE_BUFFER_MAX_BUCKETS", "100000"))
+USAGE_BUFFER_FLUSH_SIZE = int(os.getenv("USAGE_BUFFER_FLUSH_SIZE", "5000"))
+USAGE_BUFFER_FLUSH_INTERVAL = float(os.getenv("USAGE_BUFFER_FLUSH_INTERVAL", "1.0"))
+# Сколько раз повторять запись корзины, которую отвергает БД, прежде чем отбросить
+USAGE_BUFFER_MAX_RETRIES = int(os.getenv("USAGE_BUFFER_MAX_RETRIES", "3"))
+
+# Курсорная пагинация списков
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "100"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+
+# Потоковая выгрузка usage: строк на одну выборку серверного курсора
+USAGE_EXPORT_CHUNK = int(os.getenv("USAGE_EXPORT_CHUNK", "5000"))
+
+# Секции usage: сколько месяцев вперёд создавать заранее
+USAGE_PARTITIONS_AHEAD = int(os.getenv("USAGE_PARTITIONS_AHEAD", "3"))
+
+# Аналитика usage (rollups.py): максимальная длина периода, дней
+USAGE_ANALYTICS_MAX_DAYS = int(os.getenv("USAGE_ANALYTICS_MAX_DAYS", "366"))
+
+# Redis (общий кэш и pub/sub между процессами uvicorn)
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+# Таймаут операций Redis: при недоступности Redis запросы идут в БД
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "0.5"))
+
+# Кэш каталога (сервисы, тарифы): TTL в Redis и в памяти процесса
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "3600"))
+CATALOG_LOCAL_TTL = float(os.getenv("CATALOG_LOCAL_TTL", "30"))
+CATALOG_LOCAL_SIZE = int(os.getenv("CATALOG_LOCAL_SIZE", "1000"))
+
+# Квоты (quota.py): кэш настроек лимитов на client_service
+QUOTA_CONFIG_TTL = float(os.getenv("QUOTA_CONFIG_TTL", "60"))
+QUOTA_CONFIG_SIZE = int(os.getenv("QUOTA_CONFIG_SIZE", "100000"))
+# Пропускать запросы, если Redis недоступен
+QUOTA_FAIL_OPEN = os.getenv("QUOTA_FAIL_OPEN", "true").lower() in ("1", "true", "yes")
+
+# Индекс прав доступа для /authz/check (entitlements.py)
+ENTITLEMENT_CACHE_SIZE = int(os.getenv("ENTITLEMENT_CACHE_SIZE", "100000"))
+ENTITLEMENT_CACHE_TTL = float(os.getenv("ENTITLEMENT_CACHE_TTL", "300"))
+
+# Импорт пользователей: строк в одной пачке (проверка, хэширование, вставка)
+USER_IMPORT_BATCH = int(os.getenv("USER_IMPORT_BATCH", "1000"))
+USER_IMPORT_MAX_ROWS = int(os.getenv("USER_IMPORT_MAX_ROWS", "100000"))
+
+# ETag по счётчикам версий (etags.py): не дольше этого срока (с) ETag
+# остаётся прежним, даже если увеличение счётчика потерялось; 0 — без ограничения
+ETAG_MAX_AGE = int(os.getenv("ETAG_MAX_AGE", "300"))
+
+# Режим отладки: итоги профилирования SQL в заголовках ответа
+DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
+# Профилирование SQL по запросам (profiling.py)
+SQL_PROFILE = os.getenv("SQL_PROFILE", "true").lower() in ("1", "true", "yes")
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+# Столько одинаковых по форме запросов за один HTTP-запрос считается N+1
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+# Сколько последних медленных запросов и N+1 хранить для /admin/db/profile
+SQL_PROFILE_LOG_SIZE = int(os.getenv("SQL_PROFILE_LOG_SIZE", "200"))
+
+# Метрики Prometheus (metrics.py): период опроса пулов потоков и соединений, с
+METRICS_SAMPLE_INTERVAL = float(os.getenv("METRICS_SAMPLE_INTERVAL", "1.0"))
+
+# Проверка версии схемы при старте (migrate.py): strict — не стартовать,
+# если миграции не применены; warn — только предупреждение; off — не проверять
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "strict")
+
+# Расчёт счетов (billing.py): процессов в пуле и клиентов в одной пачке
+BILLING_JOBS = int(os.getenv("BILLING_JOBS", str(os.cpu_count() or 1)))
+BILLING_CHUNK_SIZE = int(os.getenv("BILLING_CHUNK_SIZE", "200"))
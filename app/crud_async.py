@@ -0,0 +1,695 @@
+# app/crud_async.py
+#
+# Асинхронный вариант crud.py поверх AsyncSession (драйвер asyncpg).
+# Хэширование паролей здесь не выполняется: хэш считается заранее в hashing.py.
+
+import datetime
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, exists, select, func, insert, or_
+from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import catalog_cache, config, database, entitlements, etags, models, partitions, rollups, schemas, sessions
+from pagination import PageParams, fetch_page
+from serialization import columns_for
+
+# -------------------------
+# USERS
+# -------------------------
+
+async def get_user(db: AsyncSession, user_id: int) -> Optional[models.User]:
+    # Объект, уже загруженный в сессию (например, loader.Loader), берётся без запроса
+    return await db.get(models.User, user_id)
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[models.User]:
+    return await db.scalar(select(models.User).where(models.User.username == username))
+
+# Списки читают только столбцы схемы ответа (строки Core, без ORM-объектов)
+_USER_COLUMNS = columns_for(models.User, schemas.UserRead)
+
+async def get_users(db: AsyncSession, page: PageParams) -> dict:
+    return await fetch_page(db, select(*_USER_COLUMNS), [models.User.id], page)
+
+async def get_users_by_client(db: AsyncSession, client_id: int, page: PageParams) -> dict:
+    query = select(*_USER_COLUMNS).where(models.User.client_id == client_id)
+    return await fetch_page(db, query, [models.User.id], page)
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate, hashed_password: str) -> models.User:
+    db_user = models.User(
+        username=user.username,
+        email=user.email,
+        password_hash=hashed_password,
+        role=user.role,
+        client_id=user.client_id
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    await etags.bump_users(db_user.client_id)
+    return db_user
+
+async def get_taken_usernames_emails(db: AsyncSession, usernames: List[str], emails: List[str]):
+    # Одна выборка на пачку импорта: какие username и email уже заняты
+    rows = await db.execute(
+        select(models.User.username, models.User.email).where(
+            or_(models.User.username.in_(usernames), models.User.email.in_(emails))
+        )
+    )
+    taken_usernames, taken_emails = set(), set()
+    for username, email in rows:
+        taken_usernames.add(username)
+        if email is not None:
+            taken_emails.add(email)
+    return taken_usernames, taken_emails
+
+async def get_existing_client_ids(db: AsyncSession, client_ids: List[int]) -> set:
+    return set(await db.scalars(select(models.Client.id).where(models.Client.id.in_(client_ids))))
+
+async def insert_users(db: AsyncSession, rows: List[dict]) -> dict:
+    # Многострочная вставка без коммита; строки, занятые параллельной
+    # транзакцией, пропускаются. Возвращает username -> id вставленных
+    result = await db.execute(
+        pg_insert(models.User).values(rows).on_conflict_do_nothing()
+        .returning(models.User.username, models.User.id)
+    )
+    return dict(result.all())
+
+async def update_password_hash(db: AsyncSession, user: models.User, password_hash: str) -> models.User:
+    user.password_hash = password_hash
+    await db.commit()
+    await db.refresh(user)
+    return user
+
+async def update_user_role(db: AsyncSession, user_id: int, new_role: str) -> Optional[models.User]:
+    user = await get_user(db, user_id)
+    if user:
+        user.role = new_role
+        await db.commit()
+        await db.refresh(user)
+        await sessions.invalidate_user(user.id)
+        await etags.bump_users(user.client_id)
+    return user
+
+async def delete_user(db: AsyncSession, user_id: int) -> Optional[models.User]:
+    user = await get_user(db, user_id)
+    if user:
+        await db.delete(user)
+        await db.commit()
+        await sessions.invalidate_user(user.id)
+        await catalog_cache.invalidate(catalog_cache.ENTITLEMENTS, user.id)
+        # Назначения удалены каскадно вместе с пользователем
+        await etags.bump_users(user.client_id)
+        await etags.bump(etags.user_services(user.client_id))
+    return user
+
+# -------------------------
+# CLIENTS
+# -------------------------
+
+async def get_client_by_name(db: AsyncSession, name: str) -> Optional[models.Client]:
+    return await db.scalar(select(models.Client).where(models.Client.name == name))
+
+async def get_client(db: AsyncSession, client_id: int) -> Optional[models.Client]:
+    return await db.get(models.Client, client_id)
+
+async def get_clients(db: AsyncSession, page: PageParams) -> dict:
+    query = select(*columns_for(models.Client, schemas.ClientRead))
+    return await fetch_page(db, query, [models.Client.id], page)
+
+async def create_client(db: AsyncSession, client: schemas.ClientCreate) -> models.Client:
+    db_client = models.Client(
+        name=client.name,
+        tariff=client.tariff
+    )
+    db.add(db_client)
+    await db.commit()
+    await db.refresh(db_client)
+    await etags.bump(etags.CLIENTS)
+    return db_client
+
+async def update_client(db: AsyncSession, client: models.Client, client_in: schemas.ClientCreate) -> models.Client:
+    client.name = client_in.name
+    client.tariff = client_in.tariff
+    await db.commit()
+    await db.refresh(client)
+    await etags.bump(etags.CLIENTS, etags.client(client.id))
+    # Тариф клиента определяет его квоты
+    await catalog_cache.invalidate(catalog_cache.CLIENTS)
+    return client
+
+async def delete_client(db: AsyncSession, client_id: int) -> Optional[models.Client]:
+    client = await get_client(db, client_id)
+    if client:
+        await db.delete(client)
+        await db.commit()
+        await etags.bump(etags.CLIENTS, etags.client(client_id))
+        await catalog_cache.invalidate(catalog_cache.CLIENTS)
+        await sessions.invalidate_client(client_id)
+    return client
+
+# -------------------------
+# SERVICES
+# -------------------------
+
+async def get_service(db: AsyncSession, service_id: int) -> Optional[models.Service]:
+    return await db.get(models.Service, service_id)
+
+async def get_service_by_name(db: AsyncSession, name: str) -> Optional[models.Service]:
+    return await db.scalar(select(models.Service).where(models.Service.name == name))
+
+async def get_services(db: AsyncSession, page: PageParams) -> dict:
+    return await fetch_page(db, select(models.Service), [models.Service.id], page)
+
+async def create_service(db: AsyncSession, service: schemas.ServiceCreate) -> models.Service:
+    db_service = models.Service(
+        name=service.name,
+        description=service.description
+    )
+    db.add(db_service)
+    await db.commit()
+    await db.refresh(db_service)
+    await catalog_cache.invalidate(catalog_cache.SERVICES)
+    return db_service
+
+async def update_service(db: AsyncSession, service: models.Service, service_in: schemas.ServiceCreate) -> models.Service:
+    service.name = service_in.name
+    service.description = service_in.description
+    await db.commit()
+    await db.refresh(service)
+    await catalog_cache.invalidate(catalog_cache.SERVICES)
+    return service
+
+async def delete_service(db: AsyncSession, service_id: int) -> Optional[models.Service]:
+    service = await get_service(db, service_id)
+    if service:
+        await db.delete(service)
+        await db.commit()
+        await catalog_cache.invalidate(catalog_cache.SERVICES)
+    return service
+
+# -------------------------
+# TARIFFS
+# -------------------------
+
+async def get_tariff(db: AsyncSession, tariff_id: int) -> Optional[models.Tariff]:
+    return await db.get(models.Tariff, tariff_id)
+
+async def get_tariff_by_name(db: AsyncSession, name: str) -> Optional[models.Tariff]:
+    return await db.scalar(select(models.Tariff).where(models.Tariff.name == name))
+
+async def get_tariffs(db: AsyncSession, page: PageParams) -> dict:
+    return await fetch_page(db, select(models.Tariff), [models.Tariff.id], page)
+
+async def create_tariff(db: AsyncSession, tariff: schemas.TariffCreate) -> models.Tariff:
+    db_tariff = models.Tariff(
+        name=tariff.name,
+        max_users=tariff.max_users,
+        max_services=tariff.max_services,
+        period_days=tariff.period_days,
+        price=tariff.price,
+        limits=tariff.limits.model_dump(exclude_none=True) if tariff.limits else None
+    )
+    db.add(db_tariff)
+    await db.commit()
+    await db.refresh(db_tariff)
+    await catalog_cache.invalidate(catalog_cache.TARIFFS)
+    return db_tariff
+
+async def update_tariff(db: AsyncSession, tariff: models.Tariff, tariff_in: schemas.TariffCreate) -> models.Tariff:
+    tariff.name = tariff_in.name
+    tariff.max_users = tariff_in.max_users
+    tariff.max_services = tariff_in.max_services
+    tariff.period_days = tariff_in.period_days
+    tariff.price = tariff_in.price
+    tariff.limits = tariff_in.limits.model_dump(exclude_none=True) if tariff_in.limits else None
+    await db.commit()
+    await db.refresh(tariff)
+    await catalog_cache.invalidate(catalog_cache.TARIFFS)
+    return tariff
+
+async def delete_tariff(db: AsyncSession, tariff_id: int) -> Optional[models.Tariff]:
+    tariff = await get_tariff(db, tariff_id)
+    if tariff:
+        await db.delete(tariff)
+        await db.commit()
+        await catalog_cache.invalidate(catalog_cache.TARIFFS)
+    return tariff
+
+# -------------------------
+# CLIENT SERVICES (Подключение сервисов клиентам)
+# -------------------------
+
+async def connect_service_to_client(db: AsyncSession, client_id: int, service_id: int) -> models.ClientService:
+    db_cs = models.ClientService(client_id=client_id, service_id=service_id)
+    db.add(db_cs)
+    await db.commit()
+    await db.refresh(db_cs)
+    await etags.bump(etags.client_services(client_id))
+    return db_cs
+
+async def get_client_service(db: AsyncSession, client_service_id: int) -> Optional[models.ClientService]:
+    return await db.get(models.ClientService, client_service_id)
+
+async def get_client_service_by_pair(db: AsyncSession, client_id: int, service_id: int) -> Optional[models.ClientService]:
+    return await db.scalar(select(models.ClientService).where(
+        models.ClientService.client_id == client_id,
+        models.ClientService.service_id == service_id
+    ))
+
+async def get_client_services(db: AsyncSession, client_id: int, page: PageParams) -> dict:
+    query = select(*columns_for(models.ClientService, schemas.ClientServiceRead)).where(
+        models.ClientService.client_id == client_id
+    )
+    return await fetch_page(db, query, [models.ClientService.id], page)
+
+async def disconnect_service_from_client(db: AsyncSession, client_id: int, service_id: int) -> Optional[models.ClientService]:
+    cs = await get_client_service_by_pair(db, client_id, service_id)
+    if cs:
+        await db.delete(cs)
+        await db.commit()
+        await etags.bump(etags.client_services(client_id), etags.user_services(client_id))
+        await catalog_cache.invalidate(catalog_cache.CLIENT_SERVICES)
+        # Назначения и права удалены каскадно вместе с подключением
+        await catalog_cache.invalidate(catalog_cache.ENTITLEMENTS)
+    return cs
+
+async def get_quota_limits(db: AsyncSession, client_service_id: int):
+    # (expires_at, limits тарифа клиента) или None, если подключения нет
+    return (await db.execute(
+        select(models.ClientService.expires_at, models.Tariff.limits)
+        .join(models.Client, models.Client.id == models.ClientService.client_id)
+        .outerjoin(models.Tariff, models.Tariff.name == models.Client.tariff)
+        .where(models.ClientService.id == client_service_id)
+    )).first()
+
+# -------------------------
+# USER SERVICES (Назначение сервисов пользователям)
+# -------------------------
+
+async def get_user_service(db: AsyncSession, user_service_id: int) -> Optional[models.UserService]:
+    return await db.get(models.UserService, user_service_id)
+
+async def get_user_services(db: AsyncSession, user_id: int, page: PageParams) -> dict:
+    query = select(models.UserService).where(models.UserService.user_id == user_id)
+    return await fetch_page(db, query, [models.UserService.id], page)
+
+async def get_user_service_count(db: AsyncSession, client_service_id: int) -> int:
+    return await db.scalar(
+        select(func.count(models.UserService.id)).where(models.UserService.client_service_id == client_service_id)
+    )
+
+async def _user_services_changed(db: AsyncSession, client_service_ids: List[int]) -> None:
+    # После коммита: ETag списков назначений клиентов этих подключений
+    client_ids = await db.scalars(
+        select(models.ClientService.client_id).where(models.ClientService.id.in_(client_service_ids)).distinct()
+    )
+    await etags.bump(*(etags.user_services(client_id) for client_id in client_ids))
+
+async def create_user_service(db: AsyncSession, user_id: int, client_service_id: int) -> models.UserService:
+    db_us = models.UserService(user_id=user_id, client_service_id=client_service_id)
+    db.add(db_us)
+    await db.flush()
+    await db.execute(entitlements.grant_statement(user_id, client_service_id))
+    await db.commit()
+    await db.refresh(db_us)
+    await catalog_cache.invalidate(catalog_cache.ENTITLEMENTS, user_id)
+    await _user_services_changed(db, [client_service_id])
+    return db_us
+
+async def delete_user_service(db: AsyncSession, user_service_id: int) -> Optional[models.UserService]:
+    us = await get_user_service(db, user_service_id)
+    if us:
+        await db.delete(us)
+        await db.flush()
+        await db.execute(entitlements.revoke_statement(us.user_id, us.client_service_id))
+        await db.commit()
+        await catalog_cache.invalidate(catalog_cache.ENTITLEMENTS, us.user_id)
+        await _user_services_changed(db, [us.client_service_id])
+    return us
+
+async def _lock_client_services_with_limits(db: AsyncSession, client_service_ids: List[int]) -> dict:
+    # client_service_id -> max_users тарифа клиента (None — без тарифа).
+    # FOR UPDATE сериализует параллельные массовые назначения на те же подключения
+    rows = await db.execute(
+        select(models.ClientService.id, models.Tariff.max_users)
+        .join(models.Client, models.Client.id == models.ClientService.client_id)
+        .outerjoin(models.Tariff, models.Tariff.name == models.Client.tariff)
+        .where(models.ClientService.id.in_(client_service_ids))
+        .with_for_update(of=models.ClientService)
+    )
+    return dict(rows.all())
+
+async def bulk_grant_user_services(db: AsyncSession, client_service_ids: List[int],
+                                   user_ids: Optional[List[int]] = None) -> Tuple[dict, dict]:
+    """Назначает подключения пользователям их клиента (всем, если user_ids не задан).
+
+    Возвращает (число новых назначений по client_service_id, превышения
+    лимита {client_service_id: max_users}); при превышении ничего не записывается.
+    """
+    limits = await _lock_client_services_with_limits(db, client_service_ids)
+    cs = models.ClientService
+    us = models.UserService
+    already = exists().where(us.user_id == models.User.id, us.client_service_id == cs.id)
+    source = (
+        select(models.User.id, cs.id, func.now())
+        .join(cs, cs.client_id == models.User.client_id)
+        .where(cs.id.in_(client_service_ids), ~already)
+    )
+    if user_ids is not None:
+        source = source.where(models.User.id.in_(user_ids))
+    inserted = await db.execute(
+        insert(us).from_select(["user_id", "client_service_id", "granted_at"], source)
+        .returning(us.client_service_id)
+    )
+    changed: dict = {}
+    for (client_service_id,) in inserted:
+        changed[client_service_id] = changed.get(client_service_id, 0) + 1
+
+    # Лимит тарифа проверяется один раз для всей пачки
+    capped = [cs_id for cs_id, max_users in limits.items() if max_users is not None and changed.get(cs_id)]
+    over_limit = {}
+    if capped:
+        counts = await db.execute(
+            select(us.client_service_id, func.count(func.distinct(us.user_id)))
+            .where(us.client_service_id.in_(capped))
+            .group_by(us.client_service_id)
+        )
+        over_limit = {cs_id: limits[cs_id] for cs_id, count in counts if count > limits[cs_id]}
+    if over_limit:
+        await db.rollback()
+        return {}, over_limit
+
+    await db.execute(entitlements.grant_many_statement(client_service_ids, user_ids))
+    await db.commit()
+    await catalog_cache.invalidate(catalog_cache.ENTITLEMENTS)
+    await _user_services_changed(db, client_service_ids)
+    return changed, {}
+
+async def bulk_revoke_user_services(db: AsyncSession, client_service_ids: List[int],
+                                    user_ids: Optional[List[int]] = None) -> dict:
+    us = models.UserService
+    stmt = delete(us).where(us.client_service_id.in_(client_service_ids))
+    if user_ids is not None:
+        stmt = stmt.where(us.user_id.in_(user_ids))
+    deleted = await db.execute(stmt.returning(us.client_service_id))
+    changed: dict = {}
+    for (client_service_id,) in deleted:
+        changed[client_service_id] = changed.get(client_service_id, 0) + 1
+    await db.execute(entitlements.revoke_many_statement(client_service_ids, user_ids))
+    await db.commit()
+    await catalog_cache.invalidate(catalog_cache.ENTITLEMENTS)
+    await _user_services_changed(db, client_service_ids)
+    return changed
+
+async def revoke_all_user_services(db: AsyncSession, user_id: int) -> None:
+    # Все назначения пользователя (перевод в другой клиент); commit — у вызывающего
+    us = models.UserService
+    deleted = await db.execute(delete(us).where(us.user_id == user_id).returning(us.client_service_id))
+    client_service_ids = list(set(deleted.scalars()))
+    if client_service_ids:
+        await db.execute(entitlements.revoke_many_statement(client_service_ids, [user_id]))
+
+async def rebuild_entitlements(db: AsyncSession) -> None:
+    for statement in entitlements.rebuild_statements():
+        await db.execute(statement)
+    await db.commit()
+    await catalog_cache.invalidate(catalog_cache.ENTITLEMENTS)
+
+# -------------------------
+# USAGE (Отчётность)
+# -------------------------
+
+async def create_usage(db: AsyncSession, client_service_id: int, user_id: int, usage_amount: int) -> models.Usage:
+    usage = models.Usage(
+        client_service_id=client_service_id,
+        user_id=user_id,
+        usage_date=datetime.datetime.utcnow(),
+        usage_amount=usage_amount
+    )
+    await partitions.ensure_for_dates(database.async_engine, [usage.usage_date.date()])
+    db.add(usage)
+    await db.flush()
+    cs = await get_client_service(db, client_service_id)
+    if cs is not None:
+        await db.execute(rollups.upsert_statement(rollups.aggregate(
+            [(client_service_id, user_id, usage.usage_date, usage_amount, 1)],
+            {cs.id: (cs.client_id, cs.service_id)},
+        )))
+    await db.commit()
+    await db.refresh(usage)
+    return usage
+
+_USAGE_COLUMNS = ["client_service_id", "user_id", "usage_date", "usage_amount", "events"]
+
+def usage_date_error(usage_date: Optional[datetime.datetime], now: datetime.datetime) -> Optional[str]:
+    # Окно допустимого времени события (config.USAGE_MAX_AGE_DAYS / USAGE_MAX_FUTURE_SECONDS)
+    if usage_date is None:
+        return None
+    if usage_date < now - datetime.timedelta(days=config.USAGE_MAX_AGE_DAYS):
+        return "usage_date is too old"
+    if usage_date > now + datetime.timedelta(seconds=config.USAGE_MAX_FUTURE_SECONDS):
+        return "usage_date is in the future"
+    return None
+
+async def _validate_usage_batch(
+    db: AsyncSession, items: Sequence[schemas.UsageCreate], events: Optional[Sequence[int]] = None
+) -> Tuple[List[tuple], List[schemas.UsageBatchError], dict]:
+    # Проверка ссылок одним запросом на сущность вместо запроса на запись
+    cs_ids = {item.client_service_id for item in items}
+    user_ids = {item.user_id for item in items}
+    client_services = {
+        row.id: row for row in await db.execute(
+            select(models.ClientService.id, models.ClientService.client_id,
+                   models.ClientService.service_id, models.ClientService.expires_at)
+            .where(models.ClientService.id.in_(cs_ids))
+        )
+    }
+    user_clients = dict((await db.execute(
+        select(models.User.id, models.User.client_id).where(models.User.id.in_(user_ids))
+    )).all())
+
+    now = datetime.datetime.utcnow()
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        cs = client_services.get(item.client_service_id)
+        usage_date = item.usage_date or now
+        date_error = usage_date_error(item.usage_date, now)
+        if item.usage_amount < 0:
+            detail = "usage_amount must be non-negative"
+        elif date_error:
+            detail = date_error
+        elif cs is None:
+            detail = "client_service not found"
+        elif item.user_id not in user_clients:
+            detail = "user not found"
+        elif user_clients[item.user_id] != cs.client_id:
+            detail = "user does not belong to the client of client_service"
+        elif cs.expires_at is not None and usage_date > cs.expires_at:
+            detail = "client_service expired"
+        else:
+            rows.append((item.client_service_id, item.user_id, usage_date, item.usage_amount,
+                         1 if events is None else events[index]))
+            continue
+        errors.append(schemas.UsageBatchError(index=index, detail=detail))
+    return rows, errors, client_services
+
+async def _insert_usage_rows(db: AsyncSession, rows: List[tuple]) -> None:
+    if len(rows) >= config.USAGE_COPY_THRESHOLD:
+        # Большие пакеты — через COPY драйвера asyncpg. Транзакция на этом
+        # соединении уже открыта проверочными SELECT, так что COPY входит в неё
+        conn = await db.connection()
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            models.Usage.__tablename__, records=rows, columns=_USAGE_COLUMNS
+        )
+    else:
+        # Малые пакеты — одним многострочным INSERT
+        await db.execute(insert(models.Usage), [dict(zip(_USAGE_COLUMNS, row)) for row in rows])
+
+async def create_usage_batch(
+    db: AsyncSession, items: Sequence[schemas.UsageCreate], events: Optional[Sequence[int]] = None
+) -> Tuple[int, List[schemas.UsageBatchError]]:
+    # events[i] — сколько событий свёрнуто в items[i] (буфер записи); по умолчанию по одному
+    # Секции проверяются до первого запроса сессии (см. partitions.ensure_for_dates)
+    now = datetime.datetime.utcnow()
+    await partitions.ensure_for_dates(database.async_engine, {
+        (item.usage_date or now).date() for item in items if usage_date_error(item.usage_date, now) is None
+    })
+    rows, errors, client_services = await _validate_usage_batch(db, items, events)
+    if rows:
+        await _insert_usage_rows(db, rows)
+        # Суточные итоги обновляются в той же транзакции, что и сырые строки
+        await db.execute(rollups.upsert_statement(rollups.aggregate(
+            rows, {cs.id: (cs.client_id, cs.service_id) for cs in client_services.values()}
+        )))
+    await db.commit()
+    return len(rows), errors
+
+# Ключ страницы usage: (usage_date, id)
+_USAGE_PAGE_KEYS = [models.Usage.usage_date, models.Usage.id]
+_USAGE_LIST_COLUMNS = columns_for(models.Usage, schemas.UsageRead)
+
+def _usage_period(query, date_from: Optional[datetime.date], date_to: Optional[datetime.date]):
+    # Границы по usage_date позволяют планировщику отбросить лишние секции
+    if date_from is not None:
+        query = query.where(models.Usage.usage_date >= date_from)
+    if date_to is not None:
+        query = query.where(models.Usage.usage_date < date_to + datetime.timedelta(days=1))
+    return query
+
+def usage_query_for_client(client_id: int, date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None):
+    return _usage_period(select(models.Usage).join(models.ClientService).where(
+        models.ClientService.client_id == client_id
+    ), date_from, date_to)
+
+def usage_query_for_user(user_id: int, date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None):
+    return _usage_period(select(models.Usage).where(models.Usage.user_id == user_id), date_from, date_to)
+
+def usage_query_for_service(service_id: int, client_id: Optional[int] = None,
+                            date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None):
+    query = select(models.Usage).join(models.ClientService).where(models.ClientService.service_id == service_id)
+    if client_id is not None:
+        query = query.where(models.ClientService.client_id == client_id)
+    return _usage_period(query, date_from, date_to)
+
+async def get_usage_for_client(db: AsyncSession, client_id: int, page: PageParams,
+                               date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None) -> dict:
+    query = usage_query_for_client(client_id, date_from, date_to)
+    return await fetch_page(db, query.with_only_columns(*_USAGE_LIST_COLUMNS), _USAGE_PAGE_KEYS, page)
+
+async def get_usage_for_user(db: AsyncSession, user_id: int, page: PageParams,
+                             date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None) -> dict:
+    query = usage_query_for_user(user_id, date_from, date_to)
+    return await fetch_page(db, query.with_only_columns(*_USAGE_LIST_COLUMNS), _USAGE_PAGE_KEYS, page)
+
+async def get_usage_for_service(db: AsyncSession, service_id: int, page: PageParams, client_id: Optional[int] = None,
+                                date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None) -> dict:
+    query = usage_query_for_service(service_id, client_id, date_from, date_to)
+    return await fetch_page(db, query.with_only_columns(*_USAGE_LIST_COLUMNS), _USAGE_PAGE_KEYS, page)
+
+_USAGE_EXPORT_COLUMNS = [
+    models.Usage.id,
+    models.Usage.client_service_id,
+    models.Usage.user_id,
+    models.Usage.usage_date,
+    models.Usage.usage_amount,
+]
+
+async def stream_usage(query) -> AsyncIterator[Sequence]:
+    # Серверный курсор: строки приходят пачками по USAGE_EXPORT_CHUNK, память
+    # не зависит от длины истории. Сессия своя, так как генератор живёт
+    # дольше обработчика запроса
+    query = query.with_only_columns(*_USAGE_EXPORT_COLUMNS).order_by(*_USAGE_PAGE_KEYS)
+    async with database.AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=config.USAGE_EXPORT_CHUNK))
+        async for rows in result.partitions():
+            yield rows
+
+async def get_usage_summary(
+    db: AsyncSession,
+    granularity: schemas.UsageGranularity,
+    group_by: Optional[schemas.UsageGroupBy],
+    *filters,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+) -> List[schemas.UsageSummaryRow]:
+    result = await db.execute(rollups.summary_query(
+        granularity, group_by, *filters, date_from=date_from, date_to=date_to
+    ))
+    return [schemas.UsageSummaryRow(**row) for row in result.mappings()]
+
+async def get_usage_top(
+    db: AsyncSession,
+    by: schemas.UsageGroupBy,
+    scope: Dict[str, int],
+    date_from: datetime.date,
+    date_to: datetime.date,
+    limit: int,
+) -> schemas.UsageTop:
+    rows = (await db.execute(rollups.top_query(by, scope, date_from, date_to, limit))).mappings().all()
+    total = int(rows[0]["grand_total"]) if rows else 0
+    return schemas.UsageTop(
+        by=by, date_from=date_from, date_to=date_to, total_amount=total,
+        rows=[
+            schemas.UsageTopRow(key=row["key"], total_amount=row["total_amount"], events=row["events"],
+                                share=round(row["total_amount"] / total, 6) if total else 0.0)
+            for row in rows
+        ],
+    )
+
+async def get_usage_distribution(
+    db: AsyncSession,
+    group_by: schemas.UsageGroupBy,
+    scope: Dict[str, int],
+    date_from: datetime.date,
+    date_to: datetime.date,
+    percentiles: List[float],
+    buckets: int,
+) -> schemas.UsageDistribution:
+    query = rollups.distribution_query(group_by, scope, date_from, date_to, [p / 100 for p in percentiles], buckets)
+    rows = []
+    for row in (await db.execute(query)).mappings():
+        # Пустые интервалы в json_object_agg не попадают
+        counts = row["histogram"]
+        rows.append(schemas.UsageDistributionRow(
+            key=row["key"], days=row["days"], total_amount=row["total_amount"],
+            mean=round(float(row["mean"]), 3), min=row["min"], max=row["max"],
+            percentiles={f"p{p:g}": round(value, 3) for p, value in zip(percentiles, row["percentiles"])},
+            histogram=[counts.get(str(bucket), 0) for bucket in range(1, buckets + 1)],
+            bucket_width=round((row["max"] + 1) / buckets, 3),
+        ))
+    return schemas.UsageDistribution(group_by=group_by, date_from=date_from, date_to=date_to, rows=rows)
+
+async def get_usage_trend(
+    db: AsyncSession,
+    group_by: Optional[schemas.UsageGroupBy],
+    scope: Dict[str, int],
+    date_from: datetime.date,
+    date_to: datetime.date,
+    window: int,
+) -> schemas.UsageTrend:
+    rows = [
+        schemas.UsageTrendRow(period=row["period"], key=row["key"] if group_by is not None else None,
+                              total_amount=row["total_amount"], moving_avg=round(float(row["moving_avg"]), 3))
+        for row in (await db.execute(rollups.trend_query(group_by, scope, date_from, date_to, window))).mappings()
+    ]
+    return schemas.UsageTrend(group_by=group_by, window=window, date_from=date_from, date_to=date_to, rows=rows)
+
+async def rebuild_usage_rollups(db: AsyncSession) -> None:
+    for statement in rollups.rebuild_statements():
+        await db.execute(statement)
+    await db.commit()
+
+# -------------------------
+# INVOICES (считает billing.py, здесь только чтение)
+# -------------------------
+
+_INVOICE_COLUMNS = columns_for(models.Invoice, schemas.InvoiceRead)
+
+async def get_invoices(
+    db: AsyncSession,
+    page: PageParams,
+    client_id: Optional[int] = None,
+    period: Optional[datetime.date] = None,
+    status: Optional[schemas.InvoiceStatus] = None,
+) -> dict:
+    query = select(*_INVOICE_COLUMNS)
+    if client_id is not None:
+        query = query.where(models.Invoice.client_id == client_id)
+    if period is not None:
+        query = query.where(models.Invoice.period_start == period)
+    if status is not None:
+        query = query.where(models.Invoice.status == status.value)
+    return await fetch_page(db, query, [models.Invoice.id], page)
+
+async def get_invoice(db: AsyncSession, invoice_id: int) -> Optional[models.Invoice]:
+    result = await db.execute(
+        select(models.Invoice).options(selectinload(models.Invoice.lines)).where(models.Invoice.id == invoice_id)
+    )
+    return result.scalar_one_or_none()
+
+async def get_billing_runs(db: AsyncSession, limit: int) -> List[models.BillingRun]:
+    result = await db.scalars(select(models.BillingRun).order_by(models.BillingRun.id.desc()).limit(limit))
+    return list(result)
@@ -1,36 +1,152 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import threading
+import time
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+from sqlalchemy import create_engine, exc
+from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
-SQLALCHEMY_DATABASE_URL = (f"postgresql+psycopg2://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}"
-    f"@{os.getenv('POSTGRES_SERVER')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}")
+import config, metrics, profiling
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
+def _database_url(driver: str) -> str:
+    return (f"postgresql+{driver}://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}"
+        f"@{os.getenv('POSTGRES_SERVER')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}")
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-import os
-from dotenv import load_dotenv
+SQLALCHEMY_DATABASE_URL = _database_url("psycopg2")
+ASYNC_SQLALCHEMY_DATABASE_URL = _database_url("asyncpg")
 
-load_dotenv()
 
-SQLALCHEMY_DATABASE_URL = (f"postgresql+psycopg2://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}"
-    f"@{os.getenv('POSTGRES_SERVER')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}")
+class PoolStats:
+    # Счётчики ожидания свободного соединения в пуле
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.waits += 1
+            self.wait_time_total += seconds
+            self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.waits,
+                "wait_time_total_ms": round(self.wait_time_total * 1000, 3),
+                "wait_time_avg_ms": round(self.wait_time_total * 1000 / self.waits, 3) if self.waits else 0.0,
+                "wait_time_max_ms": round(self.wait_time_max * 1000, 3),
+                "timeouts": self.timeouts,
+            }
+
+
+class _TimedPoolMixin:
+    # Замеряет, сколько запрос ждал соединение из пула
+    stats: PoolStats
+    wait_metric: object
+    timeout_metric: object
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            self.timeout_metric.inc()
+            raise
+        waited = time.perf_counter() - start
+        self.stats.record_wait(waited)
+        self.wait_metric.observe(waited)
+        return conn
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    stats = PoolStats()
+    wait_metric = metrics.DB_POOL_WAIT.labels("sync")
+    timeout_metric = metrics.DB_POOL_TIMEOUTS.labels("sync")
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+    wait_metric = metrics.DB_POOL_WAIT.labels("async")
+    timeout_metric = metrics.DB_POOL_TIMEOUTS.labels("async")
+
+
+def make_engine(use_async: bool = False):
+    # Единственная точка создания движков; параметры пула берутся из окружения
+    options = dict(
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+        pool_recycle=config.DB_POOL_RECYCLE,
+    )
+    timeout = config.DB_STATEMENT_TIMEOUT_MS
+    if use_async:
+        connect_args = {"server_settings": {"statement_timeout": str(timeout)}} if timeout else {}
+        engine_ = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=TimedAsyncQueuePool,
+                                      connect_args=connect_args, **options)
+    else:
+        connect_args = {"options": f"-c statement_timeout={timeout}"} if timeout else {}
+        engine_ = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool,
+                                connect_args=connect_args, **options)
+    if config.SQL_PROFILE:
+        # Счётчики запросов и журнал медленных запросов (profiling.py)
+        profiling.instrument(engine_.sync_engine if use_async else engine_)
+    return engine_
+
+
+# Синхронный движок нужен только скриптам (migrate.py, partitions.py,
+# бенчмарки), поэтому создаётся при первом обращении к database.engine или
+# database.SessionLocal, а не при импорте
+_sync_lock = threading.Lock()
+_sync = {}
+
+
+def __getattr__(name):
+    if name not in ("engine", "SessionLocal"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _sync_lock:
+        if not _sync:
+            engine_ = make_engine()
+            _sync["engine"] = engine_
+            _sync["SessionLocal"] = sessionmaker(autocommit=False, autoflush=False, bind=engine_)
+    return _sync[name]
+
+
+def sync_engine_created() -> bool:
+    return bool(_sync)
+
+# Асинхронный движок (asyncpg) обслуживает все роутеры.
+# expire_on_commit=False: после commit атрибуты остаются загруженными,
+# иначе сериализация ответа потребовала бы ленивой загрузки
+async_engine = make_engine(use_async=True)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def pool_status(engine_) -> dict:
+    pool = engine_.pool
+    status = {
+        "pool_size": pool.size(),
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+    status.update(type(pool).stats.as_dict())
+    return status
@@ -0,0 +1,138 @@
+# app/entitlements.py
+#
+# Индекс прав доступа «пользователь -> сервисы» для /authz/check.
+# Таблица user_entitlements обновляется в транзакциях назначения/отзыва
+# сервиса; удаление пользователя или подключения чистит её каскадно.
+# В памяти процесса держится карта user_id -> {service_id: expires_at},
+# которая заполняется при первом обращении и сбрасывается через канал
+# инвалидации catalog_cache, так что при попадании в кэш БД не читается.
+
+import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, exists, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import catalog_cache, config, database, models
+from cache import TTLCache
+
+Entitlement = models.UserEntitlement
+
+# user_id -> {service_id: expires_at или None}
+_index = TTLCache(config.ENTITLEMENT_CACHE_SIZE, config.ENTITLEMENT_CACHE_TTL)
+
+
+def _drop(key: Optional[str]) -> None:
+    if key is None:
+        _index.clear()
+    else:
+        _index.pop(int(key))
+
+
+catalog_cache.on_invalidate(catalog_cache.ENTITLEMENTS, _drop)
+
+
+def _grant_from(*filters):
+    source = select(
+        models.UserService.user_id,
+        models.ClientService.id,
+        models.ClientService.service_id,
+        models.ClientService.expires_at,
+    ).join(models.ClientService, models.ClientService.id == models.UserService.client_service_id).where(
+        *filters
+    ).distinct()
+    stmt = pg_insert(Entitlement).from_select(
+        ["user_id", "client_service_id", "service_id", "expires_at"], source
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[Entitlement.user_id, Entitlement.client_service_id],
+        set_={"expires_at": stmt.excluded.expires_at},
+    )
+
+
+def grant_statement(user_id: int, client_service_id: int):
+    return _grant_from(
+        models.UserService.user_id == user_id,
+        models.UserService.client_service_id == client_service_id,
+    )
+
+
+def grant_many_statement(client_service_ids: List[int], user_ids: Optional[List[int]] = None):
+    filters = [models.UserService.client_service_id.in_(client_service_ids)]
+    if user_ids is not None:
+        filters.append(models.UserService.user_id.in_(user_ids))
+    return _grant_from(*filters)
+
+
+def revoke_statement(user_id: int, client_service_id: int):
+    # Запись остаётся, пока у пользователя есть другое назначение того же подключения
+    still_assigned = exists().where(
+        models.UserService.user_id == user_id,
+        models.UserService.client_service_id == client_service_id,
+    )
+    return delete(Entitlement).where(
+        Entitlement.user_id == user_id,
+        Entitlement.client_service_id == client_service_id,
+        ~still_assigned,
+    )
+
+
+def revoke_many_statement(client_service_ids: List[int], user_ids: Optional[List[int]] = None):
+    # Массовый отзыв удаляет все назначения пары, поэтому проверка остатка не нужна
+    stmt = delete(Entitlement).where(Entitlement.client_service_id.in_(client_service_ids))
+    if user_ids is not None:
+        stmt = stmt.where(Entitlement.user_id.in_(user_ids))
+    return stmt
+
+
+def rebuild_statements() -> list:
+    # Полное заполнение из user_services (первичная загрузка, восстановление)
+    source = select(
+        models.UserService.user_id,
+        models.ClientService.id,
+        models.ClientService.service_id,
+        models.ClientService.expires_at,
+    ).join(models.ClientService, models.ClientService.id == models.UserService.client_service_id).distinct()
+    return [
+        text(f"LOCK TABLE {models.UserService.__tablename__} IN SHARE MODE"),
+        delete(Entitlement),
+        pg_insert(Entitlement).from_select(
+            ["user_id", "client_service_id", "service_id", "expires_at"], source
+        ),
+    ]
+
+
+async def _load(user_id: int) -> Dict[int, Optional[datetime.datetime]]:
+    async with database.AsyncSessionLocal() as db:
+        rows = await db.execute(
+            select(Entitlement.service_id, Entitlement.expires_at).where(Entitlement.user_id == user_id)
+        )
+    services: Dict[int, Optional[datetime.datetime]] = {}
+    for service_id, expires_at in rows:
+        # Несколько подключений одного сервиса: берём самый поздний срок
+        if service_id in services:
+            current = services[service_id]
+            expires_at = None if current is None or expires_at is None else max(current, expires_at)
+        services[service_id] = expires_at
+    return services
+
+
+async def services_for(user_id: int) -> Dict[int, Optional[datetime.datetime]]:
+    services = _index.get(user_id)
+    if services is None:
+        generation = _index.generation
+        services = await _load(user_id)
+        _index.set(user_id, services, generation=generation)
+    return services
+
+
+_NOT_GRANTED = object()
+
+
+async def check(user_id: int, service_id: int) -> Tuple[bool, Optional[str]]:
+    expires_at = (await services_for(user_id)).get(service_id, _NOT_GRANTED)
+    if expires_at is _NOT_GRANTED:
+        return False, "not_granted"
+    if expires_at is not None and datetime.datetime.utcnow() > expires_at:
+        return False, "expired"
+    return True, None
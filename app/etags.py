@@ -0,0 +1,114 @@
+# app/etags.py
+#
+# ETag и условные GET для часто опрашиваемых маршрутов. ETag вычисляется
+# не по телу ответа, а по счётчикам версий в Redis (catalog:<scope>:ver):
+# на раздел целиком ("service", "tariff", "client", "user") или на клиента
+# ("client:5", "client_service:5", "user:5", "user_service:5"). Счётчики увеличиваются в crud_async
+# после коммита изменения, для сервисов и тарифов это версии catalog_cache.
+# Поэтому ответ 304 на If-None-Match стоит одного MGET в Redis: строки не
+# читаются и ничего не сериализуется.
+#
+# Если Redis недоступен, ETag не выдаётся и ответ формируется как обычно.
+
+import hashlib
+import logging
+import time
+from typing import List, Optional
+
+from fastapi import Request, Response
+from redis.exceptions import RedisError
+
+import catalog_cache, config, redis_client
+
+logger = logging.getLogger(__name__)
+
+SERVICES = catalog_cache.SERVICES
+TARIFFS = catalog_cache.TARIFFS
+CLIENTS = catalog_cache.CLIENTS
+USERS = "user"
+USER_SERVICES = "user_service"
+
+# Ответы зависят от пользователя: только кэш браузера и всегда с проверкой
+CACHE_CONTROL = "private, no-cache"
+
+
+def client(client_id: int) -> str:
+    return f"{catalog_cache.CLIENTS}:{client_id}"
+
+
+def client_services(client_id: int) -> str:
+    return f"{catalog_cache.CLIENT_SERVICES}:{client_id}"
+
+
+def users(client_id: Optional[int]) -> str:
+    # Пользователи без клиента входят только в общий раздел
+    return USERS if client_id is None else f"{USERS}:{client_id}"
+
+
+def user_services(client_id: Optional[int]) -> str:
+    return USER_SERVICES if client_id is None else f"{USER_SERVICES}:{client_id}"
+
+
+class Validator:
+    """Текущие версии разделов и ETag для одного запроса."""
+
+    def __init__(self, etag: Optional[str], versions: List[Optional[int]], if_none_match: Optional[str]):
+        self.etag = etag
+        self.versions = versions
+        self.fresh = etag is not None and _matches(if_none_match, etag)
+
+    def not_modified(self) -> Response:
+        return Response(status_code=304, headers={"ETag": self.etag, "Cache-Control": CACHE_CONTROL})
+
+    def apply(self, response: Response) -> Response:
+        if self.etag is not None:
+            response.headers["ETag"] = self.etag
+            response.headers["Cache-Control"] = CACHE_CONTROL
+        return response
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Для If-None-Match сравнение слабое: W/"x" совпадает с "x"
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+async def validator(request: Request, *scopes: str) -> Validator:
+    """Читает версии разделов; вызывать после проверки прав и до чтения данных."""
+    redis = redis_client.get_redis()
+    try:
+        raw = await redis.mget([catalog_cache.version_key(scope) for scope in scopes])
+    except RedisError:
+        logger.warning("etags: redis unavailable, serving %s without ETag", request.url.path, exc_info=True)
+        return Validator(None, [None] * len(scopes), None)
+    versions = [int(value or 0) for value in raw]
+    parts = [request.url.path, request.url.query]
+    parts += [f"{scope}={version}" for scope, version in zip(scopes, versions)]
+    if config.ETAG_MAX_AGE > 0:
+        # Страховка от потерянного увеличения счётчика: ETag всё равно
+        # меняется не реже раза в ETAG_MAX_AGE секунд
+        parts.append(str(int(time.time() // config.ETAG_MAX_AGE)))
+    digest = hashlib.blake2b("\n".join(parts).encode(), digest_size=12).hexdigest()
+    return Validator(f'"{digest}"', versions, request.headers.get("if-none-match"))
+
+
+async def bump(*scopes: str) -> None:
+    """Вызывается после коммита: ETag разделов перестают совпадать."""
+    redis = redis_client.get_redis()
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for scope in scopes:
+                pipe.incr(catalog_cache.version_key(scope))
+            await pipe.execute()
+    except RedisError:
+        logger.warning("etags: failed to bump %s", ", ".join(scopes), exc_info=True)
+
+
+async def bump_users(*client_ids: Optional[int]) -> None:
+    """Изменились пользователи этих клиентов (None — без клиента)."""
+    await bump(USERS, *{users(client_id) for client_id in client_ids if client_id is not None})
@@ -0,0 +1,103 @@
+# app/hashing.py
+#
+# bcrypt выполняется в отдельном пуле процессов, чтобы вход и регистрация
+# не занимали общий threadpool и event loop. Очередь ограничена: при
+# переполнении запрос сразу получает 503, а не ждёт.
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+import config, metrics, utils
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(config.HASH_QUEUE_SIZE)
+# Лимит массового хэширования общий для всех импортов процесса
+_bulk_limit: Optional[asyncio.Semaphore] = None
+_bulk_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    # Пул создаётся лениво, чтобы импорт модуля не порождал процессы
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=config.HASH_WORKERS)
+    return _executor
+
+
+def _get_bulk_limit() -> asyncio.Semaphore:
+    # Семафор привязан к event loop: при смене loop (тесты) создаётся заново
+    global _bulk_limit, _bulk_loop
+    loop = asyncio.get_running_loop()
+    if _bulk_limit is None or _bulk_loop is not loop:
+        _bulk_limit = asyncio.Semaphore(config.HASH_BULK_WORKERS)
+        _bulk_loop = loop
+    return _bulk_limit
+
+
+async def _run(operation: str, fn, *args):
+    if not _slots.acquire(blocking=False):
+        metrics.BCRYPT_REJECTED.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Password hashing is overloaded, retry later",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        result = await loop.run_in_executor(_get_executor(), fn, *args)
+        metrics.BCRYPT_DURATION.labels(operation).observe(time.perf_counter() - start)
+        return result
+    finally:
+        _slots.release()
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", utils.hash_password, password)
+
+
+async def hash_many(passwords: List[str]) -> List[str]:
+    # Массовое хэширование (импорт пользователей): пачки раздаются процессам
+    # пула, но всеми импортами процесса вместе одновременно занято не больше
+    # HASH_BULK_WORKERS процессов — остальные остаются свободными для входа и
+    # регистрации. Очередь _slots не используется: импорт не должен получать
+    # 503 посреди файла.
+    if not passwords:
+        return []
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    limit = _get_bulk_limit()
+    size = config.HASH_BULK_CHUNK
+
+    async def run_chunk(chunk: List[str]) -> List[str]:
+        async with limit:
+            start = time.perf_counter()
+            hashed = await loop.run_in_executor(executor, utils.hash_passwords, chunk)
+            metrics.BCRYPT_DURATION.labels("hash_many").observe(time.perf_counter() - start)
+            return hashed
+
+    chunks = await asyncio.gather(*(
+        run_chunk(passwords[i:i + size]) for i in range(0, len(passwords), size)
+    ))
+    return [hashed for chunk in chunks for hashed in chunk]
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    # Возвращает (валиден, новый_хэш); новый хэш не None, если сменилась стоимость bcrypt
+    return await _run("verify", utils.verify_and_update, plain_password, hashed_password)
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
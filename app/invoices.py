@@ -0,0 +1,63 @@
+# app/routers/invoices.py
+#
+# Чтение счетов. Счета считает billing.py (отдельный процесс по расписанию),
+# API их не изменяет.
+
+import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud_async, schemas, database, models, serialization
+from auth import get_current_user
+from pagination import PageParams
+from schemas import UserRole
+
+router = APIRouter(
+    prefix="/invoices",
+    tags=["invoices"],
+)
+
+def _invoice_scope(current_user: models.User, client_id: Optional[int]) -> Optional[int]:
+    # portal_admin видит все счета, client_admin — только своего клиента
+    if current_user.role == UserRole.portal_admin:
+        return client_id
+    if current_user.role == UserRole.client_admin:
+        if client_id is not None and client_id != current_user.client_id:
+            raise HTTPException(status_code=403, detail="Недостаточно прав")
+        return current_user.client_id
+    raise HTTPException(status_code=403, detail="Недостаточно прав")
+
+def _period(value: Optional[str]) -> Optional[datetime.date]:
+    if value is None:
+        return None
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="period must be YYYY-MM")
+
+@router.get("/", response_model=schemas.Page[schemas.InvoiceRead])
+async def list_invoices(
+    client_id: Optional[int] = None,
+    period: Optional[str] = Query(None, description="месяц счёта, YYYY-MM"),
+    status: Optional[schemas.InvoiceStatus] = None,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    client_id = _invoice_scope(current_user, client_id)
+    result = await crud_async.get_invoices(db, page, client_id, _period(period), status)
+    return serialization.page_response(schemas.InvoiceRead, result)
+
+@router.get("/{invoice_id}", response_model=schemas.InvoiceDetail)
+async def read_invoice(
+    invoice_id: int,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    _invoice_scope(current_user, None)
+    invoice = await crud_async.get_invoice(db, invoice_id)
+    if not invoice or (current_user.role == UserRole.client_admin and invoice.client_id != current_user.client_id):
+        raise HTTPException(status_code=404, detail="Счёт не найден")
+    return invoice
@@ -0,0 +1,76 @@
+# app/loader.py
+#
+# Загрузчик объектов по первичному ключу в рамках одного запроса
+# (по образцу DataLoader). Повторные обращения к одному id отдаются из
+# памяти, а ключи, запрошенные в одном шаге цикла событий (например, через
+# asyncio.gather), собираются в один запрос SELECT ... WHERE id IN (...)
+# на каждую модель. Объекты попадают в identity map сессии, поэтому
+# последующие crud_async.get_* по тем же id тоже не ходят в БД.
+
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+
+
+class Loader:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        # model -> {id: Future}
+        self._loaded: Dict[type, Dict[int, asyncio.Future]] = {}
+        self._pending: Dict[type, List[int]] = {}
+        self._scheduled = False
+        # Цикл событий держит задачи только слабой ссылкой: пакет в работе
+        # хранится здесь, иначе его может собрать GC и ожидающие зависнут
+        self._tasks: Set[asyncio.Task] = set()
+        # AsyncSession нельзя использовать из нескольких задач одновременно
+        self._lock = asyncio.Lock()
+        self.queries = 0
+
+    def load(self, model: type, key: int) -> "asyncio.Future":
+        loaded = self._loaded.setdefault(model, {})
+        future = loaded.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            loaded[key] = future
+            self._pending.setdefault(model, []).append(key)
+            if not self._scheduled:
+                self._scheduled = True
+                # Пакет отправляется, когда все задачи текущего шага дошли до await
+                asyncio.get_running_loop().call_soon(self._dispatch)
+        return future
+
+    async def load_many(self, model: type, keys: Iterable[int]) -> List[Optional[Any]]:
+        return list(await asyncio.gather(*(self.load(model, key) for key in keys)))
+
+    def _dispatch(self) -> None:
+        self._scheduled = False
+        pending, self._pending = self._pending, {}
+        task = asyncio.ensure_future(self._fetch(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, pending: Dict[type, List[int]]) -> None:
+        async with self._lock:
+            for model, keys in pending.items():
+                futures = self._loaded[model]
+                try:
+                    rows = await self.db.scalars(select(model).where(model.id.in_(keys)))
+                    self.queries += 1
+                    found = {row.id: row for row in rows}
+                except Exception as exc:
+                    for key in keys:
+                        # Неудачную загрузку можно повторить
+                        futures.pop(key).set_exception(exc)
+                    continue
+                for key in keys:
+                    futures[key].set_result(found.get(key))
+
+
+async def get_loader(db: AsyncSession = Depends(database.get_async_db)) -> Loader:
+    # Та же сессия, что и у обработчика: зависимости кэшируются в пределах запроса
+    return Loader(db)
@@ -1,5 +1,6 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from init_db import init_db
 
 # Импорт роутеров из текущей папки
 import auth
@@ -10,19 +11,56 @@ import clientservices
 import tariffs
 import user_service
 import usage
+import invoices
+import quota
+import authz
+import admin
+import hashing
+import config
+import database
+import catalog_cache
+import metrics
+import migrate
+import profiling
+import redis_client
+import sessions
+from usage_buffer import usage_buffer
 import uvicorn
 
 
-# Инициализация БД (создаёт таблицы)
-init_db()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Схему создаёт и обновляет `python migrate.py upgrade` при выкладке;
+    # здесь только сверяется её версия
+    await migrate.check(database.async_engine)
+    usage_buffer.start()
+    catalog_cache.start()
+    sessions.start()
+    metrics.start({"async": database.async_engine})
+    yield
+    await metrics.stop()
+    await sessions.stop()
+    await catalog_cache.stop()
+    # Сначала дописываем буфер usage, пока движок ещё открыт
+    await usage_buffer.stop()
+    # Останавливаем пул процессов bcrypt и закрываем соединения asyncpg
+    hashing.shutdown()
+    await database.async_engine.dispose()
+    await redis_client.close()
+
 
 # Инициализация приложения
 app = FastAPI(
     title="Gendalf Services Portal",
     description="API для управления клиентами, сервисами и тарифами",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
+if config.SQL_PROFILE:
+    app.add_middleware(profiling.SQLProfileMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Подключение роутеров
 app.include_router(auth.router)
 app.include_router(users.router)
@@ -32,7 +70,11 @@ app.include_router(clientservices.router)
 app.include_router(tariffs.router)
 app.include_router(user_service.router)
 app.include_router(usage.router)
+app.include_router(invoices.router)
+app.include_router(quota.router)
+app.include_router(authz.router)
+app.include_router(admin.router)
+app.include_router(metrics.router)
 
 if __name__ == "__main__":
-    init_db()
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,156 @@
+# app/metrics.py
+#
+# Метрики в формате Prometheus (GET /metrics). При нескольких процессах
+# uvicorn (--workers) задайте PROMETHEUS_MULTIPROC_DIR — пустой каталог,
+# общий для всех процессов и очищаемый перед стартом: каждый процесс пишет
+# свои значения в mmap-файлы, а /metrics любого процесса суммирует их.
+# Без переменной используется обычный реестр одного процесса.
+#
+# На запрос приходится одно наблюдение гистограммы и два изменения
+# счётчика выполняющихся запросов. Состояние пулов (threadpool, соединения
+# с БД) снимается фоновой задачей раз в METRICS_SAMPLE_INTERVAL секунд.
+
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+
+from anyio import to_thread
+from fastapi import APIRouter, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess,
+)
+
+import config
+from profiling import route_template
+
+router = APIRouter(tags=["metrics"])
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status (_count is the request count)",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being processed", ["method"], multiprocess_mode="livesum",
+)
+
+THREADPOOL_BUSY = Gauge(
+    "threadpool_threads_busy", "Worker threads in use (sync endpoints and dependencies)",
+    multiprocess_mode="livesum",
+)
+THREADPOOL_LIMIT = Gauge("threadpool_threads_limit", "Worker thread limit", multiprocess_mode="livesum")
+THREADPOOL_WAITING = Gauge(
+    "threadpool_tasks_waiting", "Tasks waiting for a free worker thread", multiprocess_mode="livesum",
+)
+
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection (_count is checkouts)",
+    ["engine"], buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_TIMEOUTS = Counter("db_pool_checkout_timeouts_total", "Pool checkouts that timed out", ["engine"])
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_connections_checked_out", "Connections currently in use", ["engine"], multiprocess_mode="livesum",
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_connections", "Connections currently open (pool_size + overflow)", ["engine"],
+    multiprocess_mode="livesum",
+)
+
+BCRYPT_DURATION = Histogram(
+    "bcrypt_duration_seconds", "bcrypt hash/verify time including wait for a free pool process",
+    ["operation"], buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+BCRYPT_REJECTED = Counter("bcrypt_rejected_total", "Hashing requests rejected with 503 (queue full)")
+SESSION_REVOCATION_CHECKS = Counter(
+    "session_revocation_checks_total",
+    "Session revocation checks by where they were answered (local bloom filter or redis)", ["source"],
+)
+LOGIN_DURATION = Histogram(
+    "auth_login_duration_seconds", "Login latency by result", ["result"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+_sampler: Optional[asyncio.Task] = None
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: задержка и число выполняющихся запросов."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            # Метка — шаблон пути, а не сам путь: число рядов не зависит от id
+            REQUEST_DURATION.labels(method, route_template(scope), str(status)).observe(
+                time.perf_counter() - start
+            )
+
+
+def _sample(engines: Dict[str, object]) -> None:
+    limiter = to_thread.current_default_thread_limiter()
+    THREADPOOL_BUSY.set(limiter.borrowed_tokens)
+    THREADPOOL_LIMIT.set(limiter.total_tokens)
+    THREADPOOL_WAITING.set(limiter.statistics().tasks_waiting)
+    for name, engine in engines.items():
+        pool = engine.pool
+        DB_POOL_CHECKED_OUT.labels(name).set(pool.checkedout())
+        DB_POOL_SIZE.labels(name).set(pool.checkedin() + pool.checkedout())
+
+
+async def _run_sampler(engines: Dict[str, object]) -> None:
+    while True:
+        _sample(engines)
+        await asyncio.sleep(config.METRICS_SAMPLE_INTERVAL)
+
+
+def start(engines: Dict[str, object]) -> None:
+    global _sampler
+    if _sampler is None:
+        _sampler = asyncio.create_task(_run_sampler(engines))
+
+
+async def stop() -> None:
+    global _sampler
+    if _sampler is not None:
+        _sampler.cancel()
+        try:
+            await _sampler
+        except asyncio.CancelledError:
+            pass
+        _sampler = None
+    if MULTIPROCESS:
+        # Gauge в режиме live* не должны учитывать завершившийся процесс
+        multiprocess.mark_process_dead(os.getpid())
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,193 @@
+# app/migrate.py
+#
+# Версионированные миграции схемы. Миграция — файл migrations/NNNN_name.sql;
+# применённые версии записываются в schema_migrations в той же транзакции,
+# что и сама миграция. Запускается один раз при выкладке, до перезапуска
+# процессов uvicorn; сами процессы при старте только сверяют номер версии
+# (check) и схему не трогают. Параллельные запуски upgrade сериализуются
+# advisory-блокировкой.
+#
+#   python migrate.py upgrade     # применить недостающие миграции и создать секции usage
+#   python migrate.py status
+#   python migrate.py stamp 1     # отметить версию применённой, не выполняя её
+#
+# База, созданная до появления миграций (create_all), при первом upgrade
+# дополняется недостающими таблицами и столбцами и отмечается версией 1.
+
+import argparse
+import logging
+import os
+import re
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+import config, entitlements, models, partitions, rollups
+from database import Base
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+_FILE_RE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+# Ключ pg_advisory_lock для upgrade
+_LOCK_ID = 7_346_001
+
+_CREATE_VERSION_TABLE = text("""
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR NOT NULL,
+    applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+)
+""")
+_RECORD_VERSION = text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)")
+
+# Таблицы схемы версии 1 (для перевода старой базы на миграции)
+_BASELINE_TABLES = (
+    "clients", "services", "tariffs", "client_services", "users", "usage",
+    "usage_daily_rollups", "user_entitlements", "user_services",
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: str
+
+    def sql(self) -> str:
+        with open(self.path, encoding="utf-8") as f:
+            return f.read()
+
+
+def discover() -> List[Migration]:
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = _FILE_RE.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    migrations.sort()
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"duplicate migration versions in {MIGRATIONS_DIR}")
+    return migrations
+
+
+HEAD = discover()[-1].version
+
+
+def _adopt_legacy(conn) -> None:
+    # То, что раньше делал init_db при каждом старте
+    Base.metadata.create_all(conn, tables=[Base.metadata.tables[name] for name in _BASELINE_TABLES])
+    conn.execute(text("ALTER TABLE tariffs ADD COLUMN IF NOT EXISTS limits JSONB"))
+    if not conn.scalar(text("SELECT EXISTS (SELECT 1 FROM user_entitlements)")):
+        for statement in entitlements.rebuild_statements():
+            conn.execute(statement)
+    # Суточные итоги по накопленной истории, иначе сводки по usage пусты.
+    # Столбец events добавляет миграция 0003, но пересчёт нужен уже здесь
+    has_rollups = conn.scalar(text("SELECT EXISTS (SELECT 1 FROM usage_daily_rollups)"))
+    if not has_rollups and conn.scalar(text("SELECT EXISTS (SELECT 1 FROM usage)")):
+        conn.execute(text("ALTER TABLE usage ADD COLUMN IF NOT EXISTS events INTEGER NOT NULL DEFAULT 1"))
+        for statement in rollups.rebuild_statements():
+            conn.execute(statement)
+    relkind = conn.scalar(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('usage')"))
+    if relkind == "r":
+        logger.warning("usage is not partitioned yet: run `python partitions.py convert`")
+
+
+def applied_versions(conn) -> List[int]:
+    if conn.scalar(text("SELECT to_regclass('schema_migrations')")) is None:
+        return []
+    return list(conn.scalars(text("SELECT version FROM schema_migrations ORDER BY version")))
+
+
+def upgrade(engine, target: Optional[int] = None) -> List[Migration]:
+    """Применяет недостающие миграции (до target включительно)."""
+    applied = []
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _LOCK_ID})
+        conn.commit()
+        try:
+            with conn.begin():
+                conn.execute(_CREATE_VERSION_TABLE)
+                done = set(applied_versions(conn))
+                if not done and conn.scalar(text("SELECT to_regclass('users')")) is not None:
+                    logger.info("adopting schema created before migrations as version 1")
+                    _adopt_legacy(conn)
+                    conn.execute(_RECORD_VERSION, {"version": 1, "name": "baseline"})
+                    done.add(1)
+            for migration in discover():
+                if migration.version in done or (target is not None and migration.version > target):
+                    continue
+                with conn.begin():
+                    # Файл может содержать несколько операторов: выполняется как есть
+                    conn.exec_driver_sql(migration.sql())
+                    conn.execute(_RECORD_VERSION, {"version": migration.version, "name": migration.name})
+                logger.info("applied migration %04d_%s", migration.version, migration.name)
+                applied.append(migration)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _LOCK_ID})
+            conn.commit()
+    # Секции usage на окно приёма событий и ближайшие месяцы
+    partitions.ensure_for_dates_sync(engine, partitions.accepted_months(config.USAGE_PARTITIONS_AHEAD))
+    return applied
+
+
+def stamp(engine, version: int) -> None:
+    migration = {m.version: m for m in discover()}.get(version)
+    if migration is None:
+        raise SystemExit(f"unknown migration version {version}")
+    with engine.begin() as conn:
+        conn.execute(_CREATE_VERSION_TABLE)
+        conn.execute(_RECORD_VERSION, {"version": migration.version, "name": migration.name})
+
+
+async def check(async_engine) -> None:
+    """Сверка версии схемы при старте процесса: один запрос, без DDL."""
+    if config.SCHEMA_CHECK == "off":
+        return
+    try:
+        async with async_engine.connect() as conn:
+            current = await conn.scalar(text("SELECT max(version) FROM schema_migrations"))
+    except ProgrammingError:
+        current = None
+    if current is not None and current >= HEAD:
+        if current > HEAD:
+            # Нормально во время выкладки: база уже обновлена, процесс ещё старый
+            logger.warning("database schema version %s is newer than this build (%s)", current, HEAD)
+        return
+    message = (f"database schema version {current or 'none'} is behind this build ({HEAD}): "
+               f"run `python migrate.py upgrade`")
+    if config.SCHEMA_CHECK == "strict":
+        raise RuntimeError(message)
+    logger.warning(message)
+
+
+def main():
+    import database
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Миграции схемы")
+    commands = parser.add_subparsers(dest="command", required=True)
+    up = commands.add_parser("upgrade")
+    up.add_argument("--target", type=int, default=None)
+    commands.add_parser("status")
+    stamp_parser = commands.add_parser("stamp")
+    stamp_parser.add_argument("version", type=int)
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        applied = upgrade(database.engine, args.target)
+        print(f"applied {len(applied)} migration(s), head is {HEAD}")
+    elif args.command == "status":
+        with database.engine.connect() as conn:
+            done = set(applied_versions(conn))
+        for migration in discover():
+            mark = "applied" if migration.version in done else "pending"
+            print(f"{migration.version:04d}_{migration.name}: {mark}")
+    elif args.command == "stamp":
+        stamp(database.engine, args.version)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+-- Схема на момент перехода на версионированные миграции.
+-- Секции usage создаёт migrate.py upgrade после применения миграций.
+
+CREATE TYPE userrole AS ENUM ('portal_admin', 'client_admin', 'user');
+
+CREATE TABLE clients (
+    id SERIAL NOT NULL,
+    name VARCHAR NOT NULL,
+    tariff VARCHAR,
+    created_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (id),
+    UNIQUE (name)
+);
+
+CREATE TABLE services (
+    id SERIAL NOT NULL,
+    name VARCHAR NOT NULL,
+    description TEXT,
+    PRIMARY KEY (id),
+    UNIQUE (name)
+);
+
+CREATE TABLE tariffs (
+    id SERIAL NOT NULL,
+    name VARCHAR NOT NULL,
+    max_users INTEGER NOT NULL,
+    max_services INTEGER NOT NULL,
+    period_days INTEGER NOT NULL,
+    price NUMERIC(12, 2) NOT NULL,
+    limits JSONB,
+    PRIMARY KEY (id),
+    UNIQUE (name)
+);
+
+CREATE TABLE client_services (
+    id SERIAL NOT NULL,
+    client_id INTEGER,
+    service_id INTEGER,
+    connected_at TIMESTAMP WITHOUT TIME ZONE,
+    expires_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (id),
+    FOREIGN KEY (client_id) REFERENCES clients (id),
+    FOREIGN KEY (service_id) REFERENCES services (id)
+);
+
+CREATE TABLE users (
+    id SERIAL NOT NULL,
+    username VARCHAR NOT NULL,
+    email VARCHAR,
+    password_hash VARCHAR NOT NULL,
+    role userrole,
+    client_id INTEGER,
+    PRIMARY KEY (id),
+    UNIQUE (username),
+    UNIQUE (email),
+    FOREIGN KEY (client_id) REFERENCES clients (id)
+);
+
+CREATE TABLE usage (
+    id SERIAL NOT NULL,
+    client_service_id INTEGER,
+    user_id INTEGER,
+    usage_date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    usage_amount INTEGER,
+    PRIMARY KEY (id, usage_date),
+    FOREIGN KEY (client_service_id) REFERENCES client_services (id),
+    FOREIGN KEY (user_id) REFERENCES users (id)
+) PARTITION BY RANGE (usage_date);
+CREATE INDEX ix_usage_client_service_date_id ON usage (client_service_id, usage_date, id);
+CREATE INDEX ix_usage_user_date_id ON usage (user_id, usage_date, id);
+
+CREATE TABLE usage_daily_rollups (
+    day DATE NOT NULL,
+    client_service_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    client_id INTEGER NOT NULL,
+    service_id INTEGER NOT NULL,
+    total_amount BIGINT NOT NULL,
+    events INTEGER NOT NULL,
+    PRIMARY KEY (day, client_service_id, user_id),
+    FOREIGN KEY (client_service_id) REFERENCES client_services (id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+);
+CREATE INDEX ix_usage_daily_rollups_client_day ON usage_daily_rollups (client_id, day);
+CREATE INDEX ix_usage_daily_rollups_service_day ON usage_daily_rollups (service_id, day);
+CREATE INDEX ix_usage_daily_rollups_user_day ON usage_daily_rollups (user_id, day);
+
+CREATE TABLE user_entitlements (
+    user_id INTEGER NOT NULL,
+    client_service_id INTEGER NOT NULL,
+    service_id INTEGER NOT NULL,
+    expires_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (user_id, client_service_id),
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY (client_service_id) REFERENCES client_services (id) ON DELETE CASCADE
+);
+
+CREATE TABLE user_services (
+    id SERIAL NOT NULL,
+    user_id INTEGER NOT NULL,
+    client_service_id INTEGER NOT NULL,
+    granted_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (id),
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY (client_service_id) REFERENCES client_services (id) ON DELETE CASCADE
+);
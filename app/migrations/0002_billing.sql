@@ -0,0 +1,56 @@
+-- Счета клиентов и состояние инкрементального расчёта (billing.py).
+
+CREATE TABLE invoices (
+    id SERIAL NOT NULL,
+    client_id INTEGER NOT NULL,
+    period_start DATE NOT NULL,
+    period_end DATE NOT NULL,
+    status VARCHAR NOT NULL,
+    tariff_id INTEGER,
+    tariff_name VARCHAR,
+    unit_price NUMERIC(12, 6) NOT NULL,
+    subscription_amount NUMERIC(14, 2) NOT NULL,
+    usage_units BIGINT NOT NULL,
+    usage_amount NUMERIC(14, 2) NOT NULL,
+    total_amount NUMERIC(14, 2) NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE,
+    updated_at TIMESTAMP WITHOUT TIME ZONE,
+    finalized_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (id),
+    CONSTRAINT uq_invoices_client_period UNIQUE (client_id, period_start),
+    FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE,
+    FOREIGN KEY (tariff_id) REFERENCES tariffs (id) ON DELETE SET NULL
+);
+CREATE INDEX ix_invoices_period_id ON invoices (period_start, id);
+
+CREATE TABLE invoice_lines (
+    invoice_id INTEGER NOT NULL,
+    client_service_id INTEGER NOT NULL,
+    service_id INTEGER NOT NULL,
+    quantity BIGINT NOT NULL,
+    events INTEGER NOT NULL,
+    amount NUMERIC(14, 2) NOT NULL,
+    PRIMARY KEY (invoice_id, client_service_id),
+    FOREIGN KEY (invoice_id) REFERENCES invoices (id) ON DELETE CASCADE
+);
+
+CREATE TABLE billing_checkpoints (
+    client_id INTEGER NOT NULL,
+    last_usage_id BIGINT NOT NULL,
+    updated_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (client_id),
+    FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
+);
+
+CREATE TABLE billing_runs (
+    id SERIAL NOT NULL,
+    started_at TIMESTAMP WITHOUT TIME ZONE,
+    finished_at TIMESTAMP WITHOUT TIME ZONE,
+    status VARCHAR NOT NULL,
+    from_usage_id BIGINT NOT NULL,
+    to_usage_id BIGINT NOT NULL,
+    clients INTEGER NOT NULL,
+    usage_rows BIGINT NOT NULL,
+    error TEXT,
+    PRIMARY KEY (id)
+);
@@ -0,0 +1,5 @@
+-- Число событий в строке usage: буфер записи сворачивает события за минуту
+-- в одну строку. Существующие строки — по одному событию; значение по
+-- умолчанию константное, таблица не переписывается.
+
+ALTER TABLE usage ADD COLUMN IF NOT EXISTS events INTEGER NOT NULL DEFAULT 1;
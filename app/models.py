@@ -1,10 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, ForeignKey, Enum, Text, Numeric, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from database import Base
 import enum
 import datetime
 
-class UserRole(enum.Enum):
+class UserRole(str, enum.Enum):
     portal_admin = "portal_admin"
     client_admin = "client_admin"
     user = "user"
@@ -47,10 +48,127 @@ class ClientService(Base):
     client = relationship("Client", back_populates="client_services")
     service = relationship("Service")
 
+class Tariff(Base):
+    __tablename__ = "tariffs"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+    max_users = Column(Integer, nullable=False)
+    max_services = Column(Integer, nullable=False)
+    period_days = Column(Integer, nullable=False)
+    price = Column(Numeric(12, 2), nullable=False)
+    # Лимиты потребления для quota.py, например
+    # {"requests_per_second": 10, "burst": 20, "requests_per_day": 100000}
+    limits = Column(JSONB, nullable=True)
+
+class UserService(Base):
+    __tablename__ = "user_services"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    client_service_id = Column(Integer, ForeignKey("client_services.id", ondelete="CASCADE"), nullable=False)
+    granted_at = Column(DateTime, default=datetime.datetime.utcnow)
+    user = relationship("User")
+    client_service = relationship("ClientService")
+
 class Usage(Base):
+    # Таблица секционирована по месяцам usage_date (см. partitions.py),
+    # поэтому usage_date входит в первичный ключ
     __tablename__ = "usage"
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     client_service_id = Column(Integer, ForeignKey("client_services.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
-    usage_date = Column(DateTime, default=datetime.datetime.utcnow)
+    usage_date = Column(DateTime, primary_key=True, default=datetime.datetime.utcnow)
     usage_amount = Column(Integer)
+    # Сколько событий свёрнуто в строку (буфер usage_buffer.py пишет одну
+    # строку на минуту подключения и пользователя)
+    events = Column(Integer, nullable=False, default=1, server_default="1")
+    # Под курсорную пагинацию по (usage_date, id) в разрезе пользователя и подключения
+    __table_args__ = (
+        Index("ix_usage_user_date_id", "user_id", "usage_date", "id"),
+        Index("ix_usage_client_service_date_id", "client_service_id", "usage_date", "id"),
+        {"postgresql_partition_by": "RANGE (usage_date)"},
+    )
+
+class UsageDailyRollup(Base):
+    # Суточные итоги usage, обновляются инкрементально при каждой записи usage.
+    # client_id и service_id денормализованы, чтобы отчёты не делали join
+    __tablename__ = "usage_daily_rollups"
+    day = Column(Date, primary_key=True)
+    client_service_id = Column(Integer, ForeignKey("client_services.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    client_id = Column(Integer, nullable=False)
+    service_id = Column(Integer, nullable=False)
+    total_amount = Column(BigInteger, nullable=False, default=0)
+    events = Column(Integer, nullable=False, default=0)
+    __table_args__ = (
+        Index("ix_usage_daily_rollups_client_day", "client_id", "day"),
+        Index("ix_usage_daily_rollups_service_day", "service_id", "day"),
+        Index("ix_usage_daily_rollups_user_day", "user_id", "day"),
+    )
+
+class UserEntitlement(Base):
+    # Материализованный индекс прав: какие сервисы доступны пользователю
+    # через назначения user_services. Поддерживается инкрементально в тех же
+    # транзакциях, что и назначения (entitlements.py)
+    __tablename__ = "user_entitlements"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    client_service_id = Column(Integer, ForeignKey("client_services.id", ondelete="CASCADE"), primary_key=True)
+    service_id = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=True)
+
+class Invoice(Base):
+    # Счёт клиента за календарный месяц [period_start, period_end). Пока
+    # status = draft, суммы пересчитываются при каждом прогоне billing.py;
+    # final — закрыт, поздние события попадают в счёт текущего месяца
+    __tablename__ = "invoices"
+    id = Column(Integer, primary_key=True)
+    client_id = Column(Integer, ForeignKey("clients.id", ondelete="CASCADE"), nullable=False)
+    period_start = Column(Date, nullable=False)
+    period_end = Column(Date, nullable=False)
+    status = Column(String, nullable=False, default="draft")
+    # Тариф на момент расчёта (clients.tariff — строка, тариф может смениться)
+    tariff_id = Column(Integer, ForeignKey("tariffs.id", ondelete="SET NULL"), nullable=True)
+    tariff_name = Column(String, nullable=True)
+    unit_price = Column(Numeric(12, 6), nullable=False, default=0)
+    subscription_amount = Column(Numeric(14, 2), nullable=False, default=0)
+    usage_units = Column(BigInteger, nullable=False, default=0)
+    usage_amount = Column(Numeric(14, 2), nullable=False, default=0)
+    total_amount = Column(Numeric(14, 2), nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finalized_at = Column(DateTime, nullable=True)
+    lines = relationship("InvoiceLine", order_by="InvoiceLine.client_service_id")
+    __table_args__ = (
+        UniqueConstraint("client_id", "period_start", name="uq_invoices_client_period"),
+        Index("ix_invoices_period_id", "period_start", "id"),
+    )
+
+class InvoiceLine(Base):
+    # Потребление по подключению сервиса за период счёта. Без внешнего ключа
+    # на client_services: отключение сервиса не должно менять выставленный счёт
+    __tablename__ = "invoice_lines"
+    invoice_id = Column(Integer, ForeignKey("invoices.id", ondelete="CASCADE"), primary_key=True)
+    client_service_id = Column(Integer, primary_key=True)
+    service_id = Column(Integer, nullable=False)
+    quantity = Column(BigInteger, nullable=False, default=0)
+    events = Column(Integer, nullable=False, default=0)
+    amount = Column(Numeric(14, 2), nullable=False, default=0)
+
+class BillingCheckpoint(Base):
+    # До какого usage.id включительно потребление клиента уже учтено в счетах
+    __tablename__ = "billing_checkpoints"
+    client_id = Column(Integer, ForeignKey("clients.id", ondelete="CASCADE"), primary_key=True)
+    last_usage_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class BillingRun(Base):
+    # Журнал прогонов: (from_usage_id, to_usage_id] — обработанный диапазон usage.id
+    __tablename__ = "billing_runs"
+    id = Column(Integer, primary_key=True)
+    started_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    status = Column(String, nullable=False, default="running")
+    from_usage_id = Column(BigInteger, nullable=False, default=0)
+    to_usage_id = Column(BigInteger, nullable=False, default=0)
+    clients = Column(Integer, nullable=False, default=0)
+    usage_rows = Column(BigInteger, nullable=False, default=0)
+    error = Column(Text, nullable=True)
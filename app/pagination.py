@@ -0,0 +1,88 @@
+# app/pagination.py
+#
+# Курсорная (keyset) пагинация: страница продолжается с ключа последней
+# записи — WHERE (k1, k2) > (:v1, :v2) ORDER BY k1, k2 — вместо OFFSET,
+# поэтому глубокие страницы не замедляются. Курсор непрозрачен для клиента.
+
+import base64
+import binascii
+import datetime
+import json
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException, Query
+from sqlalchemy import BigInteger, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import config
+
+
+class PageParams:
+    # Зависимость FastAPI: ?cursor=...&limit=...
+    def __init__(
+        self,
+        cursor: Optional[str] = None,
+        limit: int = Query(config.PAGE_DEFAULT_LIMIT, ge=1, le=config.PAGE_MAX_LIMIT),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime.date) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _cursor_value(key, value: Any) -> Any:
+    # Значение из курсора приводится к типу столбца; всё, что не подходит, — ValueError
+    python_type = key.type.python_type
+    if python_type is datetime.datetime:
+        value = datetime.datetime.fromisoformat(value)
+        if value.tzinfo is not None:
+            # Столбцы хранят UTC без часового пояса
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return value
+    if python_type is datetime.date:
+        return datetime.date.fromisoformat(value)
+    if not isinstance(value, python_type) or isinstance(value, bool):
+        raise ValueError
+    if python_type is int:
+        bits = 63 if isinstance(key.type, BigInteger) else 31
+        if not -2 ** bits <= value < 2 ** bits:
+            raise ValueError
+    return value
+
+
+def decode_cursor(cursor: str, keys: Sequence) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError
+        return [_cursor_value(key, v) for key, v in zip(keys, values)]
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def page_of(items: list, next_cursor: Optional[str] = None) -> dict:
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def _selects_entity(query) -> bool:
+    descriptions = query.column_descriptions
+    return len(descriptions) == 1 and descriptions[0]["expr"] is descriptions[0]["entity"]
+
+
+async def fetch_page(db: AsyncSession, query, keys: Sequence, page: PageParams) -> dict:
+    # keys — столбцы уникального ключа сортировки, например (Usage.usage_date, Usage.id)
+    if page.cursor:
+        query = query.where(tuple_(*keys) > tuple_(*decode_cursor(page.cursor, keys)))
+    query = query.order_by(*keys).limit(page.limit + 1)
+    result = await db.execute(query)
+    # Запрос по сущности -> ORM-объекты, по набору столбцов -> строки Core
+    rows = list(result.scalars()) if _selects_entity(query) else result.all()
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        next_cursor = encode_cursor([getattr(rows[-1], key.key) for key in keys])
+    return page_of(rows, next_cursor)
@@ -0,0 +1,187 @@
+# app/partitions.py
+#
+# Помесячные секции таблицы usage (RANGE по usage_date). Секции создаются
+# заранее (USAGE_PARTITIONS_AHEAD месяцев вперёд) и по требованию — при
+# записи событий за месяц, секции которого ещё нет. Старые месяцы
+# отсоединяются через DETACH PARTITION ... CONCURRENTLY, не блокируя запись.
+# Суточные итоги (usage_daily_rollups) при этом остаются.
+#
+#   python partitions.py ensure [--ahead 3]   # окно приёма usage и месяцы вперёд (cron)
+#   python partitions.py list
+#   python partitions.py detach --before 2025-01 [--drop]
+#   python partitions.py convert     # перенос старой несекционированной usage
+
+import argparse
+import datetime
+import re
+from typing import Iterable, List, Set
+
+from sqlalchemy import text
+
+import config, models
+
+PARENT = models.Usage.__tablename__
+_NAME_RE = re.compile(rf"^{PARENT}_y(\d{{4}})m(\d{{2}})$")
+
+# Месяцы, секции которых в этом процессе уже точно существуют
+_known: Set[datetime.date] = set()
+
+
+def month_start(value: datetime.date) -> datetime.date:
+    return datetime.date(value.year, value.month, 1)
+
+
+def next_month(month: datetime.date) -> datetime.date:
+    return datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"{PARENT}_y{month.year:04d}m{month.month:02d}"
+
+
+def _create_sql(month: datetime.date):
+    return text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT} "
+        f"FOR VALUES FROM ('{month}') TO ('{next_month(month)}')"
+    )
+
+
+_EXISTS_SQL = text("SELECT to_regclass(:name) IS NOT NULL")
+
+_LIST_SQL = text(
+    "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+    "WHERE i.inhparent = to_regclass(:parent) ORDER BY c.relname"
+)
+
+
+def upcoming_months(ahead: int) -> List[datetime.date]:
+    month = month_start(datetime.datetime.utcnow().date())
+    months = [month]
+    for _ in range(ahead):
+        month = next_month(month)
+        months.append(month)
+    return months
+
+
+def accepted_months(ahead: int) -> List[datetime.date]:
+    # Месяцы, в которые может попасть принимаемое событие (окно
+    # USAGE_MAX_AGE_DAYS), и ahead месяцев вперёд
+    month = month_start(datetime.datetime.utcnow().date() - datetime.timedelta(days=config.USAGE_MAX_AGE_DAYS))
+    upcoming = upcoming_months(ahead)
+    months = []
+    while month < upcoming[0]:
+        months.append(month)
+        month = next_month(month)
+    return months + upcoming
+
+
+def _missing(dates: Iterable[datetime.date]) -> List[datetime.date]:
+    return sorted({month_start(d) for d in dates} - _known)
+
+
+async def ensure_for_dates(async_engine, dates: Iterable[datetime.date]) -> None:
+    # Отдельная короткая транзакция: CREATE ... PARTITION OF берёт сильную
+    # блокировку родителя, держать её вместе с пакетом записи нельзя.
+    # Секции окна приёма создаются заранее (migrate.py upgrade и cron с
+    # partitions.py ensure), здесь — только запасной путь. Вызывать до
+    # того, как сессия запроса взяла соединение: иначе запрос держит одно
+    # соединение пула и ждёт второе
+    months = _missing(dates)
+    if not months:
+        return
+    async with async_engine.begin() as conn:
+        for month in months:
+            if not await conn.scalar(_EXISTS_SQL, {"name": partition_name(month)}):
+                await conn.execute(_create_sql(month))
+    _known.update(months)
+
+
+def ensure_for_dates_sync(engine, dates: Iterable[datetime.date]) -> None:
+    months = _missing(dates)
+    if not months:
+        return
+    with engine.begin() as conn:
+        for month in months:
+            if not conn.scalar(_EXISTS_SQL, {"name": partition_name(month)}):
+                conn.execute(_create_sql(month))
+    _known.update(months)
+
+
+def list_partitions(engine) -> List[str]:
+    with engine.connect() as conn:
+        return list(conn.scalars(_LIST_SQL, {"parent": PARENT}))
+
+
+def detach_before(engine, before: datetime.date, drop: bool = False) -> List[str]:
+    # DETACH ... CONCURRENTLY нельзя выполнять внутри транзакции
+    names = []
+    for name in list_partitions(engine):
+        match = _NAME_RE.match(name)
+        if match and datetime.date(int(match.group(1)), int(match.group(2)), 1) < month_start(before):
+            names.append(name)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name in names:
+            conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name} CONCURRENTLY"))
+            if drop:
+                conn.execute(text(f"DROP TABLE {name}"))
+    _known.clear()
+    return names
+
+
+def convert_legacy(engine) -> bool:
+    # Одноразовый перенос несекционированной usage: старая таблица
+    # переименовывается в usage_legacy и остаётся для сверки
+    with engine.begin() as conn:
+        relkind = conn.scalar(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"), {"t": PARENT})
+        if relkind != "r":
+            return False
+        conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO {PARENT}_legacy"))
+        conn.execute(text(f"ALTER TABLE {PARENT}_legacy RENAME CONSTRAINT {PARENT}_pkey TO {PARENT}_legacy_pkey"))
+        conn.execute(text(f"ALTER SEQUENCE IF EXISTS {PARENT}_id_seq RENAME TO {PARENT}_legacy_id_seq"))
+        for index in models.Usage.__table__.indexes:
+            conn.execute(text(f"ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}_legacy"))
+        models.Usage.__table__.create(conn)
+        bounds = conn.execute(text(f"SELECT min(usage_date), max(usage_date) FROM {PARENT}_legacy")).one()
+        if bounds[0] is not None:
+            month, last = month_start(bounds[0].date()), month_start(bounds[1].date())
+            while month <= last:
+                conn.execute(_create_sql(month))
+                month = next_month(month)
+        for month in upcoming_months(config.USAGE_PARTITIONS_AHEAD):
+            conn.execute(_create_sql(month))
+        conn.execute(text(
+            f"INSERT INTO {PARENT} (id, client_service_id, user_id, usage_date, usage_amount) "
+            f"SELECT id, client_service_id, user_id, coalesce(usage_date, now()), usage_amount FROM {PARENT}_legacy"
+        ))
+        conn.execute(text(f"SELECT setval('{PARENT}_id_seq', coalesce((SELECT max(id) FROM {PARENT}), 0) + 1, false)"))
+    return True
+
+
+def main():
+    import database
+
+    parser = argparse.ArgumentParser(description="Секции таблицы usage")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure")
+    ensure.add_argument("--ahead", type=int, default=config.USAGE_PARTITIONS_AHEAD)
+    commands.add_parser("list")
+    detach = commands.add_parser("detach")
+    detach.add_argument("--before", required=True, help="YYYY-MM: отсоединить все месяцы раньше этого")
+    detach.add_argument("--drop", action="store_true")
+    commands.add_parser("convert")
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        ensure_for_dates_sync(database.engine, accepted_months(args.ahead))
+    elif args.command == "list":
+        print("\n".join(list_partitions(database.engine)))
+    elif args.command == "detach":
+        before = datetime.datetime.strptime(args.before, "%Y-%m").date()
+        for name in detach_before(database.engine, before, drop=args.drop):
+            print(name)
+    elif args.command == "convert":
+        print("converted" if convert_legacy(database.engine) else "already partitioned")
+
+
+if __name__ == "__main__":
+    main()
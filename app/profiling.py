@@ -0,0 +1,192 @@
+# app/profiling.py
+#
+# Профилирование SQL по запросам. События before/after_cursor_execute обоих
+# движков (database.py) считают запросы и время в БД и относят их к
+# текущему HTTP-запросу через contextvar. По каждому маршруту копится
+# статистика в памяти процесса (GET /admin/db/profile). Запросы дольше
+# SQL_SLOW_QUERY_MS пишутся в лог вместе с маршрутом и параметрами.
+# Одинаковые по форме запросы (текст SQL без значений параметров),
+# повторённые в одном HTTP-запросе SQL_N_PLUS_ONE_THRESHOLD и более раз,
+# помечаются как вероятный N+1. При DEBUG итоги запроса отдаются в
+# заголовках X-DB-Queries, X-DB-Time-Ms и X-DB-N-Plus-One.
+
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, Optional
+
+from sqlalchemy import event
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Плейсхолдеры asyncpg ($1) и psycopg2 (%(name)s), списки IN (...) любой длины
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|%s")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+def statement_shape(statement: str) -> str:
+    shape = _PLACEHOLDER.sub("?", statement)
+    shape = _PLACEHOLDER_LIST.sub("?, ...", shape)
+    return " ".join(shape.split())
+
+
+class RequestProfile:
+    __slots__ = ("route", "queries", "db_time", "shapes")
+
+    def __init__(self, route: str):
+        self.route = route
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes: Counter = Counter()
+
+    def n_plus_one(self) -> Dict[str, int]:
+        threshold = config.SQL_N_PLUS_ONE_THRESHOLD
+        return {shape: count for shape, count in self.shapes.items() if count >= threshold}
+
+
+_current: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar("sql_profile", default=None)
+
+
+class ProfileStats:
+    # Накопленная статистика процесса: по маршрутам, медленные запросы, N+1
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.routes: Dict[str, dict] = {}
+            self.slow = deque(maxlen=config.SQL_PROFILE_LOG_SIZE)
+            self.n_plus_one = deque(maxlen=config.SQL_PROFILE_LOG_SIZE)
+
+    def record_slow(self, route: str, duration: float, statement: str, parameters) -> None:
+        with self._lock:
+            self.slow.append({
+                "at": time.time(),
+                "route": route,
+                "ms": round(duration * 1000, 3),
+                "statement": statement,
+                "parameters": parameters,
+            })
+
+    def record_request(self, profile: RequestProfile) -> None:
+        suspects = profile.n_plus_one()
+        with self._lock:
+            route = self.routes.setdefault(profile.route, {
+                "requests": 0, "queries": 0, "queries_max": 0,
+                "db_time_total_ms": 0.0, "db_time_max_ms": 0.0, "n_plus_one": 0,
+            })
+            db_ms = profile.db_time * 1000
+            route["requests"] += 1
+            route["queries"] += profile.queries
+            route["queries_max"] = max(route["queries_max"], profile.queries)
+            route["db_time_total_ms"] = round(route["db_time_total_ms"] + db_ms, 3)
+            route["db_time_max_ms"] = round(max(route["db_time_max_ms"], db_ms), 3)
+            if suspects:
+                route["n_plus_one"] += 1
+                for shape, count in suspects.items():
+                    self.n_plus_one.append({"at": time.time(), "route": profile.route, "count": count, "statement": shape})
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            routes = {
+                name: {
+                    **stats,
+                    "queries_avg": round(stats["queries"] / stats["requests"], 2),
+                    "db_time_avg_ms": round(stats["db_time_total_ms"] / stats["requests"], 3),
+                }
+                for name, stats in sorted(self.routes.items(), key=lambda item: -item[1]["db_time_total_ms"])
+            }
+            return {"routes": routes, "slow_queries": list(self.slow), "n_plus_one": list(self.n_plus_one)}
+
+
+stats = ProfileStats()
+
+
+def _parameters(statement: str, parameters) -> str:
+    # Хэши паролей в лог не попадают; длинные пачки параметров обрезаются
+    if "password_hash" in statement:
+        return "<hidden>"
+    text = repr(parameters)
+    return text if len(text) <= 500 else text[:500] + "..."
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start"].pop()
+    profile = _current.get()
+    if profile is not None:
+        profile.queries += 1
+        profile.db_time += duration
+        profile.shapes[statement_shape(statement)] += 1
+    if duration * 1000 >= config.SQL_SLOW_QUERY_MS:
+        route = profile.route if profile is not None else "-"
+        params = _parameters(statement, parameters)
+        logger.warning("slow query %.1f ms [%s]: %s; parameters=%s", duration * 1000, route, statement, params)
+        stats.record_slow(route, duration, statement, params)
+
+
+def _handle_error(exception_context):
+    # Запрос упал: снимаем метку времени, чтобы стек не рос
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+def instrument(engine) -> None:
+    """Подключает счётчики к движку (для async — к engine.sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def route_template(scope) -> str:
+    # Шаблон пути известен только после маршрутизации: FastAPI кладёт route
+    # в scope; у служебных маршрутов Starlette (/docs, /openapi.json) без
+    # параметров шаблон совпадает с путём. Несовпавшие пути сводятся в одну
+    # строку, чтобы не раздувать статистику
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    return scope["path"] if "endpoint" in scope else "unmatched"
+
+
+class SQLProfileMiddleware:
+    """ASGI-middleware: открывает профиль на HTTP-запрос и сводит итоги."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile(f"{scope['method']} {scope['path']}")
+        token = _current.set(profile)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start" and config.DEBUG:
+                suspects = profile.n_plus_one()
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(profile.queries).encode()))
+                headers.append((b"x-db-time-ms", f"{profile.db_time * 1000:.3f}".encode()))
+                headers.append((b"x-db-n-plus-one", str(max(suspects.values(), default=0)).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            profile.route = f"{scope['method']} {route_template(scope)}"
+            stats.record_request(profile)
+            for shape, count in profile.n_plus_one().items():
+                logger.warning("possible N+1 [%s]: %d x %s", profile.route, count, shape)
@@ -0,0 +1,175 @@
+# app/quota.py
+#
+# Проверка квот в реальном времени. Лимиты берутся из tariffs.limits тарифа
+# клиента и применяются к каждому подключению (client_service):
+#   requests_per_second + burst — token bucket,
+#   requests_per_day — счётчик за текущие сутки UTC.
+# Состояние хранится в Redis и обновляется одним Lua-скриптом атомарно,
+# так что решение не требует обращений к таблице usage. Настройки лимитов
+# кэшируются в памяти процесса и сбрасываются при изменении тарифов,
+# клиентов и подключений (через catalog_cache).
+
+import datetime
+import logging
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Response
+from redis.exceptions import RedisError
+
+import catalog_cache, config, crud_async, database, redis_client, schemas
+from auth import require_role
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/quota", tags=["quota"])
+
+# KEYS[1] — ведро токенов (hash tokens/ts), KEYS[2] — счётчик за сутки
+# ARGV: rate (токенов/с, 0 — нет), burst, daily (0 — нет), cost, ttl счётчика (с)
+# Ответ: {allowed, tokens, retry_after_ms, daily_used}
+_CHECK_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local daily = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local tokens = -1
+if rate > 0 then
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+    if tokens < cost then
+        return {0, math.floor(tokens), math.ceil((cost - tokens) * 1000 / rate), -1}
+    end
+end
+
+local used = -1
+if daily > 0 then
+    used = tonumber(redis.call('GET', KEYS[2]) or '0')
+    if used + cost > daily then
+        return {0, math.floor(tokens), -1, used}
+    end
+    used = redis.call('INCRBY', KEYS[2], cost)
+    if used == cost then
+        redis.call('EXPIRE', KEYS[2], tonumber(ARGV[5]))
+    end
+end
+
+if rate > 0 then
+    tokens = tokens - cost
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+end
+return {1, math.floor(tokens), 0, used}
+"""
+
+_script = None
+
+
+@dataclass(frozen=True)
+class QuotaLimits:
+    rate: float
+    burst: int
+    daily: int
+    expires_at: Optional[datetime.datetime]
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0 and self.daily <= 0
+
+
+# client_service_id -> QuotaLimits
+_limits_cache = TTLCache(config.QUOTA_CONFIG_SIZE, config.QUOTA_CONFIG_TTL)
+for _kind in (catalog_cache.TARIFFS, catalog_cache.CLIENTS, catalog_cache.CLIENT_SERVICES):
+    catalog_cache.on_invalidate(_kind, lambda key: _limits_cache.clear())
+
+
+def _parse_limits(expires_at, limits: Optional[dict]) -> QuotaLimits:
+    limits = limits or {}
+    rate = float(limits.get("requests_per_second") or 0)
+    burst = int(limits.get("burst") or max(1, math.ceil(rate)))
+    return QuotaLimits(rate, burst, int(limits.get("requests_per_day") or 0), expires_at)
+
+
+async def get_limits(client_service_id: int) -> Optional[QuotaLimits]:
+    cached = _limits_cache.get(client_service_id)
+    if cached is not None:
+        return cached
+    generation = _limits_cache.generation
+    # Сессия открывается только при промахе кэша
+    async with database.AsyncSessionLocal() as db:
+        row = await crud_async.get_quota_limits(db, client_service_id)
+    if row is None:
+        return None
+    limits = _parse_limits(row.expires_at, row.limits)
+    _limits_cache.set(client_service_id, limits, generation=generation)
+    return limits
+
+
+def _seconds_to_midnight(now: datetime.datetime) -> float:
+    tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+    return (tomorrow - now).total_seconds()
+
+
+async def check(client_service_id: int, cost: int = 1) -> Optional[schemas.QuotaDecision]:
+    """Списывает cost из квоты подключения; None, если подключения нет."""
+    global _script
+    limits = await get_limits(client_service_id)
+    if limits is None:
+        return None
+    now = datetime.datetime.utcnow()
+    if limits.expires_at is not None and now > limits.expires_at:
+        return schemas.QuotaDecision(allowed=False, reason="expired")
+    if limits.unlimited:
+        return schemas.QuotaDecision(allowed=True)
+
+    redis = redis_client.get_redis()
+    if _script is None or _script.registered_client is not redis:
+        _script = redis.register_script(_CHECK_SCRIPT)
+    keys = [
+        f"quota:{{{client_service_id}}}:bucket",
+        f"quota:{{{client_service_id}}}:day:{now:%Y%m%d}",
+    ]
+    try:
+        allowed, tokens, retry_ms, used = await _script(
+            keys=keys,
+            args=[limits.rate, limits.burst, limits.daily, cost, 2 * 86400],
+        )
+    except RedisError:
+        logger.warning("quota: redis unavailable, fail_open=%s", config.QUOTA_FAIL_OPEN, exc_info=True)
+        return schemas.QuotaDecision(allowed=config.QUOTA_FAIL_OPEN, reason="quota_unavailable")
+
+    decision = schemas.QuotaDecision(
+        allowed=bool(allowed),
+        remaining=tokens if limits.rate > 0 else None,
+        daily_remaining=limits.daily - used if limits.daily > 0 and used >= 0 else None,
+    )
+    if not allowed:
+        if retry_ms >= 0:
+            decision.reason = "rate_limited"
+            decision.retry_after = retry_ms / 1000
+        else:
+            decision.reason = "daily_quota_exceeded"
+            decision.retry_after = _seconds_to_midnight(now)
+    return decision
+
+
+@router.post(
+    "/check",
+    response_model=schemas.QuotaDecision,
+    dependencies=[Depends(require_role(schemas.UserRole.portal_admin))]
+)
+async def check_quota(payload: schemas.QuotaCheck, response: Response):
+    # Вызывается шлюзом на каждый запрос клиента: решение в ответе,
+    # статус 200 и при отказе (Retry-After подсказывает, когда повторить)
+    decision = await check(payload.client_service_id, payload.cost)
+    if decision is None:
+        raise HTTPException(status_code=404, detail="ClientService not found")
+    if decision.retry_after is not None:
+        response.headers["Retry-After"] = str(math.ceil(decision.retry_after))
+    return decision
@@ -0,0 +1,44 @@
+# app/redis_client.py
+#
+# Общий асинхронный клиент Redis процесса. Соединение создаётся лениво,
+# ошибки Redis вызывающий код обрабатывает сам (как правило — идёт в БД).
+
+from typing import Optional
+
+import redis.asyncio as redis
+
+import config
+
+_client: Optional[redis.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis(
+            host=config.REDIS_HOST,
+            port=config.REDIS_PORT,
+            db=config.REDIS_DB,
+            socket_timeout=config.REDIS_TIMEOUT,
+            socket_connect_timeout=config.REDIS_TIMEOUT,
+        )
+    return _client
+
+
+def pubsub() -> redis.client.PubSub:
+    # Подписка держит соединение открытым без ограничения времени чтения,
+    # поэтому ей нужен отдельный клиент без socket_timeout
+    client = redis.Redis(
+        host=config.REDIS_HOST,
+        port=config.REDIS_PORT,
+        db=config.REDIS_DB,
+        socket_connect_timeout=config.REDIS_TIMEOUT,
+    )
+    return client.pubsub()
+
+
+async def close() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
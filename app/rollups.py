@@ -0,0 +1,237 @@
+# app/rollups.py
+#
+# Инкрементальные суточные итоги usage (таблица usage_daily_rollups) и
+# запросы агрегированных отчётов поверх них. Недели и месяцы считаются
+# из суточных строк, сырая таблица usage в отчётах не читается.
+
+import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Date, cast, delete, func, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import models, schemas
+
+Rollup = models.UsageDailyRollup
+
+
+def aggregate(rows: Iterable[tuple], client_services: Dict[int, tuple]) -> List[dict]:
+    # rows: (client_service_id, user_id, usage_date, usage_amount, events);
+    # client_services: client_service_id -> (client_id, service_id)
+    totals: Dict[Tuple[datetime.date, int, int], List[int]] = {}
+    for cs_id, user_id, usage_date, amount, events in rows:
+        key = (usage_date.date(), cs_id, user_id)
+        bucket = totals.setdefault(key, [0, 0])
+        bucket[0] += amount
+        bucket[1] += events
+    # Сортировка по ключу: параллельные пакеты блокируют строки в одном порядке
+    return [
+        {
+            "day": day,
+            "client_service_id": cs_id,
+            "user_id": user_id,
+            "client_id": client_services[cs_id][0],
+            "service_id": client_services[cs_id][1],
+            "total_amount": amount,
+            "events": events,
+        }
+        for (day, cs_id, user_id), (amount, events) in sorted(totals.items())
+    ]
+
+
+_UPSERT_SQL = text(f"""
+INSERT INTO {Rollup.__tablename__} (day, client_service_id, user_id, client_id, service_id, total_amount, events)
+SELECT * FROM unnest(CAST(:days AS date[]), CAST(:client_service_ids AS integer[]), CAST(:user_ids AS integer[]),
+                     CAST(:client_ids AS integer[]), CAST(:service_ids AS integer[]),
+                     CAST(:totals AS bigint[]), CAST(:events AS integer[]))
+ON CONFLICT (day, client_service_id, user_id) DO UPDATE
+SET total_amount = {Rollup.__tablename__}.total_amount + excluded.total_amount,
+    events = {Rollup.__tablename__}.events + excluded.events
+""")
+
+
+def upsert_statement(records: List[dict]):
+    # Столбцы передаются массивами через unnest: семь параметров на любой
+    # размер пакета (многострочный VALUES упирается в лимит 32767 параметров asyncpg)
+    return _UPSERT_SQL.bindparams(
+        days=[r["day"] for r in records],
+        client_service_ids=[r["client_service_id"] for r in records],
+        user_ids=[r["user_id"] for r in records],
+        client_ids=[r["client_id"] for r in records],
+        service_ids=[r["service_id"] for r in records],
+        totals=[r["total_amount"] for r in records],
+        events=[r["events"] for r in records],
+    )
+
+
+def rebuild_statements() -> list:
+    # Полный пересчёт из сырой таблицы (первичное заполнение, восстановление).
+    # SHARE-блокировка usage не даёт записям проскочить между DELETE и INSERT
+    day = cast(models.Usage.usage_date, Date)
+    source = (
+        select(
+            day,
+            models.Usage.client_service_id,
+            models.Usage.user_id,
+            models.ClientService.client_id,
+            models.ClientService.service_id,
+            func.sum(models.Usage.usage_amount),
+            func.sum(models.Usage.events),
+        )
+        .join(models.ClientService, models.ClientService.id == models.Usage.client_service_id)
+        .group_by(day, models.Usage.client_service_id, models.Usage.user_id,
+                  models.ClientService.client_id, models.ClientService.service_id)
+    )
+    return [
+        text(f"LOCK TABLE {models.Usage.__tablename__} IN SHARE MODE"),
+        delete(Rollup),
+        pg_insert(Rollup).from_select(
+            ["day", "client_service_id", "user_id", "client_id", "service_id", "total_amount", "events"],
+            source,
+        ),
+    ]
+
+
+_GROUP_COLUMNS = {
+    schemas.UsageGroupBy.service: Rollup.service_id,
+    schemas.UsageGroupBy.user: Rollup.user_id,
+    schemas.UsageGroupBy.client: Rollup.client_id,
+}
+
+
+def summary_query(
+    granularity: schemas.UsageGranularity,
+    group_by: Optional[schemas.UsageGroupBy],
+    *filters,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+):
+    if granularity == schemas.UsageGranularity.day:
+        period = Rollup.day
+    else:
+        # Литерал, а не параметр: выражение в SELECT и GROUP BY должно совпадать
+        period = cast(func.date_trunc(literal_column(f"'{granularity.value}'"), Rollup.day), Date)
+    columns = [period.label("period")]
+    group = [period]
+    if group_by is not None:
+        key = _GROUP_COLUMNS[group_by]
+        columns.append(key.label("key"))
+        group.append(key)
+    query = select(
+        *columns,
+        func.sum(Rollup.total_amount).label("total_amount"),
+        func.sum(Rollup.events).label("events"),
+    ).where(*filters)
+    if date_from is not None:
+        query = query.where(Rollup.day >= date_from)
+    if date_to is not None:
+        query = query.where(Rollup.day <= date_to)
+    return query.group_by(*group).order_by(*group)
+
+
+# ---------------------
+# Аналитика по суточным итогам: top-N, распределения суточного потребления
+# (перцентили, гистограмма) и скользящее среднее. Всё считается в Postgres
+# (percentile_cont, width_bucket, оконные функции) — наружу уходят только
+# итоговые строки. Дни без использования входят в расчёт нулями.
+# ---------------------
+
+_KEY_COLUMNS = {
+    schemas.UsageGroupBy.service: "service_id",
+    schemas.UsageGroupBy.user: "user_id",
+    schemas.UsageGroupBy.client: "client_id",
+}
+_SCOPE_COLUMNS = ("client_id", "service_id", "user_id")
+
+
+def _scope_sql(scope: Dict[str, int]) -> Tuple[str, dict]:
+    # Имена столбцов — только из белого списка, значения — параметрами
+    conditions, params = [], {}
+    for column, value in scope.items():
+        if column not in _SCOPE_COLUMNS:
+            raise ValueError(f"unsupported scope column {column}")
+        conditions.append(f"{column} = :scope_{column}")
+        params[f"scope_{column}"] = value
+    return " AND ".join(conditions + ["day BETWEEN :date_from AND :date_to"]), params
+
+
+def _filled_daily_sql(key: str, where: str) -> str:
+    # daily — суточные суммы по ключу; filled — те же ряды с нулями за дни
+    # без использования (ключи — только встречавшиеся в периоде). GROUP BY
+    # по имени выходного столбца: key может быть и константой
+    return f"""
+daily AS (
+    SELECT {key} AS key, day, sum(total_amount) AS amount
+    FROM usage_daily_rollups
+    WHERE {where}
+    GROUP BY key, day
+),
+filled AS (
+    SELECT k.key, d.day::date AS day, coalesce(daily.amount, 0) AS amount
+    FROM (SELECT DISTINCT key FROM daily) AS k
+    CROSS JOIN generate_series(CAST(:date_from AS date), CAST(:date_to AS date), interval '1 day') AS d(day)
+    LEFT JOIN daily ON daily.key = k.key AND daily.day = d.day::date
+)"""
+
+
+def top_query(by: schemas.UsageGroupBy, scope: Dict[str, int], date_from: datetime.date,
+              date_to: datetime.date, limit: int):
+    """Top-N ключей по сумме потребления; grand_total — сумма по всем ключам."""
+    key = _KEY_COLUMNS[by]
+    where, params = _scope_sql(scope)
+    return text(f"""
+SELECT {key} AS key, sum(total_amount) AS total_amount, sum(events) AS events,
+       sum(sum(total_amount)) OVER () AS grand_total
+FROM usage_daily_rollups
+WHERE {where}
+GROUP BY {key}
+ORDER BY total_amount DESC, key
+LIMIT :limit
+""").bindparams(**params, date_from=date_from, date_to=date_to, limit=limit)
+
+
+def distribution_query(group_by: schemas.UsageGroupBy, scope: Dict[str, int], date_from: datetime.date,
+                       date_to: datetime.date, fractions: List[float], buckets: int):
+    """Распределение суточного потребления по ключам: min/max/среднее,
+    перцентили (percentile_cont) и гистограмма из buckets равных интервалов
+    [0, max] (width_bucket, в ответе — объект номер_интервала -> число дней)."""
+    where, params = _scope_sql(scope)
+    return text(f"""
+WITH {_filled_daily_sql(_KEY_COLUMNS[group_by], where)},
+stats AS (
+    SELECT key, count(*) AS days, sum(amount) AS total_amount, avg(amount) AS mean,
+           min(amount) AS min, max(amount) AS max,
+           percentile_cont(CAST(:fractions AS float8[])) WITHIN GROUP (ORDER BY amount) AS percentiles
+    FROM filled
+    GROUP BY key
+),
+histogram AS (
+    SELECT key, json_object_agg(bucket, days) AS histogram
+    FROM (
+        SELECT f.key, width_bucket(f.amount, 0, s.max + 1, :buckets) AS bucket, count(*) AS days
+        FROM filled AS f JOIN stats AS s USING (key)
+        GROUP BY f.key, bucket
+    ) AS counts
+    GROUP BY key
+)
+SELECT stats.*, histogram.histogram
+FROM stats JOIN histogram USING (key)
+ORDER BY stats.total_amount DESC, key
+""").bindparams(**params, date_from=date_from, date_to=date_to, fractions=fractions, buckets=buckets)
+
+
+def trend_query(group_by: Optional[schemas.UsageGroupBy], scope: Dict[str, int], date_from: datetime.date,
+                date_to: datetime.date, window: int):
+    """Суточные суммы и скользящее среднее за window дней (по каждому ключу
+    отдельно). Первые window-1 дней периода усредняются по меньшему числу дней."""
+    where, params = _scope_sql(scope)
+    # Без группировки все строки сводятся в один ряд с ключом 0
+    key = _KEY_COLUMNS[group_by] if group_by is not None else "0"
+    return text(f"""
+WITH {_filled_daily_sql(key, where)}
+SELECT key, day AS period, amount AS total_amount,
+       avg(amount) OVER (PARTITION BY key ORDER BY day ROWS BETWEEN {int(window) - 1} PRECEDING AND CURRENT ROW)
+           AS moving_avg
+FROM filled
+ORDER BY key, day
+""").bindparams(**params, date_from=date_from, date_to=date_to)
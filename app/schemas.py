@@ -1,10 +1,21 @@
 # app/schemas.py
 
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator, model_validator
+from typing import Dict, Generic, List, Optional, TypeVar
 from enum import Enum
 import datetime
 
+# Максимум записей в одном POST /usage/batch
+USAGE_BATCH_MAX = 10000
+
+T = TypeVar("T")
+
+# Страница списка с курсором на следующую (см. pagination.py);
+# одинаковая форма ответа у всех списковых маршрутов
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
 # Повторяем enum ролей из models.py
 class UserRole(str, Enum):
     portal_admin = "portal_admin"
@@ -25,8 +36,7 @@ class ClientRead(ClientBase):
     id: int
     created_at: datetime.datetime
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # ---------------------
 # User
@@ -44,8 +54,24 @@ class UserRead(UserBase):
     id: int
     client_id: Optional[int]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class ImportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+class UserImportRow(BaseModel):
+    # Номер строки данных в файле (с 1, без заголовка CSV)
+    row: int
+    username: Optional[str] = None
+    status: str  # created | error
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class UserImportResult(BaseModel):
+    created: int
+    failed: int
+    rows: List[UserImportRow]
 
 # ---------------------
 # Service
@@ -60,8 +86,7 @@ class ServiceCreate(ServiceBase):
 class ServiceRead(ServiceBase):
     id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # ---------------------
 # ClientService (подключённый сервис клиента)
@@ -78,8 +103,7 @@ class ClientServiceRead(ClientServiceBase):
     id: int
     connected_at: datetime.datetime
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # ---------------------
 # Usage (отчётность)
@@ -90,14 +114,108 @@ class UsageBase(BaseModel):
     usage_amount: int
 
 class UsageCreate(UsageBase):
-    ...
+    # Время события на шлюзе; если не передано — время записи
+    usage_date: Optional[datetime.datetime] = None
+
+    @field_validator("usage_date")
+    @classmethod
+    def naive_utc(cls, value: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+        # В БД usage_date хранится как UTC без часового пояса
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return value
 
 class UsageRead(UsageBase):
     id: int
     usage_date: datetime.datetime
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class UsageBatchCreate(BaseModel):
+    items: List[UsageCreate] = Field(..., min_length=1, max_length=USAGE_BATCH_MAX)
+
+class UsageBatchError(BaseModel):
+    index: int
+    detail: str
+
+class UsageBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    errors: List[UsageBatchError] = []
+
+class UsageGranularity(str, Enum):
+    day = "day"
+    week = "week"
+    month = "month"
+
+class UsageGroupBy(str, Enum):
+    service = "service"
+    user = "user"
+    client = "client"
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+class UsageSummaryRow(BaseModel):
+    period: datetime.date
+    # service_id / user_id / client_id — в зависимости от group_by
+    key: Optional[int] = None
+    total_amount: int
+    events: int
+
+class UsageSummary(BaseModel):
+    granularity: UsageGranularity
+    group_by: Optional[UsageGroupBy] = None
+    rows: List[UsageSummaryRow]
+
+# Аналитика по суточным итогам (rollups.py): key — service_id / user_id
+# в зависимости от by / group_by
+class UsageTopRow(BaseModel):
+    key: int
+    total_amount: int
+    events: int
+    # Доля в общем потреблении за период
+    share: float
+
+class UsageTop(BaseModel):
+    by: UsageGroupBy
+    date_from: datetime.date
+    date_to: datetime.date
+    total_amount: int
+    rows: List[UsageTopRow]
+
+class UsageDistributionRow(BaseModel):
+    key: int
+    days: int
+    total_amount: int
+    mean: float
+    min: int
+    max: int
+    # "p50", "p95", ... -> суточное потребление
+    percentiles: Dict[str, float]
+    # Число дней в каждом из интервалов равной ширины от 0 до max
+    histogram: List[int]
+    bucket_width: float
+
+class UsageDistribution(BaseModel):
+    group_by: UsageGroupBy
+    date_from: datetime.date
+    date_to: datetime.date
+    rows: List[UsageDistributionRow]
+
+class UsageTrendRow(BaseModel):
+    period: datetime.date
+    key: Optional[int] = None
+    total_amount: int
+    moving_avg: float
+
+class UsageTrend(BaseModel):
+    group_by: Optional[UsageGroupBy] = None
+    window: int
+    date_from: datetime.date
+    date_to: datetime.date
+    rows: List[UsageTrendRow]
 
 # ---------------------
 # Auth (JWT)
@@ -105,6 +223,13 @@ class UsageRead(UsageBase):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class SessionsRevoked(BaseModel):
+    revoked: int
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -113,12 +238,21 @@ class TokenData(BaseModel):
 # ---------------------
 # Tariff
 # ---------------------
+class TariffLimits(BaseModel):
+    # Отсутствующий лимит не проверяется
+    requests_per_second: Optional[float] = Field(None, gt=0)
+    burst: Optional[int] = Field(None, ge=1)
+    requests_per_day: Optional[int] = Field(None, ge=1)
+    # Цена единицы usage_amount при расчёте счетов (billing.py)
+    unit_price: Optional[float] = Field(None, ge=0)
+
 class TariffBase(BaseModel):
     name: str
     max_users: int
     max_services: int
     period_days: int
     price: float
+    limits: Optional[TariffLimits] = None
 
 class TariffCreate(TariffBase):
     ...
@@ -126,8 +260,7 @@ class TariffCreate(TariffBase):
 class TariffRead(TariffBase):
     id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # ---------------------
 # UserService (назначение пользователю сервиса)
@@ -142,5 +275,98 @@ class UserServiceCreate(UserServiceBase):
 class UserServiceRead(UserServiceBase):
     id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+# Массовое назначение/отзыв: user_ids или all_users (все пользователи клиента)
+USER_SERVICE_BULK_MAX = 50000
+
+class UserServiceBulk(BaseModel):
+    client_service_ids: List[int] = Field(..., min_length=1, max_length=100)
+    user_ids: Optional[List[int]] = Field(None, min_length=1, max_length=USER_SERVICE_BULK_MAX)
+    all_users: bool = False
+
+    @model_validator(mode="after")
+    def _one_target(self):
+        if (self.user_ids is None) == (not self.all_users):
+            raise ValueError("Specify either user_ids or all_users=true")
+        return self
+
+class UserServiceBulkItem(BaseModel):
+    client_service_id: int
+    changed: int
+
+class UserServiceBulkResult(BaseModel):
+    changed: int
+    items: List[UserServiceBulkItem]
+
+# ---------------------
+# Quota (проверка лимитов шлюзом)
+# ---------------------
+class QuotaCheck(BaseModel):
+    client_service_id: int
+    cost: int = Field(1, ge=1)
+
+class QuotaDecision(BaseModel):
+    allowed: bool
+    reason: Optional[str] = None
+    # Остаток токенов в ведре и дневной остаток; None — лимит не задан
+    remaining: Optional[int] = None
+    daily_remaining: Optional[int] = None
+    retry_after: Optional[float] = None
+
+# ---------------------
+# Authz (проверка доступа шлюзом)
+# ---------------------
+class AuthzDecision(BaseModel):
+    allowed: bool
+    reason: Optional[str] = None
+
+# ---------------------
+# Invoice (счета, billing.py)
+# ---------------------
+class InvoiceStatus(str, Enum):
+    draft = "draft"
+    final = "final"
+
+class InvoiceLineRead(BaseModel):
+    client_service_id: int
+    service_id: int
+    quantity: int
+    events: int
+    amount: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+class InvoiceRead(BaseModel):
+    id: int
+    client_id: int
+    period_start: datetime.date
+    period_end: datetime.date
+    status: InvoiceStatus
+    tariff_id: Optional[int] = None
+    tariff_name: Optional[str] = None
+    unit_price: float
+    subscription_amount: float
+    usage_units: int
+    usage_amount: float
+    total_amount: float
+    updated_at: Optional[datetime.datetime] = None
+    finalized_at: Optional[datetime.datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class InvoiceDetail(InvoiceRead):
+    lines: List[InvoiceLineRead]
+
+class BillingRunRead(BaseModel):
+    id: int
+    started_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+    status: str
+    from_usage_id: int
+    to_usage_id: int
+    clients: int
+    usage_rows: int
+    error: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
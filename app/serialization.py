@@ -0,0 +1,36 @@
+# app/serialization.py
+#
+# Быстрый путь ответа для больших списков. Обычный путь FastAPI для
+# response_model: валидация возвращённых объектов, затем jsonable_encoder
+# и json.dumps — три прохода по данным в Python. Здесь страница один раз
+# валидируется заранее собранным TypeAdapter (from_attributes, строки Core
+# вместо ORM-объектов) и сериализуется в JSON сразу в pydantic-core.
+# Возвращённый Response FastAPI отдаёт как есть; response_model в
+# декораторе остаётся для схемы OpenAPI.
+
+from functools import lru_cache
+from typing import Any, List, Type
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+import schemas
+
+
+class JSONBytesResponse(Response):
+    media_type = "application/json"
+
+
+def columns_for(model: type, schema: Type[BaseModel]) -> List[Any]:
+    # Только столбцы, которые попадут в ответ (без password_hash и т.п.)
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+@lru_cache(maxsize=None)
+def page_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(schemas.Page[schema])
+
+
+def page_response(schema: Type[BaseModel], page: dict) -> JSONBytesResponse:
+    adapter = page_adapter(schema)
+    return JSONBytesResponse(adapter.dump_json(adapter.validate_python(page, from_attributes=True)))
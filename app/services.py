@@ -1,65 +1,76 @@
 # app/routers/services.py
 
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-
-import schemas, crud, database, models
+import catalog_cache, etags, schemas, crud_async, database, models
 from auth import get_current_user, require_role
+from loader import Loader, get_loader
+from pagination import PageParams
 
 router = APIRouter(
     prefix="/services",
     tags=["services"],
 )
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post(
     "/",
     response_model=schemas.ServiceRead,
     status_code=status.HTTP_201_CREATED,
     dependencies=[Depends(require_role(schemas.UserRole.portal_admin))]
 )
-def create_service(
+async def create_service(
     service_in: schemas.ServiceCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     # Проверка на уникальность по имени
-    existing = crud.get_service_by_name(db, service_in.name) if hasattr(crud, "get_service_by_name") else crud.get_service(db, service_in.name)
+    existing = await crud_async.get_service_by_name(db, service_in.name)
     if existing:
         raise HTTPException(status_code=400, detail="Сервис с таким именем уже существует")
-    return crud.create_service(db, service_in)
+    return await crud_async.create_service(db, service_in)
 
 @router.get(
     "/",
-    response_model=List[schemas.ServiceRead],
+    response_model=schemas.Page[schemas.ServiceRead],
     dependencies=[Depends(get_current_user)]
 )
-def list_services(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+async def list_services(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    return crud.get_services(db, skip=skip, limit=limit)
+    validator = await etags.validator(request, etags.SERVICES)
+    if validator.fresh:
+        return validator.not_modified()
+    result = await catalog_cache.get_page(
+        catalog_cache.SERVICES, page.cursor, page.limit, schemas.ServiceRead,
+        lambda: crud_async.get_services(db, page), validator.versions[0]
+    )
+    validator.apply(response)
+    return result
 
 @router.get(
     "/{service_id}",
     response_model=schemas.ServiceRead,
     dependencies=[Depends(get_current_user)]
 )
-def read_service(
+async def read_service(
     service_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    service = crud.get_service(db, service_id)
+    validator = await etags.validator(request, etags.SERVICES)
+    if validator.fresh:
+        return validator.not_modified()
+    service = await catalog_cache.get_item(
+        catalog_cache.SERVICES, service_id, schemas.ServiceRead,
+        lambda: crud_async.get_service(db, service_id), validator.versions[0]
+    )
     if not service:
         raise HTTPException(status_code=404, detail="Сервис не найден")
+    validator.apply(response)
     return service
 
 @router.put(
@@ -67,31 +78,29 @@ def read_service(
     response_model=schemas.ServiceRead,
     dependencies=[Depends(require_role(schemas.UserRole.portal_admin))]
 )
-def update_service(
+async def update_service(
     service_id: int,
     service_in: schemas.ServiceCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader)
 ):
-    service = crud.get_service(db, service_id)
+    service = await loader.load(models.Service, service_id)
     if not service:
         raise HTTPException(status_code=404, detail="Сервис не найден")
-    service.name = service_in.name
-    service.description = service_in.description
-    db.commit()
-    db.refresh(service)
-    return service
+    return await crud_async.update_service(db, service, service_in)
 
 @router.delete(
     "/{service_id}",
     response_model=schemas.ServiceRead,
     dependencies=[Depends(require_role(schemas.UserRole.portal_admin))]
 )
-def delete_service(
+async def delete_service(
     service_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader)
 ):
-    service = crud.get_service(db, service_id)
+    service = await loader.load(models.Service, service_id)
     if not service:
         raise HTTPException(status_code=404, detail="Сервис не найден")
-    crud.delete_service(db, service_id)
+    await crud_async.delete_service(db, service_id)
     return service
@@ -0,0 +1,302 @@
+# app/sessions.py
+#
+# Серверные сессии в Redis. Вход создаёт сессию (sid) и пару токенов:
+# access-токен (ACCESS_TOKEN_EXPIRE_MINUTES) несёт sid и данные
+# пользователя, refresh-токен (REFRESH_TOKEN_EXPIRE_DAYS) обменивается на
+# новую пару через /auth/refresh. Каждый refresh-токен одноразовый: в сессии
+# хранится jti последнего выданного, повторное предъявление старого
+# считается утечкой и закрывает сессию.
+#
+# Отзыв сессии — запись sid в множество отозванных текущего интервала
+# (sessions:revoked:<n>, интервал равен сроку жизни access-токена); access-
+# токены сессии становятся недействительны сразу, refresh перестаёт
+# работать, потому что удаляется сама сессия. Проверяются текущий и
+# предыдущий интервалы: старше любой отозванный sid уже не встретится в
+# живом access-токене.
+#
+# Проверка при каждом запросе идёт по локальному Bloom-фильтру отозванных
+# sid: «нет» — окончательный ответ без обращения к Redis, «возможно» —
+# уточняется SISMEMBER. Фильтр пополняется сообщениями об отзыве через канал
+# catalog_cache и раз в SESSION_REVOCATION_SYNC секунд (и после
+# переподключения подписки) строится заново из Redis.
+#
+# Ключи: session:<sid> (hash user_id, client_id, refresh_jti, created_at),
+# sessions:user:<id> и sessions:client:<id> (множества sid для массового выхода).
+
+import asyncio
+import hashlib
+import logging
+import math
+import time
+import uuid
+from typing import Collection, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+import catalog_cache, config, metrics, redis_client
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] — сессия; ARGV: предъявленный jti, новый jti, ttl сессии (с)
+# Ответ: 1 — заменён, 0 — сессии нет, -1 — jti не последний выданный
+_ROTATE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'refresh_jti')
+if not current then
+    return 0
+end
+if current ~= ARGV[1] then
+    return -1
+end
+redis.call('HSET', KEYS[1], 'refresh_jti', ARGV[2])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+return 1
+"""
+
+# KEYS[1] — множество сессий пользователя или клиента; забирает его целиком.
+# Сессия, добавленная после, остаётся в новом множестве и не теряется
+_TAKE_SCRIPT = """
+local sids = redis.call('SMEMBERS', KEYS[1])
+redis.call('DEL', KEYS[1])
+return sids
+"""
+
+_script = None
+_take_script = None
+
+
+class BloomFilter:
+    """Bloom-фильтр строк: ложные «возможно» с долей error_rate, ложных «нет» не бывает."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Двойное хэширование: k позиций из двух 64-битных половин одного дайджеста
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+# None — фильтр ещё не загружен, все проверки идут в Redis
+_filter: Optional[BloomFilter] = None
+# Отзывы, пришедшие во время перестроения фильтра
+_pending: Optional[List[str]] = None
+_resync: Optional[asyncio.Event] = None
+_syncer: Optional[asyncio.Task] = None
+
+
+def access_ttl() -> int:
+    return config.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+
+def session_ttl() -> int:
+    return config.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+
+
+def _session_key(sid: str) -> str:
+    return f"session:{sid}"
+
+
+def _user_key(user_id: int) -> str:
+    return f"sessions:user:{user_id}"
+
+
+def _client_key(client_id: int) -> str:
+    return f"sessions:client:{client_id}"
+
+
+def _revoked_keys(now: float) -> Tuple[str, str]:
+    interval = int(now // access_ttl())
+    return f"sessions:revoked:{interval}", f"sessions:revoked:{interval - 1}"
+
+
+def new_jti() -> str:
+    return uuid.uuid4().hex
+
+
+async def create(user_id: int, client_id: Optional[int]) -> Tuple[str, str]:
+    """Новая сессия; возвращает (sid, jti первого refresh-токена)."""
+    sid, jti = uuid.uuid4().hex, new_jti()
+    ttl = session_ttl()
+    redis = redis_client.get_redis()
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hset(_session_key(sid), mapping={
+            "user_id": user_id,
+            "client_id": "" if client_id is None else client_id,
+            "refresh_jti": jti,
+            "created_at": int(time.time()),
+        })
+        pipe.expire(_session_key(sid), ttl)
+        owners = [_user_key(user_id)] + ([] if client_id is None else [_client_key(client_id)])
+        for key in owners:
+            pipe.sadd(key, sid)
+            pipe.expire(key, ttl)
+        await pipe.execute()
+    return sid, jti
+
+
+async def rotate(sid: str, jti: str) -> Optional[str]:
+    """Обмен refresh-токена: jti следующего или None, если обмен невозможен."""
+    global _script
+    redis = redis_client.get_redis()
+    if _script is None or _script.registered_client is not redis:
+        _script = redis.register_script(_ROTATE_SCRIPT)
+    next_jti = new_jti()
+    result = await _script(keys=[_session_key(sid)], args=[jti, next_jti, session_ttl()])
+    if result == -1:
+        logger.warning("refresh token reuse for session %s: session revoked", sid)
+        await revoke([sid])
+    return next_jti if result == 1 else None
+
+
+def _remember(sid: str) -> None:
+    if _filter is not None:
+        _filter.add(sid)
+    if _pending is not None:
+        _pending.append(sid)
+
+
+async def revoke(sids: Collection[str]) -> int:
+    """Отзывает сессии: их access-токены перестают приниматься сразу во всех процессах."""
+    sids = list(sids)
+    if not sids:
+        return 0
+    key = _revoked_keys(time.time())[0]
+    redis = redis_client.get_redis()
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.sadd(key, *sids)
+        pipe.expire(key, 2 * access_ttl() + 60)
+        pipe.delete(*[_session_key(sid) for sid in sids])
+        await pipe.execute()
+    for sid in sids:
+        _remember(sid)
+    # Один sid рассылается как есть, пачка — сигналом перечитать множество
+    await catalog_cache.invalidate(catalog_cache.SESSIONS, sids[0] if len(sids) == 1 else None)
+    return len(sids)
+
+
+async def _revoke_owner(key: str) -> int:
+    global _take_script
+    redis = redis_client.get_redis()
+    if _take_script is None or _take_script.registered_client is not redis:
+        _take_script = redis.register_script(_TAKE_SCRIPT)
+    sids = [sid.decode() for sid in await _take_script(keys=[key])]
+    return await revoke(sids)
+
+
+async def revoke_user(user_id: int) -> int:
+    """Выход из всех сессий пользователя (смена роли, удаление и т.п.)."""
+    return await _revoke_owner(_user_key(user_id))
+
+
+async def revoke_client(client_id: int) -> int:
+    """Выход из всех сессий всех пользователей клиента."""
+    return await _revoke_owner(_client_key(client_id))
+
+
+async def _invalidate(key: str) -> None:
+    try:
+        await _revoke_owner(key)
+    except RedisError:
+        # Токены доживут до exp (не дольше ACCESS_TOKEN_EXPIRE_MINUTES)
+        logger.error("sessions: failed to revoke sessions %s", key, exc_info=True)
+
+
+async def invalidate_user(user_id: int) -> None:
+    """Вызывается после коммита изменения или удаления пользователя: токены
+    с прежними ролью и клиентом больше не принимаются."""
+    await _invalidate(_user_key(user_id))
+
+
+async def invalidate_client(client_id: int) -> None:
+    """Вызывается после удаления клиента."""
+    await _invalidate(_client_key(client_id))
+
+
+async def is_revoked(sid: str) -> bool:
+    """Отозвана ли сессия; при недоступности Redis бросает RedisError."""
+    if _filter is not None and sid not in _filter:
+        metrics.SESSION_REVOCATION_CHECKS.labels("local").inc()
+        return False
+    redis = redis_client.get_redis()
+    async with redis.pipeline(transaction=False) as pipe:
+        for key in _revoked_keys(time.time()):
+            pipe.sismember(key, sid)
+        revoked = any(await pipe.execute())
+    metrics.SESSION_REVOCATION_CHECKS.labels("redis").inc()
+    return revoked
+
+
+async def _load() -> None:
+    global _filter, _pending
+    _pending = []
+    try:
+        members = await redis_client.get_redis().sunion(*_revoked_keys(time.time()))
+        if len(members) > config.SESSION_BLOOM_CAPACITY:
+            logger.warning("sessions: %d revoked sessions exceed bloom capacity %d",
+                           len(members), config.SESSION_BLOOM_CAPACITY)
+        bloom = BloomFilter(config.SESSION_BLOOM_CAPACITY, config.SESSION_BLOOM_ERROR_RATE)
+        for sid in members:
+            bloom.add(sid.decode())
+        for sid in _pending:
+            bloom.add(sid)
+        _filter = bloom
+    finally:
+        _pending = None
+
+
+def _on_revoked(sid: Optional[str]) -> None:
+    if sid is not None:
+        _remember(sid)
+    elif _resync is not None:
+        # Отозвана пачка или подписка переподключилась: перечитать из Redis
+        _resync.set()
+
+
+catalog_cache.on_invalidate(catalog_cache.SESSIONS, _on_revoked)
+
+
+async def _run_sync() -> None:
+    while True:
+        _resync.clear()
+        try:
+            await _load()
+        except RedisError:
+            logger.warning("sessions: failed to load revoked sessions", exc_info=True)
+        try:
+            await asyncio.wait_for(_resync.wait(), timeout=config.SESSION_REVOCATION_SYNC)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start() -> None:
+    global _syncer, _resync
+    if _syncer is None:
+        _resync = asyncio.Event()
+        _syncer = asyncio.create_task(_run_sync())
+
+
+async def stop() -> None:
+    global _syncer, _resync, _filter
+    if _syncer is not None:
+        _syncer.cancel()
+        try:
+            await _syncer
+        except asyncio.CancelledError:
+            pass
+        _syncer = None
+        _resync = None
+        _filter = None
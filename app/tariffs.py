@@ -1,25 +1,17 @@
 # app/routers/tariffs.py
 
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-
-import crud, schemas, database
+import catalog_cache, etags, crud_async, schemas, database
 from auth import get_current_user, require_role
+from pagination import PageParams
 
 router = APIRouter(
     prefix="/tariffs",
     tags=["tariffs"],
 )
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # CREATE
 @router.post(
     "/",
@@ -27,28 +19,37 @@ def get_db():
     status_code=status.HTTP_201_CREATED,
     dependencies=[Depends(require_role(schemas.UserRole.portal_admin))]
 )
-def create_tariff(
+async def create_tariff(
     tariff_in: schemas.TariffCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     # Проверка уникальности названия тарифа
-    existing = crud.get_tariff_by_name(db, tariff_in.name)
+    existing = await crud_async.get_tariff_by_name(db, tariff_in.name)
     if existing:
         raise HTTPException(status_code=400, detail="Тариф с таким именем уже существует")
-    return crud.create_tariff(db, tariff_in)
+    return await crud_async.create_tariff(db, tariff_in)
 
 # READ ALL
 @router.get(
     "/",
-    response_model=List[schemas.TariffRead],
+    response_model=schemas.Page[schemas.TariffRead],
     dependencies=[Depends(get_current_user)]
 )
-def list_tariffs(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+async def list_tariffs(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    return crud.get_tariffs(db, skip=skip, limit=limit)
+    validator = await etags.validator(request, etags.TARIFFS)
+    if validator.fresh:
+        return validator.not_modified()
+    result = await catalog_cache.get_page(
+        catalog_cache.TARIFFS, page.cursor, page.limit, schemas.TariffRead,
+        lambda: crud_async.get_tariffs(db, page), validator.versions[0]
+    )
+    validator.apply(response)
+    return result
 
 # READ ONE
 @router.get(
@@ -56,13 +57,22 @@ def list_tariffs(
     response_model=schemas.TariffRead,
     dependencies=[Depends(get_current_user)]
 )
-def read_tariff(
+async def read_tariff(
     tariff_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    tariff = crud.get_tariff(db, tariff_id)
+    validator = await etags.validator(request, etags.TARIFFS)
+    if validator.fresh:
+        return validator.not_modified()
+    tariff = await catalog_cache.get_item(
+        catalog_cache.TARIFFS, tariff_id, schemas.TariffRead,
+        lambda: crud_async.get_tariff(db, tariff_id), validator.versions[0]
+    )
     if not tariff:
         raise HTTPException(status_code=404, detail="Тариф не найден")
+    validator.apply(response)
     return tariff
 
 # UPDATE
@@ -71,23 +81,15 @@ def read_tariff(
     response_model=schemas.TariffRead,
     dependencies=[Depends(require_role(schemas.UserRole.portal_admin))]
 )
-def update_tariff(
+async def update_tariff(
     tariff_id: int,
     tariff_in: schemas.TariffCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    tariff = crud.get_tariff(db, tariff_id)
+    tariff = await crud_async.get_tariff(db, tariff_id)
     if not tariff:
         raise HTTPException(status_code=404, detail="Тариф не найден")
-    # Обновляем поля
-    tariff.name = tariff_in.name
-    tariff.max_users = tariff_in.max_users
-    tariff.max_services = tariff_in.max_services
-    tariff.period_days = tariff_in.period_days
-    tariff.price = tariff_in.price
-    db.commit()
-    db.refresh(tariff)
-    return tariff
+    return await crud_async.update_tariff(db, tariff, tariff_in)
 
 # DELETE
 @router.delete(
@@ -95,12 +97,12 @@ def update_tariff(
     response_model=schemas.TariffRead,
     dependencies=[Depends(require_role(schemas.UserRole.portal_admin))]
 )
-def delete_tariff(
+async def delete_tariff(
     tariff_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    tariff = crud.get_tariff(db, tariff_id)
+    tariff = await crud_async.get_tariff(db, tariff_id)
     if not tariff:
         raise HTTPException(status_code=404, detail="Тариф не найден")
-    crud.delete_tariff(db, tariff_id)
+    await crud_async.delete_tariff(db, tariff_id)
     return tariff
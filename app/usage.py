@@ -1,100 +1,422 @@
 # app/routers/usage.py
 
-from typing import List
+import csv
+import datetime
+import io
+import json
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
-import crud, schemas, database, models
-from auth import get_current_user
+import config, crud_async, schemas, database, models, serialization
+from auth import get_current_user, require_role
+from loader import Loader, get_loader
+from pagination import PageParams
 from schemas import UserRole
+from usage_buffer import usage_buffer
 
 router = APIRouter(
     prefix="/usage",
     tags=["usage"],
 )
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Одиночное событие: кладём в буфер отложенной записи и сразу отвечаем 202
+@router.post(
+    "/",
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(require_role(UserRole.portal_admin))]
+)
+async def ingest_usage(payload: schemas.UsageCreate):
+    if payload.usage_amount < 0:
+        raise HTTPException(status_code=400, detail="usage_amount must be non-negative")
+    date_error = crud_async.usage_date_error(payload.usage_date, datetime.datetime.utcnow())
+    if date_error:
+        raise HTTPException(status_code=400, detail=date_error)
+    if not usage_buffer.add(payload):
+        raise HTTPException(status_code=503, detail="Usage buffer is full", headers={"Retry-After": "1"})
+    return {"accepted": True}
 
-@router.get(
-    "/client/{client_id}",
-    response_model=List[schemas.UsageRead]
+# Пакетная запись событий от API-шлюзов (учётная запись portal_admin).
+# buffered=true — через буфер: accepted означает «принято в буфер»,
+# проверка ссылок выполняется при сбросе
+@router.post(
+    "/batch",
+    response_model=schemas.UsageBatchResult,
+    dependencies=[Depends(require_role(UserRole.portal_admin))]
 )
-def usage_by_client(
-    client_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+async def ingest_usage_batch(
+    payload: schemas.UsageBatchCreate,
+    buffered: bool = False,
+    db: AsyncSession = Depends(database.get_async_db)
 ):
+    if buffered:
+        errors = []
+        now = datetime.datetime.utcnow()
+        for index, item in enumerate(payload.items):
+            date_error = crud_async.usage_date_error(item.usage_date, now)
+            if item.usage_amount < 0:
+                errors.append(schemas.UsageBatchError(index=index, detail="usage_amount must be non-negative"))
+            elif date_error:
+                errors.append(schemas.UsageBatchError(index=index, detail=date_error))
+            elif not usage_buffer.add(item):
+                errors.append(schemas.UsageBatchError(index=index, detail="usage buffer is full"))
+        return schemas.UsageBatchResult(accepted=len(payload.items) - len(errors), rejected=len(errors), errors=errors)
+    accepted, errors = await crud_async.create_usage_batch(db, payload.items)
+    return schemas.UsageBatchResult(accepted=accepted, rejected=len(errors), errors=errors)
+
+# ---------------------
+# Проверки доступа к сырым логам (общие для постраничных списков и выгрузки)
+# ---------------------
+
+async def _authorize_client_usage(loader: Loader, current_user: models.User, client_id: int):
     # portal_admin видит всё, client_admin только по своему client_id
     if current_user.role == UserRole.client_admin and current_user.client_id != client_id:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
     # проверим, что клиент существует
-    client = crud.get_client(db, client_id)
+    client = await loader.load(models.Client, client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Клиент не найден")
-    return crud.get_usage_for_client(db, client_id)
 
-@router.get(
-    "/user/{user_id}",
-    response_model=List[schemas.UsageRead]
-)
-def usage_by_user(
-    user_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
-):
+async def _authorize_user_usage(loader: Loader, current_user: models.User, user_id: int):
     # user видит только свои логи, client_admin — только своего пользователя
     if current_user.role == UserRole.user and current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
+    user = await loader.load(models.User, user_id)
     if current_user.role == UserRole.client_admin:
         # убедимся, что запрошенный user принадлежит тому же client
-        target = crud.get_user(db, user_id)
-        if not target or target.client_id != current_user.client_id:
+        if not user or user.client_id != current_user.client_id:
             raise HTTPException(status_code=403, detail="Недостаточно прав")
     # проверим, что пользователь существует
-    user = crud.get_user(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-    return crud.get_usage_for_user(db, user_id)
 
-@router.get(
-    "/service/{service_id}",
-    response_model=List[schemas.UsageRead]
-)
-def usage_by_service(
-    service_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
-):
+async def _authorize_service_usage(loader: Loader, current_user: models.User, service_id: int) -> Optional[int]:
+    # Возвращает client_id, которым нужно ограничить выборку (None — без ограничения)
     # Проверяем, что сервис существует
-    service = crud.get_service(db, service_id)
+    service = await loader.load(models.Service, service_id)
     if not service:
         raise HTTPException(status_code=404, detail="Сервис не найден")
-    
+
     # portal_admin — видит всё
     if current_user.role == UserRole.portal_admin:
-        return db.query(models.Usage).join(models.ClientService).filter(
-            models.ClientService.service_id == service_id
-        ).all()
-    
+        return None
+
     # client_admin — видит usage только по своим клиентам (service должен быть у клиента)
     if current_user.role == UserRole.client_admin:
         client_id = current_user.client_id
         # Проверяем, что этот сервис действительно подключён клиенту client_admin
-        client_service = db.query(models.ClientService).filter_by(
-            client_id=client_id, service_id=service_id
-        ).first()
+        client_service = await crud_async.get_client_service_by_pair(loader.db, client_id, service_id)
         if not client_service:
             raise HTTPException(status_code=403, detail="Сервис не подключён вашему клиенту")
-        return db.query(models.Usage).join(models.ClientService).filter(
-            models.ClientService.client_id == client_id,
-            models.ClientService.service_id == service_id
-        ).all()
-    
+        return client_id
+
     # Обычный пользователь не имеет доступа
     raise HTTPException(status_code=403, detail="Недостаточно прав")
+
+@router.get(
+    "/client/{client_id}",
+    response_model=schemas.Page[schemas.UsageRead]
+)
+async def usage_by_client(
+    client_id: int,
+    page: PageParams = Depends(),
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader),
+    current_user: models.User = Depends(get_current_user)
+):
+    await _authorize_client_usage(loader, current_user, client_id)
+    result = await crud_async.get_usage_for_client(db, client_id, page, date_from, date_to)
+    return serialization.page_response(schemas.UsageRead, result)
+
+@router.get(
+    "/user/{user_id}",
+    response_model=schemas.Page[schemas.UsageRead]
+)
+async def usage_by_user(
+    user_id: int,
+    page: PageParams = Depends(),
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader),
+    current_user: models.User = Depends(get_current_user)
+):
+    await _authorize_user_usage(loader, current_user, user_id)
+    result = await crud_async.get_usage_for_user(db, user_id, page, date_from, date_to)
+    return serialization.page_response(schemas.UsageRead, result)
+
+@router.get(
+    "/service/{service_id}",
+    response_model=schemas.Page[schemas.UsageRead]
+)
+async def usage_by_service(
+    service_id: int,
+    page: PageParams = Depends(),
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader),
+    current_user: models.User = Depends(get_current_user)
+):
+    client_id = await _authorize_service_usage(loader, current_user, service_id)
+    result = await crud_async.get_usage_for_service(
+        db, service_id, page, client_id=client_id, date_from=date_from, date_to=date_to
+    )
+    return serialization.page_response(schemas.UsageRead, result)
+
+# ---------------------
+# Потоковая выгрузка истории (NDJSON / CSV) через серверный курсор
+# ---------------------
+
+_EXPORT_FIELDS = ["id", "client_service_id", "user_id", "usage_date", "usage_amount"]
+
+async def _ndjson_chunks(query):
+    async for rows in crud_async.stream_usage(query):
+        yield "".join(
+            json.dumps({
+                "id": row.id,
+                "client_service_id": row.client_service_id,
+                "user_id": row.user_id,
+                "usage_date": row.usage_date.isoformat(),
+                "usage_amount": row.usage_amount,
+            }) + "\n"
+            for row in rows
+        )
+
+async def _csv_chunks(query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(_EXPORT_FIELDS)
+    async for rows in crud_async.stream_usage(query):
+        writer.writerows(
+            (row.id, row.client_service_id, row.user_id, row.usage_date.isoformat(), row.usage_amount)
+            for row in rows
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _export_response(query, export_format: schemas.ExportFormat, filename: str) -> StreamingResponse:
+    if export_format == schemas.ExportFormat.csv:
+        body, media_type = _csv_chunks(query), "text/csv"
+    else:
+        body, media_type = _ndjson_chunks(query), "application/x-ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format.value}"'},
+    )
+
+@router.get("/client/{client_id}/export")
+async def export_usage_by_client(
+    client_id: int,
+    format: schemas.ExportFormat = schemas.ExportFormat.ndjson,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    loader: Loader = Depends(get_loader),
+    current_user: models.User = Depends(get_current_user)
+):
+    await _authorize_client_usage(loader, current_user, client_id)
+    return _export_response(crud_async.usage_query_for_client(client_id, date_from, date_to), format, f"usage_client_{client_id}")
+
+@router.get("/user/{user_id}/export")
+async def export_usage_by_user(
+    user_id: int,
+    format: schemas.ExportFormat = schemas.ExportFormat.ndjson,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    loader: Loader = Depends(get_loader),
+    current_user: models.User = Depends(get_current_user)
+):
+    await _authorize_user_usage(loader, current_user, user_id)
+    return _export_response(crud_async.usage_query_for_user(user_id, date_from, date_to), format, f"usage_user_{user_id}")
+
+@router.get("/service/{service_id}/export")
+async def export_usage_by_service(
+    service_id: int,
+    format: schemas.ExportFormat = schemas.ExportFormat.ndjson,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    loader: Loader = Depends(get_loader),
+    current_user: models.User = Depends(get_current_user)
+):
+    client_id = await _authorize_service_usage(loader, current_user, service_id)
+    query = crud_async.usage_query_for_service(service_id, client_id, date_from, date_to)
+    return _export_response(query, format, f"usage_service_{service_id}")
+
+# ---------------------
+# Агрегированные отчёты: читают суточные итоги (usage_daily_rollups),
+# поэтому время ответа не зависит от объёма сырой истории
+# ---------------------
+
+@router.get(
+    "/client/{client_id}/summary",
+    response_model=schemas.UsageSummary
+)
+async def usage_summary_by_client(
+    client_id: int,
+    granularity: schemas.UsageGranularity = schemas.UsageGranularity.day,
+    group_by: Optional[schemas.UsageGroupBy] = schemas.UsageGroupBy.service,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    if current_user.role == UserRole.user:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    if current_user.role == UserRole.client_admin and current_user.client_id != client_id:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    rows = await crud_async.get_usage_summary(
+        db, granularity, group_by, models.UsageDailyRollup.client_id == client_id,
+        date_from=date_from, date_to=date_to
+    )
+    return schemas.UsageSummary(granularity=granularity, group_by=group_by, rows=rows)
+
+@router.get(
+    "/user/{user_id}/summary",
+    response_model=schemas.UsageSummary
+)
+async def usage_summary_by_user(
+    user_id: int,
+    granularity: schemas.UsageGranularity = schemas.UsageGranularity.day,
+    group_by: Optional[schemas.UsageGroupBy] = schemas.UsageGroupBy.service,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader),
+    current_user: models.User = Depends(get_current_user)
+):
+    # Те же правила, что и для сырых логов пользователя
+    if current_user.role == UserRole.user and current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    if current_user.role == UserRole.client_admin:
+        target = await loader.load(models.User, user_id)
+        if not target or target.client_id != current_user.client_id:
+            raise HTTPException(status_code=403, detail="Недостаточно прав")
+    rows = await crud_async.get_usage_summary(
+        db, granularity, group_by, models.UsageDailyRollup.user_id == user_id,
+        date_from=date_from, date_to=date_to
+    )
+    return schemas.UsageSummary(granularity=granularity, group_by=group_by, rows=rows)
+
+@router.get(
+    "/service/{service_id}/summary",
+    response_model=schemas.UsageSummary
+)
+async def usage_summary_by_service(
+    service_id: int,
+    granularity: schemas.UsageGranularity = schemas.UsageGranularity.day,
+    group_by: Optional[schemas.UsageGroupBy] = schemas.UsageGroupBy.client,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    filters = [models.UsageDailyRollup.service_id == service_id]
+    # portal_admin — по всем клиентам, client_admin — только по своему
+    if current_user.role == UserRole.client_admin:
+        filters.append(models.UsageDailyRollup.client_id == current_user.client_id)
+    elif current_user.role != UserRole.portal_admin:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    rows = await crud_async.get_usage_summary(
+        db, granularity, group_by, *filters, date_from=date_from, date_to=date_to
+    )
+    return schemas.UsageSummary(granularity=granularity, group_by=group_by, rows=rows)
+
+# ---------------------
+# Аналитика по клиенту: top-N потребителей, распределение суточного
+# потребления (перцентили, гистограмма) и скользящее среднее. Считается в
+# Postgres по суточным итогам; по умолчанию — текущий месяц
+# ---------------------
+
+def _analytics_period(
+    date_from: Optional[datetime.date], date_to: Optional[datetime.date]
+) -> Tuple[datetime.date, datetime.date]:
+    date_to = date_to or datetime.datetime.utcnow().date()
+    date_from = date_from or date_to.replace(day=1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    if (date_to - date_from).days >= config.USAGE_ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"period must not exceed {config.USAGE_ANALYTICS_MAX_DAYS} days")
+    return date_from, date_to
+
+def _analytics_scope(current_user: models.User, client_id: int, service_id: Optional[int]) -> dict:
+    # Те же права, что у сводки по клиенту
+    if current_user.role == UserRole.user:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    if current_user.role == UserRole.client_admin and current_user.client_id != client_id:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    scope = {"client_id": client_id}
+    if service_id is not None:
+        scope["service_id"] = service_id
+    return scope
+
+def _analytics_key(group_by: Optional[schemas.UsageGroupBy]) -> None:
+    if group_by == schemas.UsageGroupBy.client:
+        raise HTTPException(status_code=400, detail="grouping by client is not supported within a client")
+
+@router.get(
+    "/client/{client_id}/top",
+    response_model=schemas.UsageTop
+)
+async def usage_top_by_client(
+    client_id: int,
+    by: schemas.UsageGroupBy = schemas.UsageGroupBy.user,
+    limit: int = Query(20, ge=1, le=100),
+    service_id: Optional[int] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    scope = _analytics_scope(current_user, client_id, service_id)
+    _analytics_key(by)
+    date_from, date_to = _analytics_period(date_from, date_to)
+    return await crud_async.get_usage_top(db, by, scope, date_from, date_to, limit)
+
+@router.get(
+    "/client/{client_id}/distribution",
+    response_model=schemas.UsageDistribution
+)
+async def usage_distribution_by_client(
+    client_id: int,
+    group_by: schemas.UsageGroupBy = schemas.UsageGroupBy.service,
+    percentiles: List[float] = Query([50, 95], max_length=10),
+    buckets: int = Query(10, ge=1, le=100),
+    service_id: Optional[int] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    scope = _analytics_scope(current_user, client_id, service_id)
+    _analytics_key(group_by)
+    if any(not 0 <= p <= 100 for p in percentiles):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+    date_from, date_to = _analytics_period(date_from, date_to)
+    return await crud_async.get_usage_distribution(db, group_by, scope, date_from, date_to, percentiles, buckets)
+
+@router.get(
+    "/client/{client_id}/trend",
+    response_model=schemas.UsageTrend
+)
+async def usage_trend_by_client(
+    client_id: int,
+    group_by: Optional[schemas.UsageGroupBy] = None,
+    window: int = Query(7, ge=1, le=90),
+    service_id: Optional[int] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    scope = _analytics_scope(current_user, client_id, service_id)
+    _analytics_key(group_by)
+    date_from, date_to = _analytics_period(date_from, date_to)
+    return await crud_async.get_usage_trend(db, group_by, scope, date_from, date_to, window)
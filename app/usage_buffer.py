@@ -0,0 +1,199 @@
+# app/usage_buffer.py
+#
+# Буфер отложенной записи usage: события агрегируются в памяти по ключу
+# (client_service_id, user_id, минута) и сбрасываются в таблицу usage одним
+# пакетом — по размеру буфера или по таймеру. API отвечает сразу. Строка
+# usage на минуту несёт сумму и число свёрнутых в неё событий (events).
+# Цена: события, не сброшенные к моменту аварийного падения процесса, теряются.
+# Если БД отвергает пакет, он делится пополам до отдельных корзин: остальные
+# записываются, отвергнутая повторяется при следующих сбросах и после
+# USAGE_BUFFER_MAX_RETRIES неудач отбрасывается (buckets_failed).
+
+import asyncio
+import datetime
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+import config, crud_async, database, schemas
+
+logger = logging.getLogger(__name__)
+
+BucketKey = Tuple[int, int, datetime.datetime]
+
+
+class UsageBuffer:
+    def __init__(self, max_buckets: int, flush_size: int, flush_interval: float, max_retries: int):
+        self.max_buckets = max_buckets
+        self.max_retries = max_retries
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        # Ключ -> [сумма usage_amount, число событий]
+        self._buckets: Dict[BucketKey, List[int]] = {}
+        self._pending_events = 0
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Неудачные попытки записи корзин, которые БД отвергла
+        self._attempts: Dict[BucketKey, int] = {}
+        # Метрики
+        self.events_received = 0
+        self.events_dropped = 0
+        self.buckets_rejected = 0
+        self.buckets_failed = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.rows_written = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def add(self, item: schemas.UsageCreate) -> bool:
+        # Вызывается из event loop; False — буфер переполнен, событие отброшено
+        usage_date = item.usage_date or datetime.datetime.utcnow()
+        key = (item.client_service_id, item.user_id, usage_date.replace(second=0, microsecond=0))
+        if key not in self._buckets and len(self._buckets) >= self.max_buckets:
+            self.events_dropped += 1
+            return False
+        bucket = self._buckets.setdefault(key, [0, 0])
+        bucket[0] += item.usage_amount
+        bucket[1] += 1
+        self._pending_events += 1
+        self.events_received += 1
+        if len(self._buckets) >= self.flush_size:
+            self._flush_requested.set()
+        return True
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            buckets, self._buckets = self._buckets, {}
+            self._pending_events = 0
+            if not buckets:
+                return
+            started = time.perf_counter()
+            written = await self._write(list(buckets.items()))
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if written:
+                self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+    async def _write(self, entries: List[Tuple[BucketKey, List[int]]]) -> bool:
+        # Пакет целиком; при ошибке — пополам, пока плохие корзины не
+        # окажутся по одной. Возвращает True, если что-то записано
+        items = [
+            schemas.UsageCreate(client_service_id=cs_id, user_id=user_id, usage_date=minute, usage_amount=amount)
+            for (cs_id, user_id, minute), (amount, _) in entries
+        ]
+        try:
+            async with database.AsyncSessionLocal() as db:
+                accepted, errors = await crud_async.create_usage_batch(db, items, [count for _, (_, count) in entries])
+        except Exception as e:
+            error = e
+        else:
+            self.rows_written += accepted
+            self.buckets_rejected += len(errors)
+            for key, _ in entries:
+                self._attempts.pop(key, None)
+            return True
+        self.flush_failures += 1
+        available = await self._database_available()
+        if len(entries) > 1 and available:
+            middle = len(entries) // 2
+            first = await self._write(entries[:middle])
+            return await self._write(entries[middle:]) or first
+        logger.error("usage buffer: failed to write %d buckets", len(entries), exc_info=error)
+        self._retry(entries, counted=available)
+        return False
+
+    async def _database_available(self) -> bool:
+        # Отличает недоступность БД (повторить всё позже) от отказа в конкретных строках
+        try:
+            async with database.async_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+
+    def _retry(self, entries: List[Tuple[BucketKey, List[int]]], counted: bool) -> None:
+        # Корзина, которую БД отвергает сама по себе, повторяется не больше
+        # max_retries раз и отбрасывается; пока БД недоступна, попытки не
+        # считаются (рост буфера и так ограничен max_buckets)
+        retry = []
+        for key, bucket in entries:
+            attempts = self._attempts.get(key, 0) + (1 if counted else 0)
+            if attempts >= self.max_retries:
+                self._attempts.pop(key, None)
+                self.buckets_failed += 1
+                self.events_dropped += bucket[1]
+                logger.error("usage buffer: dropping bucket %s (%d events) after %d attempts", key, bucket[1], attempts)
+                continue
+            self._attempts[key] = attempts
+            retry.append((key, bucket))
+        self._requeue(retry)
+
+    def _requeue(self, entries: List[Tuple[BucketKey, List[int]]]) -> None:
+        # Возвращаем несброшенное в буфер, пока хватает места
+        for key, (amount, count) in entries:
+            if key in self._buckets:
+                self._buckets[key][0] += amount
+                self._buckets[key][1] += count
+            elif len(self._buckets) < self.max_buckets:
+                self._buckets[key] = [amount, count]
+            else:
+                self.events_dropped += count
+                continue
+            self._pending_events += count
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Фоновый цикл не отменяется: отмена посреди flush потеряла бы уже
+        # вынутые из буфера корзины. Цикл доделывает текущий сброс и выходит,
+        # затем дописываем остаток
+        if self._task is not None:
+            self._stopping = True
+            self._flush_requested.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.flush()
+        if self._buckets:
+            logger.error("usage buffer: %d events not written at shutdown", self._pending_events)
+            self.events_dropped += self._pending_events
+
+    def stats(self) -> dict:
+        return {
+            "depth_buckets": len(self._buckets),
+            "pending_events": self._pending_events,
+            "events_received": self.events_received,
+            "events_dropped": self.events_dropped,
+            "buckets_rejected": self.buckets_rejected,
+            "buckets_failed": self.buckets_failed,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "rows_written": self.rows_written,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+        }
+
+
+usage_buffer = UsageBuffer(
+    config.USAGE_BUFFER_MAX_BUCKETS,
+    config.USAGE_BUFFER_FLUSH_SIZE,
+    config.USAGE_BUFFER_FLUSH_INTERVAL,
+    config.USAGE_BUFFER_MAX_RETRIES,
+)
@@ -0,0 +1,199 @@
+# app/user_import.py
+#
+# Массовый импорт пользователей из CSV или NDJSON. Файл читается потоково
+# (UploadFile хранит загрузку во временном файле на диске) и обрабатывается
+# пачками по USER_IMPORT_BATCH строк: одна выборка на проверку занятых
+# username/email, параллельное хэширование паролей в пуле процессов и
+# многострочная вставка. Все пачки пишутся в одной транзакции; ошибки
+# отдельных строк попадают в отчёт и не отменяют остальные строки.
+# Чтение файла, разбор CSV/JSON и валидация выполняются в threadpool, чтобы
+# не блокировать event loop.
+#
+# CSV: заголовок username,email,password,role,client_id (email, role,
+# client_id необязательны; role по умолчанию user).
+
+import codecs
+import csv
+import json
+from typing import Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+import config, crud_async, etags, hashing, models, schemas
+from schemas import UserRole
+
+_REQUIRED_COLUMNS = {"username", "password"}
+
+
+def _csv_records(upload: UploadFile) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    lines = codecs.iterdecode(upload.file, "utf-8-sig")
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None or not _REQUIRED_COLUMNS <= set(reader.fieldnames):
+        raise HTTPException(status_code=400, detail="CSV header must contain username and password columns")
+    for number, record in enumerate(reader, start=1):
+        # Пустые ячейки CSV означают «не задано»
+        yield number, {key: value for key, value in record.items() if key and value not in ("", None)}, None
+
+
+def _ndjson_records(upload: UploadFile) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    number = 0
+    for line in codecs.iterdecode(upload.file, "utf-8-sig"):
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, "Invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "Expected a JSON object"
+            continue
+        yield number, record, None
+
+
+def _error(number: int, detail: str, username: Optional[str] = None) -> schemas.UserImportRow:
+    return schemas.UserImportRow(row=number, username=username, status="error", detail=detail)
+
+
+def _validation_detail(exc: ValidationError) -> str:
+    error = exc.errors()[0]
+    field = ".".join(str(part) for part in error["loc"])
+    return f"{field}: {error['msg']}" if field else error["msg"]
+
+
+class _Importer:
+    def __init__(self, db: AsyncSession, current_user: models.User):
+        self.db = db
+        self.current_user = current_user
+        self.report: List[schemas.UserImportRow] = []
+        # Дубликаты внутри самого файла
+        self.seen_usernames = set()
+        self.seen_emails = set()
+        self.created = 0
+        # Клиенты созданных пользователей: их ETag сбрасываются после коммита
+        self.client_ids = set()
+
+    def _check_scope(self, user_in: schemas.UserCreate) -> Optional[str]:
+        # client_admin импортирует только в свой клиент и без роли portal_admin
+        if self.current_user.role == UserRole.portal_admin:
+            return None
+        if user_in.role == UserRole.portal_admin:
+            return "client_admin cannot create portal_admin users"
+        if user_in.client_id is None:
+            user_in.client_id = self.current_user.client_id
+        elif user_in.client_id != self.current_user.client_id:
+            return "client_id outside your client"
+        return None
+
+    def parse(self, number: int, record: dict) -> Optional[schemas.UserCreate]:
+        record.setdefault("role", UserRole.user.value)
+        username = record.get("username")
+        try:
+            user_in = schemas.UserCreate(**record)
+        except ValidationError as exc:
+            self.report.append(_error(number, _validation_detail(exc), username))
+            return None
+        detail = self._check_scope(user_in)
+        if detail is None and user_in.username in self.seen_usernames:
+            detail = "Duplicate username in file"
+        if detail is None and user_in.email is not None and user_in.email in self.seen_emails:
+            detail = "Duplicate email in file"
+        if detail is not None:
+            self.report.append(_error(number, detail, user_in.username))
+            return None
+        self.seen_usernames.add(user_in.username)
+        if user_in.email is not None:
+            self.seen_emails.add(user_in.email)
+        return user_in
+
+    def read_batch(self, records: Iterator[Tuple[int, Optional[dict], Optional[str]]]
+                   ) -> Tuple[List[Tuple[int, schemas.UserCreate]], bool]:
+        # Выполняется в threadpool: читает и разбирает строки до полной пачки.
+        # Возвращает (пачка, файл_закончился)
+        batch: List[Tuple[int, schemas.UserCreate]] = []
+        try:
+            for number, record, detail in records:
+                if number > config.USER_IMPORT_MAX_ROWS:
+                    raise HTTPException(status_code=413, detail=f"Import is limited to {config.USER_IMPORT_MAX_ROWS} rows")
+                if detail is not None:
+                    self.report.append(_error(number, detail))
+                    continue
+                user_in = self.parse(number, record)
+                if user_in is not None:
+                    batch.append((number, user_in))
+                if len(batch) >= config.USER_IMPORT_BATCH:
+                    return batch, False
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="File must be UTF-8")
+        return batch, True
+
+    async def flush(self, batch: List[Tuple[int, schemas.UserCreate]]) -> None:
+        if not batch:
+            return
+        taken_usernames, taken_emails = await crud_async.get_taken_usernames_emails(
+            self.db,
+            [user_in.username for _, user_in in batch],
+            [user_in.email for _, user_in in batch if user_in.email is not None],
+        )
+        client_ids = {user_in.client_id for _, user_in in batch if user_in.client_id is not None}
+        known_clients = await crud_async.get_existing_client_ids(self.db, list(client_ids)) if client_ids else set()
+
+        accepted = []
+        for number, user_in in batch:
+            if user_in.username in taken_usernames:
+                self.report.append(_error(number, "Username already registered", user_in.username))
+            elif user_in.email is not None and user_in.email in taken_emails:
+                self.report.append(_error(number, "Email already registered", user_in.username))
+            elif user_in.client_id is not None and user_in.client_id not in known_clients:
+                self.report.append(_error(number, "Client not found", user_in.username))
+            else:
+                accepted.append((number, user_in))
+        if not accepted:
+            return
+
+        hashes = await hashing.hash_many([user_in.password for _, user_in in accepted])
+        inserted = await crud_async.insert_users(self.db, [
+            {
+                "username": user_in.username,
+                "email": user_in.email,
+                "password_hash": password_hash,
+                "role": models.UserRole(user_in.role.value),
+                "client_id": user_in.client_id,
+            }
+            for (_, user_in), password_hash in zip(accepted, hashes)
+        ])
+        for number, user_in in accepted:
+            user_id = inserted.get(user_in.username)
+            if user_id is None:
+                # Занят параллельной транзакцией между проверкой и вставкой
+                self.report.append(_error(number, "Username or email already registered", user_in.username))
+            else:
+                self.created += 1
+                self.client_ids.add(user_in.client_id)
+                self.report.append(schemas.UserImportRow(
+                    row=number, username=user_in.username, status="created", id=user_id
+                ))
+
+
+async def import_users(db: AsyncSession, upload: UploadFile, import_format: schemas.ImportFormat,
+                       current_user: models.User) -> schemas.UserImportResult:
+    records = _csv_records(upload) if import_format == schemas.ImportFormat.csv else _ndjson_records(upload)
+    importer = _Importer(db, current_user)
+    done = False
+    while not done:
+        batch, done = await run_in_threadpool(importer.read_batch, records)
+        await importer.flush(batch)
+    await db.commit()
+    if importer.created:
+        await etags.bump_users(*importer.client_ids)
+
+    importer.report.sort(key=lambda row: row.row)
+    return schemas.UserImportResult(
+        created=importer.created,
+        failed=len(importer.report) - importer.created,
+        rows=importer.report,
+    )
@@ -1,12 +1,15 @@
 # app/routers/user_service.py
 
+import asyncio
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-import crud, schemas, database, models
+import crud_async, etags, schemas, database, models, serialization
 from auth import get_current_user
+from loader import Loader, get_loader
+from pagination import PageParams
 from schemas import UserRole
 
 router = APIRouter(
@@ -14,47 +17,49 @@ router = APIRouter(
     tags=["user_service"],
 )
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post(
     "/",
     response_model=schemas.UserServiceRead,
     status_code=status.HTTP_201_CREATED
 )
-def assign_service_to_user(
+async def assign_service_to_user(
     payload: schemas.UserServiceCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader),
     current_user: models.User = Depends(get_current_user)
 ):
     # Только админ клиента может назначать сервисы
     if current_user.role != UserRole.client_admin:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     # Проверяем, что пользователь и client_service существуют
-    user = crud.get_user(db, payload.user_id)
+    # Пользователь, подключение и клиент загружаются одним пакетом
+    user, cs, client = await asyncio.gather(
+        loader.load(models.User, payload.user_id),
+        loader.load(models.ClientService, payload.client_service_id),
+        loader.load(models.Client, current_user.client_id),
+    )
     if not user or user.client_id != current_user.client_id:
         raise HTTPException(status_code=404, detail="Target user not found or outside your client")
-    cs = crud.get_client_service(db, payload.client_service_id)
     if not cs or cs.client_id != current_user.client_id:
         raise HTTPException(status_code=404, detail="ClientService not found or outside your client")
-    # Проверяем лимит по тарифу (max_users_per_service)
-    client = crud.get_client(db, current_user.client_id)
-    assigned = crud.get_user_service_count(db, cs.id)
-    if assigned >= int(client.tariff_limits.get("max_users_per_service", assigned + 1)):
-        raise HTTPException(status_code=400, detail="Service user-limit exceeded")
-    return crud.create_user_service(db, payload.user_id, payload.client_service_id)
+    # Проверяем лимит по тарифу клиента (max_users на подключённый сервис)
+    tariff = await crud_async.get_tariff_by_name(db, client.tariff) if client and client.tariff else None
+    if tariff:
+        assigned = await crud_async.get_user_service_count(db, cs.id)
+        if assigned >= tariff.max_users:
+            raise HTTPException(status_code=400, detail="Service user-limit exceeded")
+    return await crud_async.create_user_service(db, payload.user_id, payload.client_service_id)
 
 @router.get(
     "/user/{user_id}",
-    response_model=List[schemas.UserServiceRead]
+    response_model=schemas.Page[schemas.UserServiceRead]
 )
-def list_user_services(
+async def list_user_services(
     user_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader),
     current_user: models.User = Depends(get_current_user)
 ):
     # Пользователь видит только свои, админ клиента — своих пользователей
@@ -62,24 +67,94 @@ def list_user_services(
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     if current_user.role == UserRole.client_admin and user_id != current_user.client_id:
         # user_id не совпадает с клиентом — сначала убедимся, что user принадлежит клиенту
-        target = crud.get_user(db, user_id)
+        target = await loader.load(models.User, user_id)
         if not target or target.client_id != current_user.client_id:
             raise HTTPException(status_code=403, detail="Insufficient permissions")
-    return crud.get_user_services(db, user_id)
+    # Версия списка — по клиенту пользователя, которому принадлежат назначения
+    target = current_user if current_user.id == user_id else await loader.load(models.User, user_id)
+    validator = await etags.validator(request, etags.user_services(target.client_id if target else None))
+    if validator.fresh:
+        return validator.not_modified()
+    result = await crud_async.get_user_services(db, user_id, page)
+    return validator.apply(serialization.page_response(schemas.UserServiceRead, result))
 
 @router.delete(
     "/{user_service_id}",
     response_model=schemas.UserServiceRead
 )
-def revoke_user_service(
+async def revoke_user_service(
     user_service_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader),
     current_user: models.User = Depends(get_current_user)
 ):
-    us = crud.get_user_service(db, user_service_id)
+    us = await loader.load(models.UserService, user_service_id)
     if not us:
         raise HTTPException(status_code=404, detail="UserService not found")
     # Только админ клиента своего клиента может отзывать
-    if current_user.role != UserRole.client_admin or us.user.client_id != current_user.client_id:
+    if current_user.role != UserRole.client_admin:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    # Ленивая загрузка us.user недоступна в AsyncSession — читаем через loader
+    target = await loader.load(models.User, us.user_id)
+    if not target or target.client_id != current_user.client_id:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
-    return crud.delete_user_service(db, user_service_id)
+    return await crud_async.delete_user_service(db, user_service_id)
+
+# ---------------------
+# Массовое назначение и отзыв: одна транзакция, set-based SQL
+# ---------------------
+
+async def _authorize_bulk(loader: Loader, current_user: models.User, payload: schemas.UserServiceBulk) -> List[int]:
+    if current_user.role not in (UserRole.portal_admin, UserRole.client_admin):
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    client_service_ids = sorted(set(payload.client_service_ids))
+    for cs in await loader.load_many(models.ClientService, client_service_ids):
+        if cs is None or (current_user.role == UserRole.client_admin and cs.client_id != current_user.client_id):
+            raise HTTPException(status_code=404, detail="ClientService not found or outside your client")
+    return client_service_ids
+
+def _bulk_result(changed: dict, client_service_ids: List[int]) -> schemas.UserServiceBulkResult:
+    return schemas.UserServiceBulkResult(
+        changed=sum(changed.values()),
+        items=[
+            schemas.UserServiceBulkItem(client_service_id=cs_id, changed=changed.get(cs_id, 0))
+            for cs_id in client_service_ids
+        ],
+    )
+
+@router.post(
+    "/bulk/grant",
+    response_model=schemas.UserServiceBulkResult
+)
+async def bulk_grant(
+    payload: schemas.UserServiceBulk,
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader),
+    current_user: models.User = Depends(get_current_user)
+):
+    # Назначаются только пользователи клиента, которому принадлежит подключение;
+    # уже назначенные пропускаются
+    client_service_ids = await _authorize_bulk(loader, current_user, payload)
+    changed, over_limit = await crud_async.bulk_grant_user_services(db, client_service_ids, payload.user_ids)
+    if over_limit:
+        raise HTTPException(
+            status_code=400,
+            detail={"message": "Service user-limit exceeded",
+                    "limits": [{"client_service_id": cs_id, "max_users": max_users}
+                               for cs_id, max_users in sorted(over_limit.items())]}
+        )
+    return _bulk_result(changed, client_service_ids)
+
+@router.post(
+    "/bulk/revoke",
+    response_model=schemas.UserServiceBulkResult
+)
+async def bulk_revoke(
+    payload: schemas.UserServiceBulk,
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader),
+    current_user: models.User = Depends(get_current_user)
+):
+    client_service_ids = await _authorize_bulk(loader, current_user, payload)
+    changed = await crud_async.bulk_revoke_user_services(db, client_service_ids, payload.user_ids)
+    return _bulk_result(changed, client_service_ids)
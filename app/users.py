@@ -1,12 +1,12 @@
 # app/routers/users.py
 
-from typing import List
+from fastapi import APIRouter, Depends, File, HTTPException, Request, Response, UploadFile, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-
-import crud, schemas, database, utils, models
+import catalog_cache, crud_async, etags, schemas, database, models, hashing, serialization, sessions, user_import
 from auth import get_current_user, require_role
+from loader import Loader, get_loader
+from pagination import PageParams, page_of
 from schemas import UserRole
 
 router = APIRouter(
@@ -14,13 +14,6 @@ router = APIRouter(
     tags=["users"],
 )
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # CREATE: только portal_admin
 @router.post(
     "/",
@@ -28,52 +21,81 @@ def get_db():
     status_code=status.HTTP_201_CREATED,
     dependencies=[Depends(require_role(UserRole.portal_admin))]
 )
-def create_user(
+async def create_user(
     user_in: schemas.UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    if crud.get_user_by_username(db, user_in.username):
+    if await crud_async.get_user_by_username(db, user_in.username):
         raise HTTPException(status_code=400, detail="Username already registered")
-    return crud.create_user(db, user_in)
+    hashed_password = await hashing.hash_password(user_in.password)
+    return await crud_async.create_user(db, user_in, hashed_password)
+
+# BULK IMPORT: portal_admin — в любой клиент, client_admin — в свой
+@router.post(
+    "/import",
+    response_model=schemas.UserImportResult
+)
+async def import_users(
+    file: UploadFile = File(...),
+    format: schemas.ImportFormat = schemas.ImportFormat.csv,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    if current_user.role not in (UserRole.portal_admin, UserRole.client_admin):
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    return await user_import.import_users(db, file, format, current_user)
 
 # LIST: portal_admin видит всех, client_admin своих, user – только себя
 @router.get(
     "/",
-    response_model=List[schemas.UserRead],
-    dependencies=[Depends(get_current_user)]
+    response_model=schemas.Page[schemas.UserRead]
 )
-def list_users(
-    db: Session = Depends(get_db),
+async def list_users(
+    request: Request,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(get_current_user)
 ):
+    scope = etags.USERS if current_user.role == UserRole.portal_admin else etags.users(current_user.client_id)
+    validator = await etags.validator(request, scope)
+    if validator.fresh:
+        return validator.not_modified()
     if current_user.role == UserRole.portal_admin:
-        return crud.get_users(db)
+        result = await crud_async.get_users(db, page)
     elif current_user.role == UserRole.client_admin:
-        return db.query(models.User).filter(models.User.client_id == current_user.client_id).all()
+        result = await crud_async.get_users_by_client(db, current_user.client_id, page)
     else:  # обычный пользователь
-        return [current_user]
+        result = page_of([current_user])
+    return validator.apply(serialization.page_response(schemas.UserRead, result))
 
 # READ: portal_admin любой, client_admin своих, user – только себя
 @router.get(
     "/{user_id}",
-    response_model=schemas.UserRead,
-    dependencies=[Depends(get_current_user)]
+    response_model=schemas.UserRead
 )
-def read_user(
+async def read_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    loader: Loader = Depends(get_loader),
     current_user: models.User = Depends(get_current_user)
 ):
-    user = crud.get_user(db, user_id)
+    user = await loader.load(models.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if current_user.role == UserRole.portal_admin:
-        return user
-    if current_user.role == UserRole.client_admin and user.client_id == current_user.client_id:
-        return user
-    if current_user.role == UserRole.user and user.id == current_user.id:
-        return user
-    raise HTTPException(status_code=403, detail="Insufficient permissions")
+    allowed = (
+        current_user.role == UserRole.portal_admin
+        or (current_user.role == UserRole.client_admin and user.client_id == current_user.client_id)
+        or (current_user.role == UserRole.user and user.id == current_user.id)
+    )
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    # Строка уже прочитана для проверки прав; 304 экономит сериализацию и трафик
+    validator = await etags.validator(request, etags.users(user.client_id))
+    if validator.fresh:
+        return validator.not_modified()
+    validator.apply(response)
+    return user
 
 # UPDATE: только portal_admin
 @router.put(
@@ -81,23 +103,34 @@ def read_user(
     response_model=schemas.UserRead,
     dependencies=[Depends(require_role(UserRole.portal_admin))]
 )
-def update_user(
+async def update_user(
     user_id: int,
     user_in: schemas.UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(database.get_async_db),
+    loader: Loader = Depends(get_loader)
 ):
-    user = crud.get_user(db, user_id)
+    user = await loader.load(models.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    # При переводе в другой клиент назначения старого клиента снимаются
+    old_client_id = user.client_id
+    moved = old_client_id != user_in.client_id
+    if moved:
+        await crud_async.revoke_all_user_services(db, user.id)
     # Обновляем поля
     user.email = user_in.email
     user.role = user_in.role
     user.client_id = user_in.client_id
     # Если передали пароль — меняем хэш
     if user_in.password:
-        user.password_hash = utils.hash_password(user_in.password)
-    db.commit()
-    db.refresh(user)
+        user.password_hash = await hashing.hash_password(user_in.password)
+    await db.commit()
+    await db.refresh(user)
+    await sessions.invalidate_user(user.id)
+    await etags.bump_users(old_client_id, user.client_id)
+    if moved:
+        await catalog_cache.invalidate(catalog_cache.ENTITLEMENTS, user.id)
+        await etags.bump(etags.user_services(old_client_id))
     return user
 
 # DELETE: только portal_admin
@@ -106,11 +139,11 @@ def update_user(
     response_model=schemas.UserRead,
     dependencies=[Depends(require_role(UserRole.portal_admin))]
 )
-def delete_user(
+async def delete_user(
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    user = crud.delete_user(db, user_id)
+    user = await crud_async.delete_user(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -1,10 +1,29 @@
 # app/utils.py
+from typing import List, Optional, Tuple
+
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import config
+
+# min/max совпадают с default: смена BCRYPT_ROUNDS помечает старые хэши
+# как требующие обновления (needs_update), и они перехэшируются при входе
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=config.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=config.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=config.BCRYPT_ROUNDS,
+)
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
+def hash_passwords(passwords: List[str]) -> List[str]:
+    # Пачка хэшей за один вызов в процессе пула (меньше накладных расходов на IPC)
+    return [pwd_context.hash(password) for password in passwords]
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
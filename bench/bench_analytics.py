@@ -0,0 +1,122 @@
+# bench/bench_analytics.py
+#
+# Аналитика usage по клиенту на данных seed.py: top-N пользователей,
+# распределение суточного потребления по сервисам (p50/p95, гистограмма) и
+# скользящее среднее — запросы rollups.py, вызываемые так же, как из
+# роутера. Для сравнения — прежний путь «выгрузить сырые строки клиента за
+# период и посчитать у себя» (--raw-clients первых клиентов: на крупных
+# арендаторах он на порядки медленнее). Клиенты — самые активные за
+# период (последние --days дней окна seed.py из манифеста).
+# Целевой объём — история в 100M строк:
+#
+#   python bench/seed.py --reset --clients 2000 --users 200000 --usage-rows 100000000 --jobs 8
+#   python bench/bench_analytics.py --clients 50 --raw-clients 5
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from sqlalchemy import Date, cast, func, select  # noqa: E402
+
+import crud_async, database, models, schemas  # noqa: E402
+from common import percentile, report  # noqa: E402
+
+
+def summarize(samples, extra=None) -> dict:
+    stats = {
+        "runs": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
+    stats.update(extra or {})
+    return stats
+
+
+def raw_analytics(rows, date_from: datetime.date, days: int, limit: int) -> dict:
+    # Что приходится делать у себя без аналитических эндпоинтов
+    per_user = defaultdict(int)
+    per_service_day = defaultdict(lambda: [0] * days)
+    for user_id, service_id, day, amount in rows:
+        per_user[user_id] += amount
+        per_service_day[service_id][(day - date_from).days] += amount
+    top = sorted(per_user.items(), key=lambda item: -item[1])[:limit]
+    quantiles = {
+        service_id: (percentile(series, 50), percentile(series, 95)) for service_id, series in per_service_day.items()
+    }
+    return {"top": top, "quantiles": quantiles}
+
+
+async def main_async(args):
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    date_to = datetime.date.fromisoformat(manifest["window"]["to"])
+    date_from = date_to - datetime.timedelta(days=args.days - 1)
+    days = args.days
+
+    timings = defaultdict(list)
+    async with database.AsyncSessionLocal() as db:
+        rollup = models.UsageDailyRollup
+        client_ids = list(await db.scalars(
+            select(rollup.client_id)
+            .where(rollup.day.between(date_from, date_to))
+            .group_by(rollup.client_id)
+            .order_by(func.sum(rollup.total_amount).desc())
+            .limit(args.clients)
+        ))
+        for client_id in client_ids:
+            scope = {"client_id": client_id}
+            start = time.perf_counter()
+            await crud_async.get_usage_top(db, schemas.UsageGroupBy.user, scope, date_from, date_to, args.limit)
+            timings["top_users"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await crud_async.get_usage_distribution(db, schemas.UsageGroupBy.service, scope, date_from, date_to,
+                                                    [50, 95], 10)
+            timings["distribution_services"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await crud_async.get_usage_trend(db, schemas.UsageGroupBy.service, scope, date_from, date_to, 7)
+            timings["trend_services"].append(time.perf_counter() - start)
+
+        rows_fetched = []
+        for client_id in client_ids[:args.raw_clients]:
+            # Сырые строки: только нужные столбцы, без ORM-объектов
+            query = (
+                select(models.Usage.user_id, models.ClientService.service_id,
+                       cast(models.Usage.usage_date, Date), models.Usage.usage_amount)
+                .join(models.ClientService)
+                .where(models.ClientService.client_id == client_id,
+                       models.Usage.usage_date >= date_from,
+                       models.Usage.usage_date < date_to + datetime.timedelta(days=1))
+            )
+            start = time.perf_counter()
+            rows = (await db.execute(query)).all()
+            raw_analytics(rows, date_from, days, args.limit)
+            timings["raw_rows_client_side"].append(time.perf_counter() - start)
+            rows_fetched.append(len(rows))
+    await database.async_engine.dispose()
+
+    print(f"usage rows: {manifest['counts']['usage']}, period {date_from}..{date_to}, clients {len(client_ids)}")
+    for name, samples in timings.items():
+        extra = {"rows_max": max(rows_fetched)} if name == "raw_rows_client_side" and rows_fetched else None
+        report(name, summarize(samples, extra))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--manifest", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "seed.json"))
+    parser.add_argument("--clients", type=int, default=50, help="сколько самых активных клиентов опросить")
+    parser.add_argument("--raw-clients", type=int, default=5, help="для скольких из них замерить сырой путь")
+    parser.add_argument("--days", type=int, default=30, help="длина периода, дней")
+    parser.add_argument("--limit", type=int, default=20)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
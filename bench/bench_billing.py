@@ -0,0 +1,78 @@
+# bench/bench_billing.py
+#
+# Расчёт счетов (billing.py) на данных seed.py: полный первый прогон по всей
+# истории usage с разным числом процессов (--jobs 1,4,8), затем
+# инкрементальные — без новых событий и после дозаписи --delta-rows строк
+# (копии последних строк usage с текущей датой). Перед каждым полным
+# прогоном состояние расчёта очищается: бенч стирает invoices,
+# invoice_lines, billing_checkpoints и billing_runs.
+#
+#   python bench/seed.py --reset --clients 2000 --users 200000 --usage-rows 100000000 --jobs 8
+#   python bench/bench_billing.py --jobs 1,4,8 --delta-rows 100000
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from sqlalchemy import text  # noqa: E402
+
+import billing, database  # noqa: E402
+from common import report  # noqa: E402
+
+_RESET_SQL = text("TRUNCATE invoice_lines, invoices, billing_checkpoints, billing_runs RESTART IDENTITY")
+
+_DELTA_SQL = text("""
+INSERT INTO usage (client_service_id, user_id, usage_date, usage_amount)
+SELECT client_service_id, user_id, now() AT TIME ZONE 'utc', usage_amount
+FROM usage ORDER BY id DESC LIMIT :rows
+""")
+
+_CHECK_SQL = text("""
+SELECT (SELECT coalesce(sum(usage_units), 0) FROM invoices),
+       (SELECT coalesce(sum(usage_amount), 0) FROM usage u JOIN client_services cs ON cs.id = u.client_service_id)
+""")
+
+
+def timed_run(engine, jobs: int, chunk: int) -> dict:
+    start = time.perf_counter()
+    result = billing.run(engine, jobs, chunk)
+    seconds = time.perf_counter() - start
+    return {
+        "jobs": jobs, "seconds": round(seconds, 2), "clients": result["clients"], "usage_rows": result["usage_rows"],
+        "rows_per_s": round(result["usage_rows"] / seconds) if seconds else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", default="1,4", help="число процессов для полных прогонов, через запятую")
+    parser.add_argument("--chunk", type=int, default=200, help="клиентов в пачке")
+    parser.add_argument("--delta-rows", type=int, default=100000, help="строк usage для инкрементального прогона")
+    parser.add_argument("--verify", action="store_true", help="сверить сумму usage_units с usage (полный проход)")
+    args = parser.parse_args()
+    jobs_list = [int(j) for j in args.jobs.split(",")]
+    engine = database.engine
+
+    for jobs in jobs_list:
+        with engine.begin() as conn:
+            conn.execute(_RESET_SQL)
+        report(f"full_run_jobs_{jobs}", timed_run(engine, jobs, args.chunk))
+
+    jobs = max(jobs_list)
+    report("incremental_empty", timed_run(engine, jobs, args.chunk))
+    with engine.begin() as conn:
+        conn.execute(_DELTA_SQL, {"rows": args.delta_rows})
+    report(f"incremental_{args.delta_rows}_rows", timed_run(engine, jobs, args.chunk))
+
+    if args.verify:
+        with engine.connect() as conn:
+            billed, used = conn.execute(_CHECK_SQL).one()
+        report("verify", {"invoiced_units": int(billed), "usage_units": int(used), "match": billed == used})
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# bench/bench_db_layer.py
+#
+# Сравнение пропускной способности синхронного (psycopg2 + threadpool) и
+# асинхронного (asyncpg) слоёв доступа к данным на одном и том же запросе.
+# Синхронный путь ограничен числом потоков, как sync-обработчики FastAPI
+# (по умолчанию 40), асинхронный — только пулом соединений.
+#
+#   python bench/bench_db_layer.py -c 200 -n 5000
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import crud_async, database, models  # noqa: E402
+from common import report, summarize  # noqa: E402
+from pagination import PageParams  # noqa: E402
+
+
+def bench_sync(total: int, threads: int):
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        db = database.SessionLocal()
+        try:
+            # Тот же запрос, что crud_async.get_services с limit=100
+            db.query(models.Service).order_by(models.Service.id).limit(100).all()
+        finally:
+            db.close()
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies.extend(pool.map(one, range(total)))
+    return summarize(latencies, 0, time.perf_counter() - started)
+
+
+async def bench_async(total: int, concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            async with database.AsyncSessionLocal() as db:
+                await crud_async.get_services(db, PageParams(limit=100))
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    await database.async_engine.dispose()
+    return summarize(latencies, 0, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--concurrency", type=int, default=200)
+    parser.add_argument("-n", "--requests", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=40, help="размер threadpool для sync-пути")
+    args = parser.parse_args()
+
+    report("sync", bench_sync(args.requests, args.threads))
+    report("async", asyncio.run(bench_async(args.requests, args.concurrency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# bench/bench_export.py
+#
+# Пропускная способность потоковой выгрузки usage и пиковый RSS воркера.
+# RSS читается из /proc/<pid>/status (VmHWM), поэтому скрипт запускается на
+# той же машине, что и uvicorn с одним воркером (--server-pid).
+#
+#   python bench/bench_export.py --username admin --password secret --path /usage/client/1/export?format=csv --server-pid 1234
+
+import argparse
+import time
+import urllib.request
+
+from common import login, report
+
+
+def read_status_kb(pid: int, field: str) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--path", required=True, help="например /usage/client/1/export?format=ndjson")
+    parser.add_argument("--server-pid", type=int, default=None)
+    args = parser.parse_args()
+
+    token = login(args.url, args.username, args.password)
+    request = urllib.request.Request(f"{args.url}{args.path}", headers={"Authorization": f"Bearer {token}"})
+    rss_before = read_status_kb(args.server_pid, "VmRSS") if args.server_pid else None
+
+    total_bytes = lines = 0
+    first_byte = None
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=3600) as response:
+        while True:
+            chunk = response.read(1 << 16)
+            if not chunk:
+                break
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            total_bytes += len(chunk)
+            lines += chunk.count(b"\n")
+    elapsed = time.perf_counter() - started
+
+    stats = {
+        "bytes": total_bytes,
+        "lines": lines,
+        "elapsed_s": round(elapsed, 3),
+        "ttfb_ms": round((first_byte or 0) * 1000, 2),
+        "mb_per_s": round(total_bytes / elapsed / 1e6, 2) if elapsed else 0.0,
+        "rows_per_s": round(lines / elapsed, 1) if elapsed else 0.0,
+    }
+    if args.server_pid:
+        stats["worker_rss_before_kb"] = rss_before
+        stats["worker_rss_peak_kb"] = read_status_kb(args.server_pid, "VmHWM")
+    report("export", stats)
+
+
+if __name__ == "__main__":
+    main()
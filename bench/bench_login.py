@@ -0,0 +1,63 @@
+# bench/bench_login.py
+#
+# p50/p99 для /auth/login при конкурентной нагрузке. С --probe параллельно
+# опрашивается посторонний маршрут: видно, тормозит ли вход остальной API.
+#
+#   python bench/bench_login.py --username admin --password secret -c 32 -n 500 --probe /openapi.json
+
+import argparse
+import threading
+import time
+import urllib.parse
+
+from common import http, percentile, report, run_concurrent
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("-n", "--requests", type=int, default=500)
+    parser.add_argument("--probe", default=None, help="путь, задержка которого меряется во время нагрузки")
+    args = parser.parse_args()
+
+    body = urllib.parse.urlencode({"username": args.username, "password": args.password}).encode()
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+
+    def do_login(_):
+        http("POST", f"{args.url}/auth/login", body, headers)
+
+    probe_latencies = []
+    stop = threading.Event()
+
+    def probe():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                http("GET", f"{args.url}{args.probe}")
+                probe_latencies.append(time.perf_counter() - start)
+            except Exception:
+                pass
+            time.sleep(0.05)
+
+    prober = threading.Thread(target=probe, daemon=True) if args.probe else None
+    if prober:
+        prober.start()
+    stats = run_concurrent(do_login, args.requests, args.concurrency)
+    stop.set()
+    if prober:
+        prober.join()
+
+    report("login", stats)
+    if prober:
+        report("probe", {
+            "samples": len(probe_latencies),
+            "p50_ms": round(percentile(probe_latencies, 50) * 1000, 2),
+            "p99_ms": round(percentile(probe_latencies, 99) * 1000, 2),
+        })
+
+
+if __name__ == "__main__":
+    main()
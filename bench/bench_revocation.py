@@ -0,0 +1,103 @@
+# bench/bench_revocation.py
+#
+# Стоимость проверки отзыва сессии на один аутентифицированный запрос:
+# локальный Bloom-фильтр (sessions.BloomFilter), SISMEMBER в Redis по
+# двум интервалам (путь при «возможно» фильтра) и, для сравнения, прежнее
+# чтение пользователя из Postgres по username. Дополнительно считается доля
+# ложных срабатываний фильтра при --revoked отозванных сессиях — столько
+# проверок уходит в Redis. Нужны Redis и БД с хотя бы одним пользователем.
+#
+#   python bench/bench_revocation.py --revoked 20000 --checks 100000
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from sqlalchemy import select  # noqa: E402
+
+import config, database, models, redis_client, sessions  # noqa: E402
+from common import percentile, report  # noqa: E402
+
+
+def summary(samples, total: float) -> dict:
+    return {
+        "checks": len(samples),
+        "per_check_us": round(total / len(samples) * 1e6, 2),
+        "p50_us": round(percentile(samples, 50) * 1e6, 2),
+        "p99_us": round(percentile(samples, 99) * 1e6, 2),
+    }
+
+
+async def measure(fn, n: int) -> dict:
+    samples = []
+    started = time.perf_counter()
+    for i in range(n):
+        start = time.perf_counter()
+        await fn(i)
+        samples.append(time.perf_counter() - start)
+    return summary(samples, time.perf_counter() - started)
+
+
+async def main_async(args):
+    revoked = [uuid.uuid4().hex for _ in range(args.revoked)]
+    live = [uuid.uuid4().hex for _ in range(args.checks)]
+
+    bloom = sessions.BloomFilter(config.SESSION_BLOOM_CAPACITY, config.SESSION_BLOOM_ERROR_RATE)
+    for sid in revoked:
+        bloom.add(sid)
+    false_positives = sum(1 for sid in live if sid in bloom)
+    report("bloom_filter", {
+        "bits": bloom.size, "hashes": bloom.hashes, "revoked": len(revoked),
+        "false_positive_rate": round(false_positives / len(live), 5),
+    })
+
+    async def local(i):
+        return live[i] in bloom
+
+    report("check_local", await measure(local, args.checks))
+
+    redis = redis_client.get_redis()
+    keys = sessions._revoked_keys(time.time())
+    bench_key = f"bench:{keys[0]}"
+    await redis.sadd(bench_key, *revoked)
+    try:
+        async def remote(i):
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.sismember(bench_key, live[i])
+                pipe.sismember(keys[1], live[i])
+                return any(await pipe.execute())
+
+        report("check_redis", await measure(remote, min(args.checks, args.remote_checks)))
+    finally:
+        await redis.delete(bench_key)
+        await redis_client.close()
+
+    async with database.AsyncSessionLocal() as db:
+        username = await db.scalar(select(models.User.username).limit(1))
+        if username is None:
+            print("check_db: skipped, no users")
+            return
+
+        async def from_db(i):
+            await db.scalar(select(models.User).where(models.User.username == username))
+            db.expunge_all()
+
+        report("check_db_principal", await measure(from_db, min(args.checks, args.remote_checks)))
+    await database.async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--revoked", type=int, default=20000, help="отозванных сессий в фильтре")
+    parser.add_argument("--checks", type=int, default=100000)
+    parser.add_argument("--remote-checks", type=int, default=5000, help="проверок через Redis и БД")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
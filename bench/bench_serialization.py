@@ -0,0 +1,92 @@
+# bench/bench_serialization.py
+#
+# Стоимость сериализации страницы списка (мс на --rows строк) для трёх
+# путей: стандартный путь FastAPI для response_model (валидация, dump в
+# python-объекты, json.dumps), быстрый путь serialization.page_response по
+# ORM-объектам и по строкам Core. Строки Core моделируются namedtuple —
+# sqlalchemy Row ведёт себя так же (доступ к полям по атрибутам).
+# БД не нужна.
+#
+#   python bench/bench_serialization.py --rows 10000 --repeat 20
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import models, schemas, serialization  # noqa: E402
+from common import percentile, report  # noqa: E402
+
+
+def usage_orm(n: int):
+    now = datetime.datetime(2025, 1, 1)
+    return [
+        models.Usage(id=i, client_service_id=i % 50, user_id=i % 500,
+                     usage_date=now + datetime.timedelta(seconds=i), usage_amount=i % 100)
+        for i in range(n)
+    ]
+
+
+def user_orm(n: int):
+    return [
+        models.User(id=i, username=f"user{i}", email=f"user{i}@example.com",
+                    role=models.UserRole.user, client_id=i % 20)
+        for i in range(n)
+    ]
+
+
+def as_rows(objects, schema):
+    fields = list(schema.model_fields)
+    Row = namedtuple("Row", fields)
+    return [Row(*(getattr(obj, name) for name in fields)) for obj in objects]
+
+
+def fastapi_default(schema, page: dict) -> bytes:
+    # То же, что делает FastAPI: field.validate -> field.serialize(mode="json") -> JSONResponse.render
+    adapter = serialization.page_adapter(schema)
+    content = adapter.dump_python(adapter.validate_python(page), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(schema, page: dict) -> bytes:
+    return serialization.page_response(schema, page).body
+
+
+def measure(fn, schema, page, repeat: int) -> dict:
+    fn(schema, page)  # прогрев (сборка валидатора)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(schema, page)
+        timings.append(time.perf_counter() - start)
+    return {
+        "p50_ms": round(percentile(timings, 50) * 1000, 2),
+        "p95_ms": round(percentile(timings, 95) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for name, schema, objects in (
+        ("usage", schemas.UsageRead, usage_orm(args.rows)),
+        ("users", schemas.UserRead, user_orm(args.rows)),
+    ):
+        orm_page = {"items": objects, "next_cursor": None}
+        row_page = {"items": as_rows(objects, schema), "next_cursor": None}
+        assert json.loads(fastapi_default(schema, orm_page)) == json.loads(fast_path(schema, row_page))
+        report(f"{name} fastapi_default_orm", measure(fastapi_default, schema, orm_page, args.repeat))
+        report(f"{name} fast_orm", measure(fast_path, schema, orm_page, args.repeat))
+        report(f"{name} fast_rows", measure(fast_path, schema, row_page, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# bench/bench_startup.py
+#
+# Время холодного старта: импорт main в новом процессе и запуск uvicorn
+# до первого ответа, которому нужна БД (POST /auth/login с неверным паролем,
+# ожидается 401). Каждый повтор — новый процесс, поэтому в замер входят
+# импорт модулей, создание движков и проверка версии схемы в lifespan.
+# Схема должна быть создана заранее: python app/migrate.py upgrade.
+#
+#   python bench/bench_startup.py --repeat 10
+#   python bench/bench_startup.py --repeat 5 --workers 4
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+
+from common import http, percentile, report
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+_IMPORT = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def stats(samples):
+    return {
+        "runs": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 1),
+        "p95_ms": round(percentile(samples, 95) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def measure_import() -> float:
+    result = subprocess.run([sys.executable, "-c", _IMPORT], cwd=APP_DIR, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def first_response(url: str) -> bool:
+    try:
+        http("POST", f"{url}/auth/login", b"username=bench-startup&password=-",
+             {"Content-Type": "application/x-www-form-urlencoded"}, timeout=5)
+    except urllib.error.HTTPError as e:
+        return e.code == 401
+    except OSError:
+        return False
+    return False
+
+
+def measure_first_request(port: int, workers: int, timeout: float) -> float:
+    url = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+               "--log-level", "warning"]
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=APP_DIR)
+    try:
+        while not first_response(url):
+            if server.poll() is not None:
+                raise SystemExit(f"uvicorn exited with code {server.returncode}")
+            if time.perf_counter() - start > timeout:
+                raise SystemExit("uvicorn did not answer in time")
+            time.sleep(0.01)
+        return time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    report("import_main", stats([measure_import() for _ in range(args.repeat)]))
+    samples = [measure_first_request(args.port, args.workers, args.timeout) for _ in range(args.repeat)]
+    report(f"first_request_workers_{args.workers}", stats(samples))
+
+
+if __name__ == "__main__":
+    main()
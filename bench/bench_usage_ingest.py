@@ -0,0 +1,56 @@
+# bench/bench_usage_ingest.py
+#
+# Строк в секунду: построчная запись (create_usage, commit на каждую строку)
+# против пакетной (create_usage_batch: многострочный INSERT или COPY).
+# Нужны существующие client_service и пользователь того же клиента.
+#
+#   python bench/bench_usage_ingest.py --client-service-id 1 --user-id 1 -n 20000 --batch 5000
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import crud_async, database, schemas  # noqa: E402
+from common import report  # noqa: E402
+
+
+async def run(args):
+    item = schemas.UsageCreate(client_service_id=args.client_service_id, user_id=args.user_id, usage_amount=1)
+
+    per_row = min(args.requests, args.per_row_limit)
+    async with database.AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        for _ in range(per_row):
+            await crud_async.create_usage(db, item.client_service_id, item.user_id, item.usage_amount)
+        elapsed = time.perf_counter() - started
+    report("per_row", {"rows": per_row, "elapsed_s": round(elapsed, 3), "rows_per_s": round(per_row / elapsed, 1)})
+
+    async with database.AsyncSessionLocal() as db:
+        accepted = 0
+        started = time.perf_counter()
+        for offset in range(0, args.requests, args.batch):
+            size = min(args.batch, args.requests - offset)
+            count, _ = await crud_async.create_usage_batch(db, [item] * size)
+            accepted += count
+        elapsed = time.perf_counter() - started
+    report("batch", {"rows": accepted, "batch": args.batch, "elapsed_s": round(elapsed, 3),
+                     "rows_per_s": round(accepted / elapsed, 1)})
+    await database.async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--client-service-id", type=int, required=True)
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("-n", "--requests", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--per-row-limit", type=int, default=2000, help="построчный путь медленный — ограничиваем")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
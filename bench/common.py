@@ -0,0 +1,75 @@
+# bench/common.py
+#
+# Общие помощники для нагрузочных замеров: конкурентный прогон функции
+# и отчёт по перцентилям задержки. Только стандартная библиотека.
+
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def run_concurrent(fn: Callable[[int], None], total: int, concurrency: int) -> Dict:
+    # fn(i) выполняет одну операцию; исключение считается ошибкой
+    latencies: List[float] = []
+    errors = 0
+
+    def one(i: int):
+        start = time.perf_counter()
+        try:
+            fn(i)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for result in pool.map(one, range(total)):
+            if result is None:
+                errors += 1
+            else:
+                latencies.append(result)
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, errors, elapsed)
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def report(name: str, stats: Dict) -> None:
+    print(f"{name}: " + json.dumps(stats, ensure_ascii=False))
+
+
+def http(method: str, url: str, data: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None,
+         timeout: float = 30.0) -> bytes:
+    request = urllib.request.Request(url, data=data, method=method, headers=headers or {})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def login(base_url: str, username: str, password: str) -> str:
+    body = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    raw = http("POST", f"{base_url}/auth/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+    return json.loads(raw)["access_token"]
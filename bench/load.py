@@ -0,0 +1,210 @@
+# bench/load.py
+#
+# Нагрузочный прогон основных сценариев по данным seed.py: вход, чтение
+# каталога, запись usage, отчёты и проверки прав. Для каждого сценария
+# считаются пропускная способность и перцентили задержки; итог пишется в
+# JSON (--out) и сравнивается с базовой линией (--baseline). Выход с кодом 1,
+# если какой-либо сценарий вышел за пороги.
+#
+#   python bench/load.py -c 32 -n 2000 --out bench/results.json --baseline bench/baseline.json
+#   python bench/load.py -c 32 -n 2000 --baseline bench/baseline.json --update-baseline
+#
+# Формат базовой линии:
+#   {"thresholds": {"default": {"throughput_rps": 0.1, "p95_ms": 0.25, "p99_ms": 0.5, "errors": 0},
+#                   "login": {"p95_ms": 0.4}},
+#    "meta": {...}, "scenarios": {"login": {"throughput_rps": ..., "p95_ms": ..., ...}}}
+# throughput_rps — допустимое относительное падение, *_ms — относительный
+# рост, errors — сколько ошибок можно сверх базовой линии.
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import urllib.parse
+from typing import Callable, Dict, List
+
+from common import http, login, report, run_concurrent
+
+SCENARIOS = ("login", "catalog", "ingest", "reports", "authz")
+
+DEFAULT_THRESHOLDS = {"throughput_rps": 0.10, "p95_ms": 0.25, "p99_ms": 0.50, "errors": 0}
+
+
+class Picker:
+    """Выбор из выборки манифеста с перекосом к её началу (горячие id)."""
+
+    def __init__(self, items: List, skew: float, seed: int):
+        if not items:
+            raise SystemExit("в манифесте пустая выборка: перезапустите seed.py")
+        self.items = items
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank + 1) ** skew for rank in range(len(items))))
+        self.rng = random.Random(seed)
+
+    def __call__(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+
+def build_scenarios(args, manifest: dict) -> Dict[str, Callable[[int], None]]:
+    url = args.url
+    password = manifest["password"]
+    users = Picker(manifest["users"][:args.tokens], args.skew, args.seed)
+    admins = Picker(manifest["client_admins"][:args.tokens], args.skew, args.seed + 1)
+    pairs = Picker(manifest["pairs"], args.skew, args.seed + 2)
+
+    def auth(token: str) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {token}"}
+
+    # Токены получаются заранее и в замер не входят
+    tokens = {}
+    for user in itertools.chain(users.items, admins.items):
+        tokens[user["id"]] = auth(login(url, user["username"], password))
+    admin = auth(login(url, manifest["admin"], password))
+    login_body = {
+        user["id"]: urllib.parse.urlencode({"username": user["username"], "password": password}).encode()
+        for user in users.items
+    }
+    window_from = manifest["window"]["from"]
+
+    def do_login(_):
+        user = users()
+        http("POST", f"{url}/auth/login", login_body[user["id"]],
+             {"Content-Type": "application/x-www-form-urlencoded"})
+
+    catalog_paths = ("/services/", "/tariffs/", "/clients/me")
+
+    def do_catalog(i):
+        http("GET", f"{url}{catalog_paths[i % len(catalog_paths)]}", headers=tokens[users()["id"]])
+
+    def do_ingest(_):
+        items = []
+        for _ in range(args.batch_size):
+            pair = pairs()
+            items.append({"client_service_id": pair["client_service_id"], "user_id": pair["user_id"],
+                          "usage_amount": 1})
+        query = "?buffered=true" if args.buffered else ""
+        http("POST", f"{url}/usage/batch{query}", json.dumps({"items": items}).encode(),
+             {**admin, "Content-Type": "application/json"})
+
+    def do_reports(i):
+        if i % 2:
+            user = users()
+            http("GET", f"{url}/usage/user/{user['id']}?limit=100", headers=tokens[user["id"]])
+        else:
+            client_admin = admins()
+            http("GET", f"{url}/usage/client/{client_admin['client_id']}/summary"
+                        f"?granularity=month&date_from={window_from}", headers=tokens[client_admin["id"]])
+
+    def do_authz(_):
+        pair = pairs()
+        http("GET", f"{url}/authz/check?user_id={pair['user_id']}&service_id={pair['service_id']}", headers=admin)
+
+    return {"login": do_login, "catalog": do_catalog, "ingest": do_ingest, "reports": do_reports, "authz": do_authz}
+
+
+def compare(results: dict, baseline: dict) -> List[str]:
+    thresholds = baseline.get("thresholds", {})
+    failures = []
+    for name, stats in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        limits = {**DEFAULT_THRESHOLDS, **thresholds.get("default", {}), **thresholds.get(name, {})}
+        for metric, tolerance in limits.items():
+            if metric not in stats or metric not in base:
+                continue
+            current, expected = stats[metric], base[metric]
+            if metric == "errors":
+                failed = current > expected + tolerance
+            elif metric.endswith("_rps"):
+                failed = current < expected * (1 - tolerance)
+            else:
+                failed = current > expected * (1 + tolerance)
+            if failed:
+                failures.append(f"{name}.{metric}: {current} (baseline {expected}, tolerance {tolerance})")
+    return failures
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--manifest", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "seed.json"))
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="через запятую: " + ", ".join(SCENARIOS))
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="запросов на сценарий")
+    parser.add_argument("--warmup", type=int, default=100, help="запросов на прогрев перед замером")
+    parser.add_argument("--tokens", type=int, default=50, help="сколько пользователей и client_admin логинятся")
+    parser.add_argument("--batch-size", type=int, default=100, help="строк usage в одном запросе ingest")
+    parser.add_argument("--buffered", action="store_true", help="ingest через буфер (?buffered=true)")
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=None, help="куда записать результаты (JSON)")
+    parser.add_argument("--baseline", default=None, help="базовая линия для сравнения")
+    parser.add_argument("--update-baseline", action="store_true", help="записать результаты в --baseline")
+    args = parser.parse_args()
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    scenarios = build_scenarios(args, manifest)
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "revision": git_revision(),
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "batch_size": args.batch_size,
+            "buffered": args.buffered,
+            "seed_counts": manifest.get("counts", {}),
+        },
+        "scenarios": {},
+    }
+    for name in selected:
+        if args.warmup:
+            run_concurrent(scenarios[name], args.warmup, args.concurrency)
+        stats = run_concurrent(scenarios[name], args.requests, args.concurrency)
+        if name == "ingest":
+            stats["rows_per_s"] = round(stats["throughput_rps"] * args.batch_size, 1)
+        results["scenarios"][name] = stats
+        report(name, stats)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline and args.update_baseline:
+        thresholds = {"default": dict(DEFAULT_THRESHOLDS)}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                thresholds = json.load(f).get("thresholds", thresholds)
+        with open(args.baseline, "w") as f:
+            json.dump({"thresholds": thresholds, **results}, f, indent=1)
+        print(f"baseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f))
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+        print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+# bench/seed.py
+#
+# Генератор синтетических данных для нагрузочных замеров: тарифы, сервисы,
+# клиенты, пользователи, подключения, назначения и история usage. Размеры
+# клиентов, популярность сервисов и активность пользователей распределены
+# по Ципфу (--skew): несколько крупных арендаторов и длинный хвост мелких.
+# Все таблицы заливаются через COPY, usage — параллельно (--jobs процессов,
+# коммит каждые --copy-batch строк). Результат детерминирован при том же --seed.
+#
+# Итог пишется в манифест (--manifest): параметры, число строк, учётные
+# данные и выборки id, по которым load.py строит нагрузку.
+#
+#   python bench/seed.py --reset --clients 2000 --users 200000 --usage-rows 100000000 --jobs 8
+#
+# --reset очищает ВСЕ таблицы приложения (TRUNCATE ... RESTART IDENTITY).
+
+import argparse
+import asyncio
+import bisect
+import datetime
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+from typing import Iterable, Iterator, List, Sequence
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from redis.exceptions import RedisError  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+import catalog_cache, database, entitlements, migrate, models, partitions, redis_client, rollups, utils  # noqa: E402
+
+TARIFFS = [
+    # name, max_users, max_services, period_days, price, limits, вес
+    ("bench-free", 10, 2, 30, 0, {"requests_per_second": 1, "burst": 5, "requests_per_day": 1000}, 50),
+    ("bench-basic", 100, 5, 30, 100,
+     {"requests_per_second": 10, "burst": 20, "requests_per_day": 100000, "unit_price": 0.01}, 30),
+    ("bench-pro", 1000, 15, 30, 1000, {"requests_per_second": 100, "burst": 200, "unit_price": 0.005}, 15),
+    ("bench-enterprise", 1000000, 100, 365, 10000, {"unit_price": 0.002}, 5),
+]
+
+# Заполняются в main до запуска пула процессов (наследуются при fork)
+_pairs: List[tuple] = []
+_pair_weights: List[float] = []
+_window: tuple = ()
+
+
+def zipf_weights(n: int, skew: float) -> List[float]:
+    return [1.0 / (rank + 1) ** skew for rank in range(n)]
+
+
+def split(total: int, weights: Sequence[float], minimum: int = 1) -> List[int]:
+    # Делит total пропорционально весам (метод наибольших остатков), не меньше minimum
+    free = total - minimum * len(weights)
+    if free < 0:
+        raise SystemExit(f"нужно не меньше {minimum * len(weights)} строк")
+    scale = sum(weights)
+    shares = [free * w / scale for w in weights]
+    counts = [int(s) for s in shares]
+    by_remainder = sorted(range(len(weights)), key=lambda i: shares[i] - counts[i], reverse=True)
+    for i in by_remainder[:free - sum(counts)]:
+        counts[i] += 1
+    return [c + minimum for c in counts]
+
+
+class RowStream:
+    """Файлоподобный поток строк для COPY FROM STDIN (формат text)."""
+
+    def __init__(self, rows: Iterable[Sequence]):
+        self._lines = ("\t".join(r"\N" if v is None else str(v) for v in row) + "\n" for row in rows)
+        self._buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            chunk = "".join(itertools.islice(self._lines, 1000))
+            if not chunk:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def copy(conn, table: str, columns: Sequence[str], rows: Iterable[Sequence]) -> None:
+    with conn.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", RowStream(rows))
+
+
+def reset(conn) -> None:
+    tables = ", ".join(table.name for table in models.Base.metadata.sorted_tables)
+    with conn.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {tables} RESTART IDENTITY CASCADE")
+    conn.commit()
+
+
+def fix_sequences(conn) -> None:
+    with conn.cursor() as cursor:
+        for table in ("tariffs", "services", "clients", "users", "client_services", "user_services"):
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT max(id) FROM {table}), 0) + 1, false)"
+            )
+    conn.commit()
+
+
+async def invalidate_caches() -> None:
+    # id после --reset повторяются: старые версии каталога и ETag не должны совпасть
+    redis = redis_client.get_redis()
+    try:
+        async for key in redis.scan_iter(match=catalog_cache.version_key("*")):
+            await redis.incr(key)
+        for kind in (catalog_cache.SERVICES, catalog_cache.TARIFFS, catalog_cache.CLIENTS,
+                     catalog_cache.CLIENT_SERVICES, catalog_cache.ENTITLEMENTS):
+            await catalog_cache.invalidate(kind)
+    except RedisError as exc:
+        print(f"redis недоступен, кэши не сброшены: {exc}")
+    finally:
+        await redis_client.close()
+
+
+def _usage_rows(job: int, rows: int, seed: int) -> Iterator[tuple]:
+    rng = random.Random(seed * 1000003 + job)
+    start, seconds = _window
+    cum_weights = list(itertools.accumulate(_pair_weights))
+    total_weight = cum_weights[-1]
+    for _ in range(rows):
+        cs_id, user_id = _pairs[bisect.bisect(cum_weights, rng.random() * total_weight)]
+        usage_date = start + datetime.timedelta(seconds=rng.random() * seconds)
+        yield cs_id, user_id, usage_date.isoformat(sep=" "), int(rng.expovariate(1 / 20)) + 1
+
+
+def _copy_usage(task: tuple) -> int:
+    job, rows, seed, batch = task
+    database.engine.dispose(close=False)  # соединения родителя после fork не используются
+    conn = database.engine.raw_connection()
+    try:
+        stream = _usage_rows(job, rows, seed)
+        done = 0
+        while done < rows:
+            size = min(batch, rows - done)
+            copy(conn, "usage", ("client_service_id", "user_id", "usage_date", "usage_amount"),
+                 itertools.islice(stream, size))
+            conn.commit()
+            done += size
+            print(f"  usage job {job}: {done}/{rows}", flush=True)
+        return done
+    finally:
+        conn.close()
+
+
+def main():
+    global _window
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--services", type=int, default=50)
+    parser.add_argument("--usage-rows", type=int, default=10000000)
+    parser.add_argument("--months", type=int, default=6, help="глубина истории usage до сегодняшнего дня")
+    parser.add_argument("--max-services", type=int, default=10, help="максимум подключений у клиента")
+    parser.add_argument("--skew", type=float, default=1.1, help="показатель распределения Ципфа")
+    parser.add_argument("--password", default="bench", help="пароль всех пользователей")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--copy-batch", type=int, default=1000000)
+    parser.add_argument("--sample", type=int, default=1000, help="сколько id каждого вида попадёт в манифест")
+    parser.add_argument("--skip-rollups", action="store_true")
+    parser.add_argument("--reset", action="store_true", help="очистить все таблицы перед заливкой")
+    parser.add_argument("--manifest", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "seed.json"))
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    migrate.upgrade(database.engine)
+    conn = database.engine.raw_connection()
+    if args.reset:
+        reset(conn)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM clients)")
+        if cursor.fetchone()[0]:
+            raise SystemExit("в базе уже есть клиенты: запустите с --reset")
+    timings = {}
+    started = time.perf_counter()
+
+    # Тарифы и сервисы
+    copy(conn, "tariffs", ("id", "name", "max_users", "max_services", "period_days", "price", "limits"), [
+        (i + 1, name, max_users, max_services, period, price, None if limits is None else json.dumps(limits))
+        for i, (name, max_users, max_services, period, price, limits, _) in enumerate(TARIFFS)
+    ])
+    copy(conn, "services", ("id", "name", "description"), [
+        (i, f"bench-service-{i}", f"Synthetic service #{i}") for i in range(1, args.services + 1)
+    ])
+
+    # Клиенты: размер по Ципфу, тариф крупных клиентов — старше
+    users_per_client = split(args.users, zipf_weights(args.clients, args.skew))
+    tariff_names = [t[0] for t in TARIFFS]
+    tariff_weights = [t[6] for t in TARIFFS]
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    client_tariffs = []
+    for rank in range(args.clients):
+        if users_per_client[rank] > TARIFFS[2][1]:
+            client_tariffs.append(TARIFFS[3][0])
+        else:
+            client_tariffs.append(rng.choices(tariff_names, tariff_weights)[0])
+    copy(conn, "clients", ("id", "name", "tariff", "created_at"), [
+        (cid, f"bench-client-{cid}", client_tariffs[cid - 1], now - datetime.timedelta(days=rng.randint(30, 1000)))
+        for cid in range(1, args.clients + 1)
+    ])
+
+    # Подключения: популярность сервисов тоже по Ципфу
+    service_ids = list(range(1, args.services + 1))
+    service_weights = zipf_weights(args.services, args.skew)
+    client_services = {}  # client_id -> [(cs_id, service_id)]
+    cs_rows = []
+    for cid in range(1, args.clients + 1):
+        wanted = min(args.services, args.max_services, 1 + int(rng.paretovariate(1.5)))
+        chosen = set()
+        while len(chosen) < wanted:
+            chosen.add(rng.choices(service_ids, service_weights)[0])
+        for service_id in sorted(chosen):
+            cs_id = len(cs_rows) + 1
+            expires_at = None if rng.random() < 0.8 else now + datetime.timedelta(days=rng.randint(-30, 365))
+            cs_rows.append((cs_id, cid, service_id, now - datetime.timedelta(days=rng.randint(1, 700)), expires_at))
+            client_services.setdefault(cid, []).append((cs_id, service_id))
+    copy(conn, "client_services", ("id", "client_id", "service_id", "connected_at", "expires_at"), cs_rows)
+    conn.commit()
+    timings["catalog_s"] = round(time.perf_counter() - started, 2)
+
+    # Пользователи: первый пользователь клиента — client_admin; один общий хэш пароля
+    password_hash = utils.hash_password(args.password)
+    user_rows = []
+    user_client = []
+    uid = 0
+    for cid, count in enumerate(users_per_client, start=1):
+        for k in range(count):
+            uid += 1
+            role = "client_admin" if k == 0 else "user"
+            user_rows.append((uid, f"bench_u{uid}", f"bench_u{uid}@example.com", password_hash, role, cid))
+            user_client.append(cid)
+    admin_id = uid + 1
+    user_rows.append((admin_id, "bench_admin", None, password_hash, "portal_admin", None))
+    copy(conn, "users", ("id", "username", "email", "password_hash", "role", "client_id"), user_rows)
+
+    # Назначения: часть сервисов клиента каждому пользователю
+    us_rows = []
+    for uid, cid in enumerate(user_client, start=1):
+        available = client_services[cid]
+        for cs_id, _ in rng.sample(available, rng.randint(1, len(available))):
+            us_rows.append((len(us_rows) + 1, uid, cs_id, now - datetime.timedelta(days=rng.randint(0, 365))))
+            _pairs.append((cs_id, uid))
+    copy(conn, "user_services", ("id", "user_id", "client_service_id", "granted_at"), us_rows)
+    conn.commit()
+    fix_sequences(conn)
+    timings["users_s"] = round(time.perf_counter() - started - timings["catalog_s"], 2)
+
+    with database.engine.begin() as sa_conn:
+        for statement in entitlements.rebuild_statements():
+            sa_conn.execute(statement)
+
+    # Usage: активность пар (подключение, пользователь) по Ципфу в случайном порядке
+    order = list(range(len(_pairs)))
+    rng.shuffle(order)
+    activity = zipf_weights(len(_pairs), args.skew)
+    _pair_weights.extend([0.0] * len(_pairs))
+    for rank, index in enumerate(order):
+        _pair_weights[index] = activity[rank]
+    end = now
+    start = (end - datetime.timedelta(days=30 * args.months)).replace(hour=0, minute=0, second=0)
+    _window = (start, (end - start).total_seconds())
+    month = partitions.month_start(start.date())
+    months = []
+    while month <= end.date():
+        months.append(month)
+        month = partitions.next_month(month)
+    partitions.ensure_for_dates_sync(database.engine, months)
+    conn.close()
+    database.engine.dispose()
+
+    usage_started = time.perf_counter()
+    jobs = max(1, min(args.jobs, args.usage_rows // 100000 + 1))
+    per_job = split(args.usage_rows, [1.0] * jobs, minimum=0)
+    tasks = [(job, rows, args.seed, args.copy_batch) for job, rows in enumerate(per_job) if rows]
+    if len(tasks) > 1:
+        with Pool(len(tasks)) as pool:
+            inserted = sum(pool.map(_copy_usage, tasks))
+    else:
+        inserted = sum(map(_copy_usage, tasks))
+    timings["usage_s"] = round(time.perf_counter() - usage_started, 2)
+    timings["usage_rows_per_s"] = round(inserted / timings["usage_s"]) if timings["usage_s"] else 0
+
+    step = time.perf_counter()
+    with database.engine.begin() as sa_conn:
+        if not args.skip_rollups:
+            for statement in rollups.rebuild_statements():
+                sa_conn.execute(statement)
+    with database.engine.connect() as sa_conn:
+        sa_conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("ANALYZE"))
+    timings["rollups_analyze_s"] = round(time.perf_counter() - step, 2)
+    asyncio.run(invalidate_caches())
+    timings["total_s"] = round(time.perf_counter() - started, 2)
+
+    # Выборки для нагрузки: активные пары чаще, как и в реальном трафике
+    hot = sorted(range(len(_pairs)), key=lambda i: _pair_weights[i], reverse=True)[:args.sample]
+    sample_pairs = [_pairs[i] for i in hot]
+    cs_service = {cs_id: service_id for rows in client_services.values() for cs_id, service_id in rows}
+    sample_users = sorted({uid for _, uid in sample_pairs})
+    admins = [row[0] for row in user_rows if row[4] == "client_admin"]
+    manifest = {
+        "params": {k: v for k, v in vars(args).items() if k not in ("manifest", "reset")},
+        "counts": {
+            "tariffs": len(TARIFFS), "services": args.services, "clients": args.clients,
+            "users": len(user_rows), "client_services": len(cs_rows), "user_services": len(us_rows),
+            "usage": inserted,
+        },
+        "timings": timings,
+        "password": args.password,
+        "admin": "bench_admin",
+        "users": [{"id": uid, "username": f"bench_u{uid}", "client_id": user_client[uid - 1]} for uid in sample_users],
+        "client_admins": [
+            {"id": uid, "username": f"bench_u{uid}", "client_id": user_client[uid - 1]} for uid in admins[:args.sample]
+        ],
+        "pairs": [
+            {"client_service_id": cs_id, "user_id": uid, "service_id": cs_service[cs_id]} for cs_id, uid in sample_pairs
+        ],
+        "window": {"from": start.date().isoformat(), "to": end.date().isoformat()},
+    }
+    with open(args.manifest, "w") as f:
+        json.dump(manifest, f, indent=1)
+    print(json.dumps({"counts": manifest["counts"], "timings": timings}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()